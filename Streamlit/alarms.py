@@ -0,0 +1,265 @@
+# Moteur de règles d'alarme sur l'historique (LFRAH & IQBAL)
+# Chaque lot de mesures est évalué en quelques passes NumPy : on en tire des "épisodes"
+# (début, fin, pic) rangés par jour comme les agrégats. Une année d'alarmes se relit donc instantanément.
+# Les épisodes coupés par la fin d'un lot ou par minuit sont recollés au moment de la requête.
+
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from rollups import DAY_NS, local_ns
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+COLUMNS = ["rule", "start", "end", "vmin", "vmax", "n", "open_start", "open_end"]
+
+
+@dataclass(frozen=True)
+class Rule:
+    key: str
+    label: str
+    field: str
+    low: float = None        # alarme si valeur < low
+    high: float = None       # alarme si valeur > high
+    min_seconds: float = 0.0  # durée minimale d'un épisode (appliquée à la requête)
+
+
+def build_rules(settings, gaz_seuil=3000.0, gaz_seconds=10.0):
+    # Seuils T1 / T3 et H1 / H2 lus dans les réglages de la Salle (dernière mesure)
+    def val(k, default):
+        try:
+            return float(settings.get(k, default))
+        except (TypeError, ValueError):
+            return default
+    return (
+        Rule("gaz", "Gaz au-dessus du seuil", "gaz", high=float(gaz_seuil), min_seconds=float(gaz_seconds)),
+        Rule("temperature", "Température hors T1–T3", "temperature_lt", low=val("tempT1", 18.0), high=val("tempT3", 28.0)),
+        Rule("humidite", "Humidité hors H1–H2", "humidite_lt", low=val("humH1", 40.0), high=val("humH2", 70.0)),
+        Rule("alarme", "Alarme ESP32", "alarme", high=0.5),
+    )
+
+
+def runs(ts, v, low=None, high=None, max_gap_ns=60 * 10**9):
+    # Suites de lignes consécutives hors seuil (un trou de données > max_gap coupe la suite)
+    n = len(v)
+    if n == 0:
+        return pd.DataFrame(columns=COLUMNS[1:])
+    bad = np.zeros(n, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if high is not None:
+            bad |= v > high
+        if low is not None:
+            bad |= v < low
+    gap = np.ones(n, dtype=bool)
+    gap[1:] = np.diff(ts) > max_gap_ns
+    prev_bad = np.r_[False, bad[:-1]]
+    starts = np.flatnonzero(bad & (~prev_bad | gap))
+    if len(starts) == 0:
+        return pd.DataFrame(columns=COLUMNS[1:])
+    cont_next = np.r_[bad[1:] & ~gap[1:], False]
+    ends = np.flatnonzero(bad & ~cont_next)
+    masked = np.where(bad, v, np.nan)
+    return pd.DataFrame({
+        "start": ts[starts],
+        "end": ts[ends],
+        "vmin": np.fmin.reduceat(masked, starts),
+        "vmax": np.fmax.reduceat(masked, starts),
+        "n": ends - starts + 1,
+        "open_start": starts == 0,
+        "open_end": ends == n - 1,
+    })
+
+
+def evaluate(ts, df, rules, max_gap_ns=60 * 10**9):
+    # Toutes les règles sur un lot trié par ts
+    parts = []
+    for rule in rules:
+        if rule.field not in df.columns:
+            continue
+        v = pd.to_numeric(df[rule.field], errors="coerce").to_numpy(dtype=np.float64)
+        r = runs(ts, v, rule.low, rule.high, max_gap_ns)
+        if len(r):
+            parts.append(r.assign(rule=rule.key))
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(parts, ignore_index=True)[COLUMNS]
+
+
+def merge(ev, max_gap_ns=60 * 10**9):
+    # Recolle les morceaux d'un même épisode (fin de lot / minuit) : passe vectorisée sur les épisodes
+    if ev.empty:
+        return ev
+    ev = ev.sort_values(["rule", "start"], kind="stable").reset_index(drop=True)
+    same = ev["rule"].to_numpy()[1:] == ev["rule"].to_numpy()[:-1]
+    cont = same & ev["open_end"].to_numpy(dtype=bool)[:-1] & ev["open_start"].to_numpy(dtype=bool)[1:] \
+        & (ev["start"].to_numpy()[1:] - ev["end"].to_numpy()[:-1] <= max_gap_ns)
+    group = np.cumsum(np.r_[True, ~cont])
+    return ev.groupby(group).agg(rule=("rule", "first"), start=("start", "min"), end=("end", "max"),
+                                 vmin=("vmin", "min"), vmax=("vmax", "max"), n=("n", "sum"),
+                                 open_start=("open_start", "first"), open_end=("open_end", "last"))
+
+
+class AlarmEngine:
+    def __init__(self, root=None, tz="Europe/Brussels", gaz_seuil=3000.0, gaz_seconds=10.0, max_gap_s=60):
+        self.root = root
+        self.tz = tz
+        self.gaz_seuil = float(gaz_seuil)
+        self.gaz_seconds = float(gaz_seconds)
+        self.max_gap_ns = int(max_gap_s * 10**9)
+        self.rules = build_rules({}, self.gaz_seuil, self.gaz_seconds)
+        self.days = {}      # "YYYY-MM-DD" -> DataFrame des épisodes commencés ce jour-là
+        self.saved = set()
+        self.last_ts = None
+        self.lock = threading.Lock()
+        if self.root and pa is not None:
+            os.makedirs(self.root, exist_ok=True)
+
+    def update_settings(self, settings):
+        # Réglages de la Salle reçus par le poller : les nouveaux seuils s'appliquent aux mesures suivantes
+        rules = build_rules(settings, self.gaz_seuil, self.gaz_seconds)
+        if rules != self.rules:
+            self.rules = rules
+            return True
+        return False
+
+    def _day_names(self, ts):
+        loc = local_ns(ts, self.tz)
+        return pd.to_datetime(loc // DAY_NS * DAY_NS, unit="ns").strftime("%Y-%m-%d").to_numpy()
+
+    def add(self, ts, df):
+        # Mise à jour incrémentale : seules les lignes plus récentes que le dernier lot sont évaluées
+        ts = np.asarray(ts, dtype=np.int64)
+        if len(ts) == 0:
+            return
+        order = np.argsort(ts, kind="stable")
+        ts, df = ts[order], df.iloc[order]
+        with self.lock:
+            keep = ts > self.last_ts if self.last_ts is not None else np.ones(len(ts), dtype=bool)
+            if not keep.any():
+                return
+            ts, df = ts[keep], df[keep]
+            names = self._day_names(ts)
+            for day in np.unique(names):
+                if day in self.saved:
+                    continue
+                m = names == day
+                ev = evaluate(ts[m], df[m], self.rules, self.max_gap_ns)
+                if len(ev):
+                    cur = self.days.get(day)
+                    self.days[day] = ev if cur is None or cur.empty else pd.concat([cur, ev], ignore_index=True)
+                else:
+                    self.days.setdefault(day, ev)
+            self.last_ts = int(ts[-1])
+            self._save_finished(names.max())
+
+    def replace_day(self, day, ts, df):
+        # Recalcul complet d'un jour (préchauffage, changement de seuils) : idempotent
+        ts = np.asarray(ts, dtype=np.int64)
+        order = np.argsort(ts, kind="stable")
+        ev = evaluate(ts[order], df.iloc[order], self.rules, self.max_gap_ns)
+        with self.lock:
+            self.days[day] = ev
+            self.saved.discard(day)
+            today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+            self._save_finished(today)
+
+    def _save_finished(self, current_day):
+        for day in [d for d in self.days if d < current_day and d not in self.saved]:
+            self._save_day(day)
+            self.saved.add(day)
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day}.arrow")
+
+    def _save_day(self, day):
+        if not self.root or pa is None:
+            return
+        table = pa.Table.from_pandas(self.days[day][COLUMNS].astype({"n": np.int64}), preserve_index=False)
+        tmp = self._path(day) + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self._path(day))
+
+    def load(self):
+        if not self.root or pa is None or not os.path.isdir(self.root):
+            return self
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".arrow"):
+                continue
+            day = name[:-len(".arrow")]
+            with pa.memory_map(self._path(day), "r") as src:
+                self.days[day] = ipc.open_file(src).read_all().to_pandas()
+            self.saved.add(day)
+        return self
+
+    def backfill(self, disk):
+        today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+        for day in disk.days():
+            if day < today and day not in self.saved:
+                self.rebuild_day(disk, day)
+
+    def rebuild_day(self, disk, day):
+        t0 = disk.day_start(day)
+        df = disk.read_range(t0, t0 + DAY_NS)
+        if not df.empty:
+            self.replace_day(day, df["ts"].to_numpy(), df)
+
+    def rebuild_all(self, disk):
+        # Nouveaux seuils appliqués à tout l'historique disque (jour par jour, en arrière-plan)
+        for day in disk.days():
+            self.rebuild_day(disk, day)
+
+    def query(self, start=None, end=None):
+        # start / end en heure locale (naïve) ; épisodes qui chevauchent [start, end)
+        d0 = pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else ""
+        d1 = pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else "9999"
+        with self.lock:
+            # Un jour de marge avant : un épisode commencé la veille peut déborder sur la période
+            keys = sorted(self.days)
+            i = max(np.searchsorted(keys, d0) - 1, 0)
+            parts = [self.days[d] for d in keys[i:] if d <= d1 and not self.days[d].empty]
+            rules = {r.key: r for r in self.rules}
+            last_ts = self.last_ts
+        if not parts:
+            return pd.DataFrame()
+        ev = merge(pd.concat(parts, ignore_index=True), self.max_gap_ns)
+
+        t0 = pd.Timestamp(start).tz_localize(self.tz, ambiguous=False, nonexistent="shift_forward").value \
+            if start is not None else None
+        t1 = pd.Timestamp(end).tz_localize(self.tz, ambiguous=False, nonexistent="shift_forward").value \
+            if end is not None else None
+        keep = np.ones(len(ev), dtype=bool)
+        if t0 is not None:
+            keep &= ev["end"].to_numpy() >= t0
+        if t1 is not None:
+            keep &= ev["start"].to_numpy() < t1
+        ev = ev[keep]
+
+        duree = (ev["end"].to_numpy() - ev["start"].to_numpy()) / 1e9
+        min_s = ev["rule"].map(lambda k: rules[k].min_seconds if k in rules else 0.0).to_numpy(dtype=np.float64)
+        ev = ev[duree >= min_s]
+        duree = duree[duree >= min_s]
+        if ev.empty:
+            return pd.DataFrame()
+
+        high = ev["rule"].map(lambda k: rules[k].high if k in rules else None)
+        depasse_haut = high.notna().to_numpy() & (ev["vmax"].to_numpy() > high.fillna(np.inf).to_numpy())
+        out = pd.DataFrame({
+            "rule": ev["rule"].to_numpy(),
+            "regle": ev["rule"].map(lambda k: rules[k].label if k in rules else k).to_numpy(),
+            "debut": pd.to_datetime(ev["start"].to_numpy(), unit="ns", utc=True).tz_convert(self.tz),
+            "fin": pd.to_datetime(ev["end"].to_numpy(), unit="ns", utc=True).tz_convert(self.tz),
+            "duree_s": duree,
+            "pic": np.where(depasse_haut, ev["vmax"].to_numpy(), ev["vmin"].to_numpy()),
+            "en_cours": ev["open_end"].to_numpy(dtype=bool) & (ev["end"].to_numpy() == last_ts),
+        })
+        return out.sort_values("debut", ascending=False, kind="stable").reset_index(drop=True)
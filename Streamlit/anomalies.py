@@ -0,0 +1,288 @@
+# Détection d'anomalies capteurs au fil de l'eau (LFRAH & IQBAL)
+# Par champ, moyenne / variance glissantes (Welford à pondération exponentielle) : une mesure trop loin
+# de la moyenne est un pic ou un saut. On repère aussi les capteurs figés (même valeur trop longtemps),
+# les valeurs hors de la plage du capteur et les trous dans la suite des dates.
+# Coût constant par mesure (quelques opérations sur l'état du champ) : le poller de chaque salle
+# suit le rythme d'échantillonnage sans relire l'historique. Épisodes rangés par jour comme les alarmes.
+
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rollups import DAY_NS, local_ns
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+# Champ -> (plage plausible du capteur, écart type minimal, durée avant "capteur figé" en secondes)
+# Le DHT ne change parfois pas au dixième pendant un moment ; le MQ-2 bruite toujours un peu
+FIELDS = {
+    "temperature_lt": ((-40.0, 80.0), 0.1, 1800),
+    "humidite_lt": ((0.0, 100.0), 0.5, 1800),
+    "gaz": ((1.0, 4094.0), 10.0, 300),
+}
+KINDS = {"pic": "Pic / saut", "fige": "Capteur figé", "plage": "Hors plage capteur", "trou": "Trou de mesures"}
+WINDOW = 300        # mesures : mémoire de la moyenne / variance glissantes
+WARMUP = 30         # mesures avant de juger
+Z = 6.0             # écart (en écarts types) à partir duquel une mesure est un pic
+COLUMNS = ["kind", "field", "start", "end", "value", "score", "n"]
+
+
+class FieldState:
+    __slots__ = ("mean", "var", "n", "flat_value", "flat_start", "flat_end", "flat_n", "open")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+        self.flat_value = None
+        self.flat_start = self.flat_end = None
+        self.flat_n = 0
+        self.open = {}      # type -> épisode en cours (pic, plage) : les mesures consécutives sont regroupées
+
+    def opened(self, field):
+        # Épisodes pas encore terminés (affichés "en cours", enregistrés à leur fin)
+        rows = [list(ev) for ev in self.open.values()]
+        if self.flat_value is not None and self.flat_end - self.flat_start >= FIELDS[field][2] * 10**9:
+            rows.append(["fige", field, self.flat_start, self.flat_end, self.flat_value, 0.0, self.flat_n])
+        return rows
+
+
+def _event(st, kind, field, t, value, score):
+    # Prolonge l'épisode du même type s'il est encore ouvert, sinon en commence un
+    ev = st.open.get(kind)
+    if ev is None:
+        st.open[kind] = [kind, field, t, t, value, score, 1]
+    else:
+        ev[3] = t
+        ev[6] += 1
+        if abs(score) > abs(ev[5]):
+            ev[4], ev[5] = value, score
+
+
+def _close(out, st, kind):
+    ev = st.open.pop(kind, None)
+    if ev is not None:
+        out.append(ev)
+
+
+def scan(field, ts, values, st, alpha=2.0 / (WINDOW + 1)):
+    # Une passe sur les nouvelles mesures d'un champ ; st est modifié en place (O(1) par mesure)
+    (lo, hi), sd_min, flat_s = FIELDS[field]
+    flat_ns = flat_s * 10**9
+    out = []
+    for t, x in zip(ts.tolist(), values.tolist()):
+        if x != x:
+            continue
+        if x < lo or x > hi:
+            # Valeur impossible (capteur débranché, saturé) : ne nourrit pas les statistiques
+            _event(st, "plage", field, t, x, 0.0)
+            continue
+        _close(out, st, "plage")
+
+        # Capteur figé : même valeur depuis plus de flat_s
+        if x == st.flat_value:
+            st.flat_end = t
+            st.flat_n += 1
+        else:
+            if st.flat_value is not None and st.flat_end - st.flat_start >= flat_ns:
+                out.append(["fige", field, st.flat_start, st.flat_end, st.flat_value, 0.0, st.flat_n])
+            st.flat_value, st.flat_start, st.flat_end, st.flat_n = x, t, t, 1
+
+        # Welford exponentiel ; au-delà de Z écarts types la mesure est un pic, prise en compte bornée
+        # pour ne pas gonfler la variance (un vrai saut de niveau finit par être absorbé)
+        diff = x - st.mean
+        if st.n >= WARMUP:
+            sd = max(math.sqrt(st.var), sd_min)
+            z = diff / sd
+            if abs(z) > Z:
+                _event(st, "pic", field, t, x, z)
+                diff = math.copysign(Z * sd, diff)
+            else:
+                _close(out, st, "pic")
+        elif st.n == 0:
+            st.mean, diff = x, 0.0
+        incr = alpha * diff
+        st.mean += incr
+        st.var = (1 - alpha) * (st.var + diff * incr)
+        st.n += 1
+    return out
+
+
+def gaps(ts, prev_ts=None, max_gap_ns=60 * 10**9):
+    # Trous dans la suite des dates (vectorisé : une soustraction par mesure)
+    if prev_ts is not None:
+        ts = np.r_[prev_ts, ts]
+    if len(ts) < 2:
+        return []
+    d = np.diff(ts)
+    idx = np.flatnonzero(d > max_gap_ns)
+    return [["trou", "date", int(ts[i]), int(ts[i + 1]), np.nan, 0.0, 0] for i in idx]
+
+
+class AnomalyDetector:
+    def __init__(self, root=None, tz="Europe/Brussels", max_gap_s=60, fields=FIELDS):
+        self.root = root
+        self.tz = tz
+        self.max_gap_ns = int(max_gap_s * 10**9)
+        self.fields = list(fields)
+        self.states = {f: FieldState() for f in self.fields}
+        self.days = {}      # "YYYY-MM-DD" -> DataFrame des épisodes commencés ce jour-là
+        self.saved = set()
+        self.last_ts = None
+        self.lock = threading.Lock()
+        if self.root and pa is not None:
+            os.makedirs(self.root, exist_ok=True)
+
+    def _detect(self, ts, df, states, prev_ts):
+        rows = gaps(ts, prev_ts, self.max_gap_ns)
+        for f in self.fields:
+            if f in df.columns:
+                v = pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+                rows += scan(f, ts, v, states[f])
+        return rows
+
+    def _by_day(self, rows):
+        ev = pd.DataFrame(rows, columns=COLUMNS)
+        loc = local_ns(ev["start"].to_numpy(dtype=np.int64), self.tz)
+        names = pd.to_datetime(loc // DAY_NS * DAY_NS, unit="ns").strftime("%Y-%m-%d").to_numpy()
+        return {day: ev[names == day].reset_index(drop=True) for day in np.unique(names)}
+
+    def add(self, ts, df):
+        # Mise à jour incrémentale : seules les lignes plus récentes que le dernier lot sont examinées
+        ts = np.asarray(ts, dtype=np.int64)
+        if len(ts) == 0:
+            return
+        order = np.argsort(ts, kind="stable")
+        ts, df = ts[order], df.iloc[order]
+        with self.lock:
+            keep = ts > self.last_ts if self.last_ts is not None else np.ones(len(ts), dtype=bool)
+            if not keep.any():
+                return
+            ts, df = ts[keep], df[keep]
+            # Seuls les épisodes terminés sont rangés ; ceux en cours restent dans l'état des champs
+            rows = self._detect(ts, df, self.states, self.last_ts)
+            nouveaux = self._by_day(rows) if rows else {}
+            # Jours couverts par le lot, même sans anomalie : un jour vide est aussi un résultat à garder
+            jours = pd.to_datetime(np.unique(local_ns(ts, self.tz) // DAY_NS) * DAY_NS, unit="ns").strftime("%Y-%m-%d")
+            for day in jours:
+                if day in self.saved:
+                    continue
+                ev, cur = nouveaux.get(day), self.days.get(day)
+                if ev is None:
+                    self.days.setdefault(day, pd.DataFrame(columns=COLUMNS))
+                else:
+                    self.days[day] = ev if cur is None or cur.empty else pd.concat([cur, ev], ignore_index=True)
+            self.last_ts = int(ts[-1])
+            self._save_finished(jours[-1])
+
+    def replace_day(self, day, ts, df):
+        # Recalcul complet d'un jour (préchauffage) : statistiques repartant de zéro, idempotent
+        ts = np.asarray(ts, dtype=np.int64)
+        if len(ts) == 0:
+            return
+        order = np.argsort(ts, kind="stable")
+        states = {f: FieldState() for f in self.fields}
+        rows = self._detect(ts[order], df.iloc[order], states, None)
+        # Fin du jour : les épisodes encore ouverts s'arrêtent à minuit
+        rows += [r for f, st in states.items() for r in st.opened(f)]
+        ev = self._by_day(rows).get(day) if rows else None
+        with self.lock:
+            self.days[day] = ev if ev is not None else pd.DataFrame(columns=COLUMNS)
+            self.saved.discard(day)
+            today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+            self._save_finished(today)
+
+    def _save_finished(self, current_day):
+        for day in [d for d in self.days if d < current_day and d not in self.saved]:
+            self._save_day(day)
+            self.saved.add(day)
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day}.arrow")
+
+    def _save_day(self, day):
+        if not self.root or pa is None:
+            return
+        ev = self.days[day][COLUMNS].astype({"start": np.int64, "end": np.int64, "value": np.float64,
+                                              "score": np.float64, "n": np.int64})
+        table = pa.Table.from_pandas(ev, preserve_index=False)
+        tmp = self._path(day) + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self._path(day))
+
+    def load(self):
+        if not self.root or pa is None or not os.path.isdir(self.root):
+            return self
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".arrow"):
+                continue
+            day = name[:-len(".arrow")]
+            with pa.memory_map(self._path(day), "r") as src:
+                self.days[day] = ipc.open_file(src).read_all().to_pandas()
+            self.saved.add(day)
+        return self
+
+    def backfill(self, disk):
+        today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+        for day in disk.days():
+            if day < today and day not in self.saved:
+                self.rebuild_day(disk, day)
+
+    def rebuild_day(self, disk, day):
+        t0 = disk.day_start(day)
+        df = disk.read_range(t0, t0 + DAY_NS)
+        if not df.empty:
+            self.replace_day(day, df["ts"].to_numpy(), df)
+
+    def query(self, start=None, end=None):
+        # start / end en heure locale (naïve) ; épisodes qui chevauchent [start, end), plus récent en premier
+        d0 = pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else ""
+        d1 = pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else "9999"
+        with self.lock:
+            keys = sorted(self.days)
+            i = max(np.searchsorted(keys, d0) - 1, 0)
+            parts = [self.days[d] for d in keys[i:] if d <= d1 and not self.days[d].empty]
+            # Épisodes en cours (pic pas terminé, capteur figé en ce moment) ajoutés à la volée
+            ouverts = [r for f, st in self.states.items() for r in st.opened(f)]
+            if ouverts:
+                parts.append(pd.DataFrame(ouverts, columns=COLUMNS))
+            last_ts = self.last_ts
+        if not parts:
+            return pd.DataFrame()
+        ev = pd.concat(parts, ignore_index=True)
+
+        keep = np.ones(len(ev), dtype=bool)
+        if start is not None:
+            keep &= ev["end"].to_numpy(dtype=np.int64) >= pd.Timestamp(start).tz_localize(
+                self.tz, ambiguous=False, nonexistent="shift_forward").value
+        if end is not None:
+            keep &= ev["start"].to_numpy(dtype=np.int64) < pd.Timestamp(end).tz_localize(
+                self.tz, ambiguous=False, nonexistent="shift_forward").value
+        ev = ev[keep]
+        if ev.empty:
+            return pd.DataFrame()
+        debut = ev["start"].to_numpy(dtype=np.int64)
+        fin = ev["end"].to_numpy(dtype=np.int64)
+        out = pd.DataFrame({
+            "kind": ev["kind"].to_numpy(),
+            "type": ev["kind"].map(KINDS).to_numpy(),
+            "field": ev["field"].to_numpy(),
+            "debut": pd.to_datetime(debut, unit="ns", utc=True).tz_convert(self.tz),
+            "fin": pd.to_datetime(fin, unit="ns", utc=True).tz_convert(self.tz),
+            "duree_s": (fin - debut) / 1e9,
+            "valeur": ev["value"].to_numpy(dtype=np.float64),
+            "score": ev["score"].to_numpy(dtype=np.float64),
+            "mesures": ev["n"].to_numpy(dtype=np.int64),
+            "en_cours": fin == last_ts,
+        })
+        return out.sort_values("debut", ascending=False, kind="stable").reset_index(drop=True)
@@ -1,179 +1,38 @@
 # Code app.py pour géré streamlit LFRAH & IQBAL
 
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import requests
-from streamlit_autorefresh import st_autorefresh
+
+from audit import AuditLog
+from commands import APPLIQUEE, ENVOYEE, CommandQueue
+from devices import fetch_fleet, load_devices
+from metrics import METRICS
+from mqtt_live import MqttLive
+from poller import Poller, make_session
+from push import SseClient, version_moved
+
+# Durée totale du script (page Diagnostics)
+debut_run = time.perf_counter()
 
 # On configure la page (titre + layout large)
 st.set_page_config(page_title="HVAC - Salle Technique", layout="wide")
 
-# On met toute la DA en CSS (couleurs, cards, boutons, selectbox, etc.)
-st.markdown("""
-<style>
-:root{
-  --bg:#0b1220;
-  --panel:#0f1b33;
-  --card:#15253e;
-  --line:#22324c;
-  --text:#e8eefc;
-  --muted:#b7c6e6;
-  --accent:#60a5fa;
-  --danger:#ef4444;
-}
-
-html, body, [data-testid="stAppViewContainer"]{
-  background: var(--bg);
-  color: var(--text);
-}
-
-[data-testid="stSidebar"]{
-  background: #081327;
-  border-right: 1px solid var(--line);
-}
-[data-testid="stSidebar"] *{
-  color: var(--text) !important;
-}
-
-.header{
-  background: linear-gradient(135deg, #0f1b33, #0b1220);
-  border: 1px solid var(--line);
-  padding: 18px;
-  border-radius: 16px;
-  margin-bottom: 14px;
-  text-align: center;
-}
-.header h1{
-  margin: 0;
-  font-size: 26px;
-  font-weight: 800;
-  color: var(--text);
-}
-
-.note{
-  color: var(--muted);
-  font-size: 13px;
-  margin-top: -4px;
-  margin-bottom: 12px;
-}
-
-.section-title{
-  color: var(--text);
-  font-size: 18px;
-  font-weight: 800;
-  margin: 12px 0 8px 0;
-}
-
-.kpi-card{
-  background: rgba(21,37,62,0.92);
-  border: 1px solid var(--line);
-  border-radius: 16px;
-  padding: 16px;
-  min-height: 120px;
-  display:flex;
-  flex-direction:column;
-  justify-content:center;
-  align-items:center;
-  text-align:center;
-}
-.kpi-title{
-  color: var(--muted);
-  font-size: 13px;
-  font-weight: 600;
-  margin: 0 0 8px 0;
-}
-.kpi-value{
-  color: var(--text);
-  font-size: 34px;
-  font-weight: 900;
-  margin: 0;
-}
-
-[data-baseweb="select"] > div{
-  background: rgba(21,37,62,0.85) !important;
-  border: 1px solid var(--line) !important;
-  border-radius: 12px !important;
-}
-[data-baseweb="select"] span,
-[data-baseweb="select"] input{
-  color: rgba(232,238,252,0.95) !important;
-}
-[data-baseweb="select"] svg{
-  fill: rgba(232,238,252,0.95) !important;
-}
-[data-baseweb="select"] *::selection{
-  background: rgba(96,165,250,0.25) !important;
-  color: rgba(232,238,252,0.95) !important;
-}
-[data-baseweb="select"] > div:focus-within{
-  border: 1px solid rgba(96,165,250,0.65) !important;
-  box-shadow: 0 0 0 2px rgba(96,165,250,0.15) !important;
-}
-
-/* Fix: texte du menu déroulant (options) en blanc */
-[data-baseweb="select"] *{
-  color: rgba(232,238,252,0.95) !important;
-}
-[data-baseweb="menu"] *{
-  color: rgba(232,238,252,0.95) !important;
-}
-[data-baseweb="menu"] div[role="option"]:hover{
-  background-color: rgba(96,165,250,0.25) !important;
-}
-[data-baseweb="menu"] div[aria-selected="true"]{
-  background-color: rgba(96,165,250,0.35) !important;
-  color: white !important;
-}
-
-label, [data-testid="stWidgetLabel"]{
-  color: rgba(232,238,252,0.95) !important;
-}
-
-[data-testid="stButton"] button{
-  border-radius: 12px;
-  border: 1px solid var(--line) !important;
-  background: rgba(21,37,62,0.9) !important;
-  color: var(--text) !important;
-  font-weight: 700 !important;
-  height: 46px;
-}
-[data-testid="stButton"] button:hover{
-  background: rgba(96,165,250,0.25) !important;
-  border: 1px solid rgba(96,165,250,0.65) !important;
-}
-
-.payload{
-  background: rgba(7,18,34,0.9);
-  border: 1px solid var(--line);
-  border-radius: 12px;
-  padding: 12px 14px;
-  color: rgba(232,238,252,0.95);
-  font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
-  font-size: 14px;
-  white-space: pre;
-  overflow-x: auto;
-}
-
-[data-testid="stDataFrame"]{
-  background: rgba(21,37,62,0.55);
-  border: 1px solid var(--line);
-  border-radius: 14px;
-  padding: 8px;
-}
-
-.js-plotly-plot .plotly, .js-plotly-plot .plotly div{
-  background: rgba(0,0,0,0) !important;
-}
-
-hr{
-  border: none;
-  border-top: 1px solid rgba(34,50,76,0.7);
-  margin: 14px 0;
-}
-</style>
-""", unsafe_allow_html=True)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# On met toute la DA en CSS (couleurs, cards, boutons, selectbox, etc.) : fichier static/style.css
+@st.cache_resource
+def load_css():
+    # Lu une seule fois par process ; st.html le met dans le conteneur d'évènements (pas d'espace vide)
+    with open(os.path.join(APP_DIR, "static", "style.css"), encoding="utf-8") as f:
+        return f"<style>{f.read()}</style>"
+
+st.html(load_css())
 
 st.markdown("<div class='header'><h1>Supervision HVAC – Salle Technique</h1></div>", unsafe_allow_html=True)
 
@@ -195,10 +54,12 @@ def safe_float(x, default=None):
         return default
 
 def fmt_date(dt_value):
+    # Sans pandas : les pages de commande n'ont pas besoin de le charger
     if dt_value is None:
         return "—"
-    ts = pd.to_datetime(dt_value, errors="coerce")
-    if pd.isna(ts):
+    try:
+        ts = datetime.fromisoformat(str(dt_value).strip().replace("Z", "+00:00"))
+    except ValueError:
         return str(dt_value)
     return ts.strftime("%d/%m/%Y %H:%M:%S")
 
@@ -247,167 +108,945 @@ def style_plot(fig, x_title: str, y_title: str, y_range=None):
     )
     fig.update_traces(line_width=2)
 
+def rerun_fragment(key):
+    # st.rerun(scope=clé) n'est permis que depuis un callback de widget : on dépose la même demande
+    # (relance du seul fragment @st.fragment(key=...)) depuis le corps d'un autre fragment.
+    # Si ces internes de Streamlit changent, on retombe sur une relance de la page
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+        ctx = get_script_run_ctx()
+        demande = RerunData(query_string=ctx.query_string, page_script_hash=ctx.page_script_hash,
+                            fragment_id_queue=ctx.fragment_storage.resolve_target(key),
+                            is_fragment_scoped_rerun=True, cached_message_hashes=ctx.cached_message_hashes,
+                            context_info=ctx.context_info)
+    except (ImportError, AttributeError, TypeError):
+        st.rerun()
+    ctx.script_requests.request_rerun(demande)
+    st.empty()  # point d'interruption : Streamlit prend la demande ici et arrête le veilleur
+
+def data_signature(x, *ys):
+    # Empreinte bon marché des données d'un graphe (quelques milliers de points après réduction)
+    x = np.asarray(x)
+    if len(x) == 0:
+        return (0,)
+    return (len(x), x[0], x[-1]) + tuple(hash(np.ascontiguousarray(y, dtype=np.float64).tobytes()) for y in ys)
+
+def cached_chart(key, signature, build, patch):
+    # On garde par session la figure déjà stylée : si les données changent on remplace juste
+    # les tableaux des traces, sinon on renvoie la même figure sans la reconstruire
+    figures = st.session_state.setdefault("figures", {})
+    entry = figures.get(key)
+    with METRICS.timer("chart_seconds", chart=key, step="figure"):
+        if entry is None:
+            figures[key] = [build(), signature]
+        elif entry[1] != signature:
+            with entry[0].batch_update():
+                patch(entry[0])
+            entry[1] = signature
+    with METRICS.timer("chart_seconds", chart=key, step="render"):
+        st.plotly_chart(figures[key][0], use_container_width=True, key=key)
+
+def anomaly_marks(ev, field, y_bas):
+    # Pics / hors plage en points ; capteur figé (à sa valeur) et trous (en bas du graphe) en segments
+    if ev is None or ev.empty:
+        return [], [], [], []
+    champ = ev["field"].to_numpy() == field
+    kind = ev["kind"].to_numpy()
+    pts = ev[champ & np.isin(kind, ["pic", "plage"])]
+    seg = ev[(champ & (kind == "fige")) | (kind == "trou")]
+    sx, sy = [], []
+    for debut, fin, k, v in zip(seg["debut"], seg["fin"], seg["kind"], seg["valeur"]):
+        y = y_bas if k == "trou" else v
+        sx += [debut, fin, None]
+        sy += [y, y, None]
+    return list(pts["debut"]), pts["valeur"].tolist(), sx, sy
+
+def anomaly_traces(marks):
+    px, py, sx, sy = marks
+    return [
+        go.Scatter(x=px, y=py, name="anomalie", mode="markers",
+                   marker=dict(symbol="x", size=9, color="rgba(239,68,68,0.95)")),
+        go.Scatter(x=sx, y=sy, name="figé / trou", mode="lines", line=dict(color="rgba(239,68,68,0.75)")),
+    ]
+
+def patch_anomalies(fig, marks, first):
+    px, py, sx, sy = marks
+    fig.data[first].x, fig.data[first].y = px, py
+    fig.data[first + 1].x, fig.data[first + 1].y = sx, sy
+
+def command_marks(cmds, y_haut):
+    # Commandes du journal : un triangle en haut du graphe à l'heure du clic, payload au survol
+    if cmds is None or cmds.empty:
+        return [], [], []
+    return list(cmds["heure"]), [y_haut] * len(cmds), list(cmds["resume"])
+
+def command_trace(marks):
+    x, y, text = marks
+    return go.Scatter(x=x, y=y, name="commande", mode="markers", text=text, hoverinfo="x+text",
+                      marker=dict(symbol="triangle-down", size=10, color="rgba(167,139,250,0.95)"))
+
+def patch_commands(fig, marks, i):
+    fig.data[i].x, fig.data[i].y, fig.data[i].text = marks
+
+def line_chart(df, y, title, y_title, y_range=None, width_px=1200, ev=None, cmds=None):
+    # On réduit les points avant de tracer (la largeur sert à choisir la taille des seaux)
+    with METRICS.timer("stage_seconds", stage="downsample"):
+        d = downsample(df, "date_local", y, mode=echantillonnage, width_px=width_px)
+    x = d["date_local"].to_numpy()
+    yv = pd.to_numeric(d[y], errors="coerce").to_numpy(dtype=np.float64)
+    marks = anomaly_marks(ev, y, y_range[0] if y_range else np.nanmin(yv, initial=0))
+    cmarks = command_marks(cmds, y_range[1] if y_range else np.nanmax(yv, initial=0))
+
+    def build():
+        fig = go.Figure([go.Scatter(x=x, y=yv, mode="lines")] + anomaly_traces(marks) + [command_trace(cmarks)])
+        fig.update_layout(title=title)
+        style_plot(fig, "Date / heure", y_title, y_range=y_range)
+        fig.update_traces(line_width=4, selector=dict(name="figé / trou"))
+        return fig
+
+    def patch(fig):
+        fig.data[0].x = x
+        fig.data[0].y = yv
+        patch_anomalies(fig, marks, 1)
+        patch_commands(fig, cmarks, 3)
+
+    cached_chart(f"line:{title}", data_signature(x, yv) + (hash(str(marks)), hash(str(cmarks))), build, patch)
+
+def rollup_chart(r, field, title, y_title, y_range=None, ev=None, cmds=None):
+    # Agrégats : bande min / max + moyenne par intervalle
+    x = r["date_local"].to_numpy()
+    ys = [r[f"{field}_{k}"].to_numpy(dtype=np.float64) for k in ("min", "max", "mean")]
+    marks = anomaly_marks(ev, field, y_range[0] if y_range else np.nanmin(ys[0], initial=0))
+    cmarks = command_marks(cmds, y_range[1] if y_range else np.nanmax(ys[1], initial=0))
+
+    def build():
+        fig = go.Figure([
+            go.Scatter(x=x, y=ys[0], name="min", mode="lines"),
+            go.Scatter(x=x, y=ys[1], name="max", mode="lines",
+                       fill="tonexty", fillcolor="rgba(96,165,250,0.20)"),
+            go.Scatter(x=x, y=ys[2], name="moyenne", mode="lines",
+                       line=dict(color="rgba(96,165,250,0.95)")),
+        ] + anomaly_traces(marks) + [command_trace(cmarks)])
+        fig.update_layout(title=title)
+        style_plot(fig, "Date / heure", y_title, y_range=y_range)
+        fig.update_traces(line_width=0, selector=dict(name="min"))
+        fig.update_traces(line_width=0, selector=dict(name="max"))
+        fig.update_traces(line_width=4, selector=dict(name="figé / trou"))
+        return fig
+
+    def patch(fig):
+        for trace, yv in zip(fig.data, ys):
+            trace.x = x
+            trace.y = yv
+        patch_anomalies(fig, marks, 3)
+        patch_commands(fig, cmarks, 5)
+
+    cached_chart(f"rollup:{title}", data_signature(x, *ys) + (hash(str(marks)), hash(str(cmarks))), build, patch)
+
+def forecast_chart(r, fc, field, title, y_title, y_range=None, seuils=()):
+    # Dernières 24 h (moyennes 15 min) puis prévision avec sa bande 10–90 %
+    x_obs = r["date_local"].to_numpy() if f"{field}_mean" in r.columns else np.array([], dtype="datetime64[ns]")
+    y_obs = r[f"{field}_mean"].to_numpy(dtype=np.float64) if f"{field}_mean" in r.columns else np.array([])
+    x = fc["date_local"].to_numpy()
+    ys = [fc[f"{field}_{k}"].to_numpy(dtype=np.float64) for k in ("lo", "hi")] + [fc[field].to_numpy(dtype=np.float64)]
+
+    def build():
+        fig = go.Figure([
+            go.Scatter(x=x_obs, y=y_obs, name="mesuré", mode="lines", line=dict(color="rgba(96,165,250,0.95)")),
+            go.Scatter(x=x, y=ys[0], name="bas", mode="lines"),
+            go.Scatter(x=x, y=ys[1], name="haut", mode="lines",
+                       fill="tonexty", fillcolor="rgba(245,158,11,0.20)"),
+            go.Scatter(x=x, y=ys[2], name="prévision", mode="lines",
+                       line=dict(color="rgba(245,158,11,0.95)", dash="dash")),
+        ])
+        fig.update_layout(title=title)
+        style_plot(fig, "Date / heure", y_title, y_range=y_range)
+        fig.update_traces(line_width=0, selector=dict(name="bas"))
+        fig.update_traces(line_width=0, selector=dict(name="haut"))
+        for seuil in seuils:
+            fig.add_hline(y=seuil, line_dash="dot", line_color="rgba(239,68,68,0.9)")
+        return fig
+
+    def patch(fig):
+        fig.data[0].x, fig.data[0].y = x_obs, y_obs
+        for trace, yv in zip(fig.data[1:], ys):
+            trace.x = x
+            trace.y = yv
+
+    # Les seuils font partie de la clé : un réglage changé redessine les lignes
+    cached_chart(f"forecast:{title}:{seuils}", data_signature(x, y_obs, *ys), build, patch)
+
+def motor_charts(m, par):
+    # Heures par plage de vitesse (barres empilées) et énergie estimée, par jour ou par semaine
+    x = m["periode"].to_numpy()
+    plages = [m[f"{nom}_h"].to_numpy(dtype=np.float64) for nom, _, _ in BANDS]
+    energie = m["energie_kwh"].to_numpy(dtype=np.float64)
+    couleurs = ["rgba(148,163,184,0.55)", "rgba(34,197,94,0.80)", "rgba(96,165,250,0.85)", "rgba(245,158,11,0.85)"]
+
+    def build_plages():
+        # Style d'abord : style_plot règle l'épaisseur des lignes, que les barres n'ont pas
+        fig = go.Figure()
+        style_plot(fig, "Période", "Heures")
+        fig.add_traces([go.Bar(x=x, y=y, name=nom, marker_color=c)
+                        for (nom, _, _), y, c in zip(BANDS, plages, couleurs)])
+        fig.update_layout(title=f"Temps par plage de vitesse ({par})", barmode="stack", showlegend=True)
+        return fig
+
+    def patch_plages(fig):
+        for trace, y in zip(fig.data, plages):
+            trace.x = x
+            trace.y = y
+
+    def build_energie():
+        fig = go.Figure()
+        style_plot(fig, "Période", "kWh")
+        fig.add_trace(go.Bar(x=x, y=energie, marker_color="rgba(245,158,11,0.85)"))
+        fig.update_layout(title=f"Énergie estimée ({par})")
+        return fig
+
+    def patch_energie(fig):
+        fig.data[0].x = x
+        fig.data[0].y = energie
+
+    cached_chart(f"moteur:plages:{par}", data_signature(x, *plages), build_plages, patch_plages)
+    cached_chart(f"moteur:energie:{par}", data_signature(x, energie), build_energie, patch_energie)
+
+def compare_chart(b, lignes, title, y_title, y_range=None, seuils=(), semaine=False):
+    # Bande p10–p90 et médiane des périodes passées, puis une ligne par période mise en avant
+    xb = axis(b["creneau"]).to_numpy()
+    ys = [b[k].to_numpy(dtype=np.float64) for k in ("p10", "p90", "p50")]
+    xl = [axis(x).to_numpy() for _, x, _ in lignes]
+    couleurs = ["rgba(245,158,11,0.95)", "rgba(96,165,250,0.95)", "rgba(34,197,94,0.85)"]
+
+    def build():
+        fig = go.Figure([
+            go.Scatter(x=xb, y=ys[0], name="p10", mode="lines"),
+            go.Scatter(x=xb, y=ys[1], name="p90", mode="lines",
+                       fill="tonexty", fillcolor="rgba(148,163,184,0.25)"),
+            go.Scatter(x=xb, y=ys[2], name="médiane", mode="lines",
+                       line=dict(color="rgba(148,163,184,0.95)", dash="dash")),
+        ] + [go.Scatter(x=x, y=y, name=nom, mode="lines", line=dict(color=c))
+             for (nom, _, y), x, c in zip(lignes, xl, couleurs)])
+        fig.update_layout(title=title)
+        style_plot(fig, "Jour / heure" if semaine else "Heure", y_title, y_range=y_range)
+        fig.update_traces(line_width=0, selector=dict(name="p10"))
+        fig.update_traces(line_width=0, selector=dict(name="p90"))
+        fig.update_layout(showlegend=True, xaxis_tickformat="%a %H:%M" if semaine else "%H:%M")
+        for seuil in seuils:
+            fig.add_hline(y=seuil, line_dash="dot", line_color="rgba(239,68,68,0.9)")
+        return fig
+
+    def patch(fig):
+        for trace, yv in zip(fig.data, ys):
+            trace.x = xb
+            trace.y = yv
+        for trace, (_, _, y), x in zip(fig.data[3:], lignes, xl):
+            trace.x = x
+            trace.y = y
+
+    noms = tuple(nom for nom, _, _ in lignes)
+    cached_chart(f"compare:{title}:{semaine}:{noms}:{seuils}",
+                 data_signature(xb, *ys) + tuple(data_signature(x, y) for (_, _, y), x in zip(lignes, xl)),
+                 build, patch)
+
+def command_log(debut, fin):
+    # Journal SQLite (index salle + heure) -> DataFrame, plus récentes en premier
+    bornes = [pd.Timestamp(t).tz_localize("Europe/Brussels", ambiguous=False, nonexistent="shift_forward").value // 10**6
+              for t in (debut, fin)]
+    cmds = pd.DataFrame(get_audit().query(*bornes, device=DEVICE.key))
+    if cmds.empty:
+        return cmds
+    cmds["heure"] = pd.to_datetime(cmds["ts"], unit="ms", utc=True).dt.tz_convert("Europe/Brussels")
+    cmds["commande"] = [", ".join(f"{k}={v}" for k, v in p.items()) for p in cmds["payload"]]
+    cmds["resume"] = cmds["target"] + " : " + cmds["commande"] + " (" + cmds["status"] + ")"
+    return cmds
+
+def page_positions(df, ascending, modes=None, alarme_seule=False):
+    # Filtres en masque booléen (pas de copie du tableau), puis ordre par simple inversion :
+    # les lignes arrivent déjà triées par date depuis le buffer, le disque ou l'API
+    mask = np.ones(len(df), dtype=bool)
+    if modes and "mode" in df.columns:
+        mask &= df["mode"].astype("string").str.lower().isin([m.lower() for m in modes]).to_numpy(dtype=bool, na_value=False)
+    if alarme_seule and "alarme" in df.columns:
+        mask &= pd.to_numeric(df["alarme"], errors="coerce").to_numpy() == 1
+    pos = np.flatnonzero(mask)
+    return pos if ascending else pos[::-1]
+
+def history_table(df, ascending):
+    f1, f2, f3, f4 = st.columns([2, 1, 1, 1])
+    with f1:
+        modes_dispo = sorted({str(m) for m in df["mode"].dropna().unique()}) if "mode" in df.columns else []
+        modes = st.multiselect("Filtrer par mode", modes_dispo, format_func=str.upper)
+    with f2:
+        alarme_seule = st.checkbox("Alarme active seulement", value=False)
+    with f3:
+        taille = st.selectbox("Lignes par page", [50, 100, 250, 500], index=1)
+
+    pos = page_positions(df, ascending, modes, alarme_seule)
+    nb_pages = max(1, -(-len(pos) // taille))
+    with f4:
+        num_page = st.number_input("Page", 1, nb_pages, 1, 1)
+
+    # On ne met en forme que la page visible
+    with METRICS.timer("table_seconds", table="historique"):
+        page_df = df.iloc[pos[(num_page - 1) * taille:num_page * taille]]
+        cols = ["id", "date_local", "mode", "temperature_lt", "humidite_lt", "gaz", "motor_speed", "alarme"]
+        page_df = page_df[[c for c in cols if c in page_df.columns]]
+        formats = {}
+        if "mode" in page_df.columns:
+            formats["mode"] = page_df["mode"].astype("string").str.upper()
+        if "date_local" in page_df.columns:
+            formats["date_local"] = page_df["date_local"].dt.strftime("%d/%m/%Y %H:%M:%S")
+        st.dataframe(page_df.assign(**formats), use_container_width=True, hide_index=True)
+    st.markdown(f"<div class='note'>Page {num_page} / {nb_pages} – {len(pos)} lignes</div>", unsafe_allow_html=True)
+
+def export_section(debut, fin):
+    # Export de la période en morceaux de quelques heures (disque si possible, sinon API)
+    with st.expander("Exporter la période (CSV / Parquet)"):
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, format_func=str.upper)
+        if st.button("Préparer l'export", use_container_width=True):
+            path = new_export_path(EXPORT_DIR, debut, fin - pd.Timedelta(days=1), fmt)
+            total = int(np.ceil((fin - debut) / pd.Timedelta(hours=CHUNK_HOURS)))
+            barre = st.progress(0.0, text="Export en cours…")
+            chunks = iter_chunks(
+                debut, fin,
+                read_disk=lambda w0, w1: disk_window(w0, w1, fields=HISTORY_FIELDS),
+                fetch_api=lambda w0, w1: device_range(DEVICE, w0, w1, HISTORY_FIELDS, session=get_poller().session)
+            )
+            try:
+                rows = export_file(
+                    chunks, path, fmt, total=total,
+                    progress=lambda frac, n: barre.progress(min(frac, 1.0), text=f"Export en cours… {n} lignes")
+                )
+            except Exception as e:
+                st.error(f"Erreur export : {e}")
+            else:
+                barre.progress(1.0, text=f"Export terminé : {rows} lignes")
+                st.session_state["export_path"] = path
+
+        # Fichier lu seulement au clic (callable) : la page ne le charge pas en mémoire à chaque rerun
+        path = st.session_state.get("export_path")
+        if path and os.path.exists(path):
+            nom = os.path.basename(path)
+
+            def contenu():
+                with open(path, "rb") as f:
+                    return f.read()
+
+            st.download_button(f"Télécharger {nom}", contenu, file_name=nom, on_click="ignore",
+                               mime="text/csv" if nom.endswith(".csv") else "application/octet-stream")
+
+def send_command(target, url, payload, expect):
+    # Cible préfixée par la salle : les commandes de deux salles ne se remplacent pas entre elles
+    return get_commands().submit(f"{DEVICE.key}:{target}", url, payload, expect=expect,
+                                 baseline=last.get("id", last.get("date")),
+                                 session=st.session_state.setdefault("viewer_id", uuid.uuid4().hex[:8]))
+
+def command_status(target):
+    # Suivi des dernières commandes ; le fragment ne tourne chaque seconde que si une commande est en cours
+    queue = get_commands()
+    target = f"{DEVICE.key}:{target}"
+    en_cours = queue.active(target)
+
+    @st.fragment(run_every=1 if en_cours else None)
+    def suivi():
+        try:
+            queue.observe(get_latest(), prefix=f"{DEVICE.key}:")
+        except Exception:
+            pass
+        cmds = queue.recent(target)
+        if not cmds:
+            return
+        st.markdown("<div class='section-title'>Suivi des commandes</div>", unsafe_allow_html=True)
+        lignes = []
+        for c in cmds:
+            etat = c.status
+            if c.status == APPLIQUEE and c.sent_at:
+                etat = f"{ENVOYEE} → {APPLIQUEE} ({c.applied_at - c.sent_at:.1f} s)"
+            lignes.append({
+                "Heure": datetime.fromtimestamp(c.created, ZoneInfo("Europe/Brussels")).strftime("%H:%M:%S"),
+                "Commande": ", ".join(f"{k}={v}" for k, v in c.payload.items()),
+                "État": etat,
+                "Essais": c.attempts,
+                "Erreur": c.error or "",
+            })
+        st.dataframe(lignes, use_container_width=True, hide_index=True)
+        if en_cours and not queue.active(target):
+            # Tout est terminé : on relance la page pour couper le minuteur du fragment
+            st.rerun()
+
+    suivi()
+
 def gauge(title, value, vmin, vmax, unit="", seuil_rouge=None, bar_color="rgba(96,165,250,0.85)"):
     val = safe_float(value, default=None)
     display_val = 0.0 if val is None else float(val)
 
-    steps = None
-    if seuil_rouge is not None:
-        steps = [
-            {"range": [vmin, seuil_rouge], "color": "rgba(255,255,255,0.18)"},
-            {"range": [seuil_rouge, vmax], "color": "rgba(239,68,68,0.9)"},
-        ]
-
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=display_val,
-        title={"text": title, "font": {"size": 16, "color": "rgba(232,238,252,0.95)"}},
-        number={
-            "suffix": f" {unit}" if unit else "",
-            "font": {"size": 44, "color": "rgba(232,238,252,0.95)"},
-            "valueformat": ".0f" if val is not None else ""
-        },
-        gauge={
-            "axis": {"range": [vmin, vmax], "tickcolor": "rgba(183,198,230,0.9)"},
-            "bar": {"color": bar_color},
-            "bgcolor": "rgba(0,0,0,0)",
-            "borderwidth": 0,
-            "steps": steps
-        }
-    ))
+    def build():
+        steps = None
+        if seuil_rouge is not None:
+            steps = [
+                {"range": [vmin, seuil_rouge], "color": "rgba(255,255,255,0.18)"},
+                {"range": [seuil_rouge, vmax], "color": "rgba(239,68,68,0.9)"},
+            ]
+
+        fig = go.Figure(go.Indicator(
+            mode="gauge+number",
+            value=display_val,
+            title={"text": title, "font": {"size": 16, "color": "rgba(232,238,252,0.95)"}},
+            number={
+                "suffix": f" {unit}" if unit else "",
+                "font": {"size": 44, "color": "rgba(232,238,252,0.95)"}
+            },
+            gauge={
+                "axis": {"range": [vmin, vmax], "tickcolor": "rgba(183,198,230,0.9)"},
+                "bar": {"color": bar_color},
+                "bgcolor": "rgba(0,0,0,0)",
+                "borderwidth": 0,
+                "steps": steps
+            }
+        ))
 
-    fig.update_layout(
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        margin=dict(l=20, r=20, t=70, b=10),
-        height=300
-    )
+        fig.update_layout(
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(0,0,0,0)",
+            margin=dict(l=20, r=20, t=70, b=10),
+            height=300
+        )
+        patch(fig)
+        return fig
 
-    if val is None:
-        fig.update_traces(number={"prefix": "—", "suffix": ""})
+    def patch(fig):
+        # Seule la valeur (et l'affichage "—" si pas de mesure) change d'un refresh à l'autre
+        fig.data[0].value = display_val
+        fig.data[0].number.valueformat = ".0f" if val is not None else ""
+        fig.data[0].number.prefix = "—" if val is None else ""
+        fig.data[0].number.suffix = "" if val is None else (f" {unit}" if unit else "")
 
-    st.plotly_chart(fig, use_container_width=True)
+    cached_chart(f"gauge:{title}", (val,), build, patch)
 
 # On choisit la page dans la sidebar
-page = st.sidebar.selectbox("Choisir une page", ["Vue générale", "Commandes Salle technique", "Commandes Salle", "Historique"])
-
-# On règle le refresh automatique
-refresh_seconds = st.sidebar.slider("Temps de rafraîchissement (secondes)", 2, 15, 5, 1)
-
-if page == "Vue générale":
-    st_autorefresh(interval=refresh_seconds * 1000, key="auto_refresh_vg")
+PAGES = ["Vue générale", "Flotte", "Commandes Salle technique", "Commandes Salle", "Historique", "Alarmes",
+         "Prévisions", "Moteur", "Comparaison"]
+# Lien direct vers une page : ?page=Historique
+page_demandee = st.query_params.get("page")
+# Page cachée de diagnostic (temps par étape, caches, sessions) : ?page=Diagnostics ou ?diag=1
+if page_demandee == "Diagnostics" or st.query_params.get("diag") == "1":
+    PAGES = PAGES + ["Diagnostics"]
+page = st.sidebar.selectbox("Choisir une page", PAGES,
+                            index=PAGES.index(page_demandee) if page_demandee in PAGES else 0)
+
+# Salles / locaux supervisés (table [devices] des secrets, sinon les secrets API_* d'origine)
+DEVICES = load_devices(st.secrets)
+DEVICES_BY_KEY = {d.key: d for d in DEVICES}
+DEVICE = DEVICES[0]
+if len(DEVICES) > 1:
+    DEVICE = DEVICES_BY_KEY[st.sidebar.selectbox("Salle", list(DEVICES_BY_KEY), format_func=lambda k: DEVICES_BY_KEY[k].name)]
+
+# Canal push SSE de Node-RED : s'il est configuré, la page se met à jour à chaque nouvelle mesure
+API_EVENTS = DEVICE.events_url
+
+# Modules lourds chargés seulement par les pages qui en ont besoin : les pages de commande
+# s'affichent sans attendre pandas / Plotly (une fois importés, ils restent pour tout le process)
+if page in ("Vue générale", "Flotte", "Historique", "Alarmes", "Prévisions", "Moteur", "Comparaison"):
+    import numpy as np
+    import pandas as pd
+if page in ("Vue générale", "Historique", "Prévisions", "Moteur", "Comparaison"):
+    import plotly.graph_objects as go
+if page in ("Vue générale", "Historique"):
+    from downsample import downsample
+if page == "Prévisions":
+    from forecast import crossings
+if page == "Moteur":
+    from energy import BANDS, CONTINU, parse_curve
+if page == "Comparaison":
+    from compare import MODES, axis, bands, overlay, profile
+if page == "Historique":
+    from export import CHUNK_HOURS, export_file, iter_chunks, new_export_path
+    from rollups import pick_resolution
+
+# On règle le refresh automatique (inutile en push)
+refresh_seconds = None
+if API_EVENTS:
+    st.sidebar.caption("Mise à jour en direct (push Node-RED)")
+else:
+    refresh_seconds = st.sidebar.slider("Temps de rafraîchissement (secondes)", 2, 15, 5, 1)
+
+
+# On choisit comment réduire les points des graphes (min/max garde les pics de gaz)
+echantillonnage = st.sidebar.selectbox(
+    "Échantillonnage des graphes",
+    ["minmax", "lttb"],
+    format_func=lambda m: "Min / Max par intervalle" if m == "minmax" else "LTTB"
+)
 
-if st.sidebar.button("Rafraîchir maintenant"):
-    st.cache_data.clear()
-    st.rerun()
+refresh_now = st.sidebar.button("Rafraîchir maintenant")
 
 ordre_tableau = "Plus récent → plus ancien"
+periode = None
 if page == "Historique":
+    # On choisit la période à charger (envoyée à l'API en from/to)
+    aujourd_hui = pd.Timestamp.now(tz="Europe/Brussels").date()
+    periode = st.sidebar.date_input(
+        "Période",
+        (aujourd_hui - pd.Timedelta(days=1), aujourd_hui),
+        max_value=aujourd_hui
+    )
     ordre_tableau = st.sidebar.radio(
         "Ordre du tableau",
         ["Plus récent → plus ancien", "Plus ancien → plus récent"],
         index=0
     )
+elif page == "Alarmes":
+    aujourd_hui = pd.Timestamp.now(tz="Europe/Brussels").date()
+    periode = st.sidebar.date_input(
+        "Période des alarmes",
+        (aujourd_hui - pd.Timedelta(days=30), aujourd_hui),
+        max_value=aujourd_hui
+    )
+elif page == "Prévisions":
+    horizon = st.sidebar.slider("Horizon de prévision (heures)", 1, 24, 6, 1)
+elif page == "Moteur":
+    aujourd_hui = pd.Timestamp.now(tz="Europe/Brussels").date()
+    periode = st.sidebar.date_input(
+        "Période",
+        (aujourd_hui - pd.Timedelta(days=30), aujourd_hui),
+        max_value=aujourd_hui
+    )
+    regroupement = st.sidebar.radio("Regrouper par", ["Jour", "Semaine"], index=0, horizontal=True)
+elif page == "Comparaison":
+    aujourd_hui = pd.Timestamp.now(tz="Europe/Brussels").date()
+    alignement = st.sidebar.radio("Aligner sur", ["jour", "semaine"], horizontal=True,
+                                  format_func=lambda m: "Heure du jour" if m == "jour" else "Jour de la semaine")
+    mesure_comparee = st.sidebar.selectbox(
+        "Mesure", ["temperature_lt", "humidite_lt", "gaz"],
+        format_func={"temperature_lt": "Température", "humidite_lt": "Humidité", "gaz": "Gaz"}.get
+    )
+    reference = st.sidebar.date_input("Jour de référence", aujourd_hui, max_value=aujourd_hui)
+    nb_periodes = (st.sidebar.slider("Jours comparés (bandes)", 2, 60, 14, 1) if alignement == "jour"
+                   else st.sidebar.slider("Semaines comparées (bandes)", 2, 12, 4, 1))
 
-# On récupère les liens API depuis les secrets Streamlit
-API_LATEST = st.secrets.get("API_LATEST", "").strip()
-API_HISTORY = st.secrets.get("API_HISTORY", "").strip()
-API_CMD = st.secrets.get("API_CMD", "").strip()
-API_SALLE_CMD = st.secrets.get("API_SALLE_CMD", "").strip()
+# On récupère les liens API de la salle choisie
+API_LATEST = DEVICE.latest_url
+API_HISTORY = DEVICE.history_url
+API_CMD = DEVICE.cmd_url
+API_SALLE_CMD = DEVICE.salle_cmd_url
 
-if not API_LATEST:
-    st.error("Secret manquant: API_LATEST (GET dernière mesure).")
-    st.stop()
+# Fenêtre d'historique gardée en mémoire (heures) et nombre max de lignes par requête
+HISTORY_RETENTION_HOURS = float(st.secrets.get("HISTORY_RETENTION_HOURS", 24))
+HISTORY_LIMIT = int(st.secrets.get("HISTORY_LIMIT", 200000))
 
-@st.cache_data(ttl=2)
-def get_latest():
-    r = requests.get(API_LATEST, timeout=8)
-    r.raise_for_status()
-    return r.json()
+# Source des valeurs live : "http" (poller) ou "mqtt" (topics ESP32, HTTP en secours)
+LIVE_MODE = st.secrets.get("LIVE_MODE", "http").strip().lower()
+MQTT_HOST = st.secrets.get("MQTT_HOST", "localhost").strip()
+MQTT_PORT = int(st.secrets.get("MQTT_PORT", 1883))
 
-@st.cache_data(ttl=8)
-def get_history():
-    if not API_HISTORY:
-        return pd.DataFrame()
-    r = requests.get(API_HISTORY, timeout=12)
-    r.raise_for_status()
-    return pd.DataFrame(r.json())
-
-# On récupère la dernière mesure et l'historique si dispo
-try:
-    last = get_latest()
-except Exception as e:
-    st.error(f"Erreur API (latest) : {e}")
-    st.stop()
+# Cadence de rafraîchissement des graphes de la vue générale (secondes)
+CHARTS_REFRESH_SECONDS = float(st.secrets.get("CHARTS_REFRESH_SECONDS", 30))
 
-df = get_history()
+# Cadence du poller partagé (secondes)
+POLL_SECONDS = float(st.secrets.get("POLL_SECONDS", 2))
+HISTORY_POLL_SECONDS = float(st.secrets.get("HISTORY_POLL_SECONDS", 8))
 
-# On nettoie les dates de l'historique pour avoir la bonne timezone
-if not df.empty and "date" in df.columns:
-    df["date_local"] = pd.to_datetime(df["date"], errors="coerce")
-    if df["date_local"].dt.tz is None:
-        df["date_local"] = df["date_local"].dt.tz_localize("Europe/Brussels", ambiguous="infer", nonexistent="shift_forward")
-    else:
-        df["date_local"] = df["date_local"].dt.tz_convert("Europe/Brussels")
+# Cadence d'échantillonnage la plus rapide des ESP32 (taille du buffer mémoire)
+SAMPLE_SECONDS = float(st.secrets.get("SAMPLE_SECONDS", 1))
 
-# On lit les dernières valeurs
-temperature_lt = last.get("temperature_lt", "—")
-humidite_lt = last.get("humidite_lt", "—")
-gaz_value = last.get("gaz", "—")
-motor_speed = last.get("motor_speed", "—")
-alarme_value = last.get("alarme", "—")
-date_value = last.get("date", None)
+# Cache disque (un fichier par jour) et nombre de jours passés préchargés au démarrage
+CACHE_DIR = st.secrets.get("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "history"))
+WARM_DAYS = int(st.secrets.get("WARM_DAYS", 7))
 
-alarme_int = safe_int(alarme_value, 0)
-alarme_txt = "ACTIF" if alarme_int == 1 else "INACTIF"
+# Règle gaz : seuil ADC et durée minimale au-dessus du seuil avant de compter une alarme
+ALARM_GAS_THRESHOLD = float(st.secrets.get("ALARM_GAS_THRESHOLD", 3000))
+ALARM_GAS_SECONDS = float(st.secrets.get("ALARM_GAS_SECONDS", 10))
 
-# On calcule le mode affiché (mode texte ou mode_confort)
-mode_txt = "—"
-if "mode" in last and str(last.get("mode", "")).strip() != "":
-    mode_txt = str(last.get("mode")).upper()
-elif "mode_confort" in last:
-    mode_txt = "CONFORT" if safe_int(last.get("mode_confort", 0), 0) == 1 else "ECO"
+# Les exports sont écrits hors de static/ (qui est public) : seule la session qui les a préparés
+# les télécharge, via st.download_button
+EXPORT_DIR = st.secrets.get("EXPORT_DIR", os.path.join(APP_DIR, ".cache", "exports"))
 
-st.markdown(f"<div class='note'>Dernière mesure : <b>{fmt_date(date_value)}</b></div>", unsafe_allow_html=True)
+# Journal des commandes : nombre de mois gardés (0 = tout garder)
+AUDIT_KEEP_MONTHS = int(st.secrets.get("AUDIT_KEEP_MONTHS", 0))
 
-if page == "Vue générale":
-    st.markdown("<div class='section-title'>Vue générale</div>", unsafe_allow_html=True)
+# Fichier de métriques Prometheus réécrit toutes les N secondes (0 = désactivé), servi sur app/static/metrics.txt
+METRICS_EXPORT_SECONDS = float(st.secrets.get("METRICS_EXPORT_SECONDS", 15))
 
-    c1, c2, c3, c4 = st.columns(4)
-    with c1:
-        kpi_card("Température", f"{temperature_lt} °C")
-    with c2:
-        kpi_card("Humidité", f"{humidite_lt} %")
-    with c3:
-        kpi_card("Mode", f"{mode_txt}")
-    with c4:
-        kpi_card("Alarme", f"{alarme_txt}")
+# Puissance du moteur selon la vitesse PWM : [[pwm, W], ...] (interpolée entre les points)
+MOTOR_POWER_CURVE = st.secrets.get("MOTOR_POWER_CURVE")
+
+# Format des réponses /history : "json" (liste d'objets), "columns" (une liste par colonne) ou "ndjson"
+HISTORY_FORMAT = str(st.secrets.get("HISTORY_FORMAT", "json")).strip().lower()
 
-    st.markdown("<div class='section-title'>Jauges</div>", unsafe_allow_html=True)
+# Colonnes demandées à l'API selon la page
+OVERVIEW_FIELDS = ("temperature_lt", "humidite_lt")
+HISTORY_FIELDS = ("mode", "temperature_lt", "humidite_lt", "gaz", "motor_speed", "alarme")
 
-    g1, g2 = st.columns(2)
-    with g1:
-        gauge("Gaz MQ-2", gaz_value, 0, 4095, unit="ADC", seuil_rouge=3000, bar_color="rgba(245,158,11,0.80)")
-    with g2:
-        gauge("Vitesse moteur", motor_speed, 0, 255, unit="PWM", seuil_rouge=200, bar_color="rgba(34,197,94,0.75)")
+if not API_LATEST:
+    st.error("Secret manquant: API_LATEST (GET dernière mesure).")
+    st.stop()
 
-    st.markdown("<div class='section-title'>Graphes (température / humidité)</div>", unsafe_allow_html=True)
+def device_range(dev, start, end, fields, limit=None, session=None):
+    # Historique d'une salle, colonnes renommées vers les noms du dashboard
+    from history_cache import fetch_range
+
+    df = fetch_range(dev.history_url, start, end, dev.remote_fields(fields), limit, session=session,
+                     fmt=HISTORY_FORMAT)
+    return df.rename(columns=dev.rename) if dev.rename else df
+
+# Un seul poller par salle et par process : le nombre d'onglets ouverts ne change pas la charge sur l'API
+# (chaque salle a son propre buffer, son dossier de cache disque et ses agrégats)
+@st.cache_resource
+def start_poller(key):
+    dev = DEVICES_BY_KEY[key]
+
+    def setup(poller):
+        # Exécuté dans le thread du poller : la première page n'attend ni pandas ni pyarrow
+        from alarms import AlarmEngine
+        from anomalies import AnomalyDetector
+        from disk_cache import DiskCache
+        from energy import MotorStats
+        from rollups import Rollups
+
+        cache_dir = dev.cache_dir(CACHE_DIR)
+        disk = poller.disk = DiskCache(cache_dir)
+        rollups = poller.rollups = Rollups(os.path.join(cache_dir, "rollups")).load()
+        alarms = poller.alarms = AlarmEngine(os.path.join(cache_dir, "alarms"), gaz_seuil=ALARM_GAS_THRESHOLD,
+                                             gaz_seconds=ALARM_GAS_SECONDS).load()
+        motor = poller.motor = MotorStats(os.path.join(cache_dir, "motor")).load()
+        anomalies = poller.anomalies = AnomalyDetector(os.path.join(cache_dir, "anomalies")).load()
+        if dev.history_url:
+            # Les jours passés sont téléchargés en arrière-plan, la page s'affiche sans attendre,
+            # puis agrégés (1 min / 15 min / 1 h / 1 jour), passés au moteur d'alarmes, au suivi du moteur
+            # et à la détection d'anomalies
+            def jour_charge(jour):
+                rollups.rebuild_day(disk, jour)
+                alarms.rebuild_day(disk, jour)
+                motor.rebuild_day(disk, jour)
+                anomalies.rebuild_day(disk, jour)
+
+            def prechauffage_fini():
+                rollups.backfill(disk)
+                alarms.backfill(disk)
+                motor.backfill(disk)
+                anomalies.backfill(disk)
+
+            disk.warm_async(
+                lambda debut, fin: device_range(dev, debut, fin, HISTORY_FIELDS, session=poller.session),
+                WARM_DAYS,
+                on_day=jour_charge,
+                then=prechauffage_fini
+            )
+
+    poller = Poller(
+        dev.latest_url, dev.history_url,
+        interval=POLL_SECONDS,
+        history_interval=HISTORY_POLL_SECONDS,
+        retention_hours=HISTORY_RETENTION_HOURS,
+        history_fields=dev.remote_fields(HISTORY_FIELDS),
+        sample_seconds=SAMPLE_SECONDS,
+        rename=dev.rename,
+        setup=setup,
+        history_format=HISTORY_FORMAT
+    )
+    if dev.events_url:
+        poller.push = SseClient(dev.events_url, poller.on_push).start()
+    return poller.start()
+
+def get_poller():
+    return start_poller(DEVICE.key)
+
+def history_poller():
+    # Pages avec historique : au premier démarrage on attend que buffer et cache disque soient prêts.
+    # Pas prêts à temps, ou préparation en échec : message à la place de la page, les valeurs live continuent
+    poller = get_poller()
+    if not poller.wait_ready():
+        if poller.init_error:
+            st.error(f"Historique indisponible ({poller.init_error}). Les valeurs live restent à jour.")
+        else:
+            st.info("Historique en cours de chargement… rafraîchissez la page dans quelques secondes.")
+        st.stop()
+    return poller
 
-    if df.empty or "date_local" not in df.columns:
-        st.info("Pour les graphes, configure API_HISTORY (Secrets Streamlit).")
-    else:
-        p1, p2 = st.columns(2)
-        with p1:
-            if "temperature_lt" in df.columns:
-                fig = px.line(df, x="date_local", y="temperature_lt", title="Température")
-                style_plot(fig, "Date / heure", "Température (°C)", y_range=[0, 40])
-                st.plotly_chart(fig, use_container_width=True)
-
-        with p2:
-            if "humidite_lt" in df.columns:
-                fig = px.line(df, x="date_local", y="humidite_lt", title="Humidité")
-                style_plot(fig, "Date / heure", "Humidité (%)", y_range=[0, 100])
-                st.plotly_chart(fig, use_container_width=True)
+# Session séparée pour la page Flotte (beaucoup d'appareils en parallèle)
+@st.cache_resource
+def get_fleet_session():
+    return make_session(pool_size=32)
+
+if refresh_now:
+    # On ne recharge que la fin de l'historique (dernier jour sur disque + buffer mémoire)
+    get_poller().refresh_now()
+    st.rerun()
+
+@st.cache_resource
+def start_mqtt(key):
+    return MqttLive(
+        MQTT_HOST, MQTT_PORT,
+        topics=DEVICES_BY_KEY[key].mqtt_topics,
+        username=st.secrets.get("MQTT_USER", None),
+        password=st.secrets.get("MQTT_PASSWORD", None),
+        rename=DEVICES_BY_KEY[key].rename
+    ).start()
+
+# File de commandes partagée : les POST partent en arrière-plan, le script ne bloque plus
+@st.cache_resource
+def get_commands():
+    queue = CommandQueue(get_poller().session)
+    # Chaque changement d'état part dans le journal dès qu'il arrive (mise en file, envoi, essais,
+    # remplacement, confirmation) : une commande partie puis remplacée reste tracée
+    queue.on_change.append(get_audit().record)
+    return queue
+
+# Journal des commandes de toutes les salles (SQLite par mois, ajout seul)
+@st.cache_resource
+def get_audit():
+    return AuditLog(os.path.join(CACHE_DIR, "audit"), keep_months=AUDIT_KEEP_MONTHS)
+
+# Modèles de prévision d'une salle : gardés entre les reruns, mis à jour avec les seuls nouveaux seaux 15 min
+@st.cache_resource
+def get_forecaster(key):
+    from forecast import Forecaster
+
+    return Forecaster()
+
+@st.cache_resource
+def start_metrics_export():
+    return METRICS.export_every(os.path.join(APP_DIR, "static", "metrics.txt"), METRICS_EXPORT_SECONDS)
+
+start_metrics_export()
+
+def get_latest():
+    with METRICS.timer("stage_seconds", stage="get_latest"):
+        snap = get_poller().snapshot()
+        latest = dict(snap.latest)
+
+        # En mode MQTT, les valeurs reçues directement passent devant celles de la base
+        if LIVE_MODE == "mqtt":
+            live = start_mqtt(DEVICE.key).latest()
+            if live is not None:
+                latest.update(live)
+
+    if not latest:
+        raise RuntimeError(snap.error or "pas encore de mesure")
+    return latest
+
+def get_tail(last_hours, fields=None):
+    # Fenêtre glissante (vue générale) lue dans le buffer mémoire du poller, sans appel HTTP
+    ring = history_poller().snapshot().ring
+    if ring is None:
+        return pd.DataFrame()
+    t_min, t_max = ring.bounds()
+    if t_max is None:
+        return pd.DataFrame()
+    return ring.frame(t0=t_max - int(last_hours * 3600e9), fields=fields)
+
+def ring_window(start, end, fields=None):
+    # Période entièrement dans le buffer mémoire ? Alors pas besoin de l'API
+    ring = history_poller().snapshot().ring
+    if ring is None:
+        return None
+    t_min, t_max = ring.bounds()
+    if t_min is None:
+        return None
+    t0 = pd.Timestamp(start).tz_localize("Europe/Brussels", ambiguous=False, nonexistent="shift_forward").value
+    if t0 < t_min:
+        return None
+    t1 = pd.Timestamp(end).tz_localize("Europe/Brussels", ambiguous=False, nonexistent="shift_forward").value
+    return ring.frame(t0=t0, t1=t1, fields=fields)
+
+def disk_window(start, end, fields=None):
+    # Sinon, jours déjà sur disque : lecture memory-mappée, pas d'appel API
+    disk = history_poller().disk
+    if disk is None:
+        return None
+    t0 = pd.Timestamp(start).tz_localize("Europe/Brussels", ambiguous=False, nonexistent="shift_forward").value
+    t1 = pd.Timestamp(end).tz_localize("Europe/Brussels", ambiguous=False, nonexistent="shift_forward").value
+    if not disk.covers(t0, t1):
+        return None
+    return disk.read_frame(t0, t1, fields)
+
+def add_local_dates(df):
+    # On nettoie les dates de l'historique pour avoir la bonne timezone
+    if not df.empty and "date" in df.columns:
+        with METRICS.timer("stage_seconds", stage="timezone"):
+            if "ts" in df.columns:
+                # Epoch UTC calculé au décodage : conversion directe, sans ambiguïté au changement d'heure
+                df["date_local"] = pd.to_datetime(df["ts"].to_numpy(), unit="ns", utc=True).tz_convert("Europe/Brussels")
+                return df
+            df["date_local"] = pd.to_datetime(df["date"], errors="coerce")
+            if df["date_local"].dt.tz is None:
+                df["date_local"] = df["date_local"].dt.tz_localize("Europe/Brussels", ambiguous="infer", nonexistent="shift_forward")
+            else:
+                df["date_local"] = df["date_local"].dt.tz_convert("Europe/Brussels")
+    return df
+
+# Chaque combinaison (période, colonnes, limite) a sa propre entrée de cache
+# (les dates locales sont calculées une seule fois, dans l'entrée de cache)
+@st.cache_data(ttl=8)
+def get_history(key, start=None, end=None, fields=None, limit=HISTORY_LIMIT):
+    # Appelée via METRICS.cached : ce corps ne tourne que si le cache a raté
+    METRICS.mark_miss()
+    dev = DEVICES_BY_KEY[key]
+    if not dev.history_url:
+        return pd.DataFrame()
+    df = add_local_dates(device_range(dev, start, end, fields, limit, session=get_poller().session))
+    if "date_local" in df.columns:
+        # Trié une fois ici : le tableau paginé n'a plus qu'à lire dans un sens ou dans l'autre
+        df = df.sort_values("date_local", kind="stable").reset_index(drop=True)
+    return df
+
+# On récupère la dernière mesure (l'historique est chargé page par page)
+# La page Flotte interroge toutes les salles elle-même ; Diagnostics doit marcher même si l'API est en panne
+last = {}
+if page not in ("Flotte", "Diagnostics"):
+    try:
+        last = get_latest()
+    except Exception as e:
+        st.error(f"Erreur API (latest) : {e}")
+        st.stop()
+
+    # Les commandes envoyées sont confirmées quand la mesure relue contient la valeur demandée
+    get_commands().observe(last, prefix=f"{DEVICE.key}:")
+
+def read_live(last):
+    # On lit les dernières valeurs
+    alarme_value = last.get("alarme", "—")
+    alarme_int = safe_int(alarme_value, 0)
+
+    # On calcule le mode affiché (mode texte ou mode_confort)
+    mode_txt = "—"
+    if "mode" in last and str(last.get("mode", "")).strip() != "":
+        mode_txt = str(last.get("mode")).upper()
+    elif "mode_confort" in last:
+        mode_txt = "CONFORT" if safe_int(last.get("mode_confort", 0), 0) == 1 else "ECO"
+
+    return {
+        "temperature_lt": last.get("temperature_lt", "—"),
+        "humidite_lt": last.get("humidite_lt", "—"),
+        "gaz": last.get("gaz", "—"),
+        "motor_speed": last.get("motor_speed", "—"),
+        "date": last.get("date", None),
+        "alarme_txt": "ACTIF" if alarme_int == 1 else "INACTIF",
+        "mode_txt": mode_txt,
+    }
+
+live = read_live(last)
+temperature_lt = live["temperature_lt"]
+humidite_lt = live["humidite_lt"]
+gaz_value = live["gaz"]
+motor_speed = live["motor_speed"]
+
+if page not in ("Vue générale", "Flotte", "Diagnostics"):
+    st.markdown(f"<div class='note'>Dernière mesure : <b>{fmt_date(live['date'])}</b></div>", unsafe_allow_html=True)
+
+if page == "Vue générale":
+    # Cartes + jauges : fragment rafraîchi seul au rythme du slider (le reste de la page ne bouge pas).
+    # En push, il n'a pas de minuteur : le veilleur ci-dessous le relance quand une mesure arrive
+    @st.fragment(key="vue_live", run_every=None if API_EVENTS else refresh_seconds)
+    @METRICS.timed("fragment_seconds", fragment="vue_live")
+    def live_section():
+        # Version de l'instantané affichée par cette session (lue avant la mesure : rien n'est manqué)
+        st.session_state["version_vue"] = get_poller().snapshot().version
+        try:
+            v = read_live(get_latest())
+        except Exception as e:
+            st.error(f"Erreur API (latest) : {e}")
+            return
+
+        st.markdown(f"<div class='note'>Dernière mesure : <b>{fmt_date(v['date'])}</b></div>", unsafe_allow_html=True)
+        st.markdown("<div class='section-title'>Vue générale</div>", unsafe_allow_html=True)
+
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            kpi_card("Température", f"{v['temperature_lt']} °C")
+        with c2:
+            kpi_card("Humidité", f"{v['humidite_lt']} %")
+        with c3:
+            kpi_card("Mode", f"{v['mode_txt']}")
+        with c4:
+            kpi_card("Alarme", f"{v['alarme_txt']}")
+
+        st.markdown("<div class='section-title'>Jauges</div>", unsafe_allow_html=True)
+
+        g1, g2 = st.columns(2)
+        with g1:
+            gauge("Gaz MQ-2", v["gaz"], 0, 4095, unit="ADC", seuil_rouge=3000, bar_color="rgba(245,158,11,0.80)")
+        with g2:
+            gauge("Vitesse moteur", v["motor_speed"], 0, 255, unit="PWM", seuil_rouge=200, bar_color="rgba(34,197,94,0.75)")
+
+    # Graphes : fragment séparé, plus lent (y compris en push)
+    @st.fragment(run_every=CHARTS_REFRESH_SECONDS)
+    @METRICS.timed("fragment_seconds", fragment="vue_graphes")
+    def overview_charts():
+        st.markdown("<div class='section-title'>Graphes (température / humidité)</div>", unsafe_allow_html=True)
+
+        # Seulement la dernière heure de température / humidité
+        df = get_tail(1, fields=OVERVIEW_FIELDS)
+
+        if df.empty or "date_local" not in df.columns:
+            st.info("Pour les graphes, configure API_HISTORY (Secrets Streamlit).")
+        else:
+            p1, p2 = st.columns(2)
+            with p1:
+                if "temperature_lt" in df.columns:
+                    line_chart(df, "temperature_lt", "Température", "Température (°C)", y_range=[0, 40], width_px=600)
+
+            with p2:
+                if "humidite_lt" in df.columns:
+                    line_chart(df, "humidite_lt", "Humidité", "Humidité (%)", y_range=[0, 100], width_px=600)
+
+    live_section()
+    if API_EVENTS:
+        # Push : petit fragment invisible qui compare juste un numéro de version chaque seconde.
+        # Il ne relance que le fragment cartes + jauges, et seulement si une mesure ou un état
+        # d'alarme est arrivé : sinon les éléments déjà affichés restent tels quels
+        @st.fragment(run_every=1)
+        def push_watcher():
+            if version_moved(st.session_state, "version_vue", get_poller().snapshot().version):
+                rerun_fragment("vue_live")
+
+        push_watcher()
+    overview_charts()
+
+elif page == "Flotte":
+    # Toutes les salles interrogées en parallèle : la page attend la plus lente, pas la somme
+    @st.fragment(run_every=refresh_seconds or 5)
+    @METRICS.timed("fragment_seconds", fragment="flotte")
+    def fleet_section():
+        t = time.perf_counter()
+        res = fetch_fleet(DEVICES, get_fleet_session())
+        duree = time.perf_counter() - t
+
+        lignes = []
+        for dev in DEVICES:
+            m, err, dt = res[dev.key]
+            v = read_live(m)
+            lignes.append({
+                "Salle": dev.name,
+                "Température (°C)": safe_float(m.get("temperature_lt")),
+                "Humidité (%)": safe_float(m.get("humidite_lt")),
+                "Gaz (ADC)": safe_float(m.get("gaz")),
+                "Vitesse (PWM)": safe_float(m.get("motor_speed")),
+                "Mode": v["mode_txt"],
+                "Alarme": v["alarme_txt"] if m else "—",
+                "Dernière mesure": fmt_date(v["date"]) if m else "—",
+                "Réponse (ms)": round(dt * 1000),
+                "Erreur": err or "",
+            })
+        tableau = pd.DataFrame(lignes)
+
+        st.markdown("<div class='section-title'>Flotte</div>", unsafe_allow_html=True)
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            kpi_card("Salles", f"{len(DEVICES)}")
+        with c2:
+            kpi_card("En alarme", f"{int((tableau['Alarme'] == 'ACTIF').sum())}")
+        with c3:
+            kpi_card("Hors ligne", f"{int((tableau['Erreur'] != '').sum())}")
+
+        st.dataframe(tableau, use_container_width=True, hide_index=True)
+        plus_lente = tableau["Réponse (ms)"].max() if len(tableau) else 0
+        st.markdown(f"<div class='note'>{len(DEVICES)} salles interrogées en {duree * 1000:.0f} ms "
+                    f"(la plus lente : {plus_lente} ms)</div>", unsafe_allow_html=True)
+
+    fleet_section()
 
 elif page == "Commandes Salle technique":
     st.markdown("<div class='section-title'>Commandes</div>", unsafe_allow_html=True)
@@ -419,6 +1058,7 @@ elif page == "Commandes Salle technique":
     # On gère le moteur et le mute alarme
     vitesse = st.slider("Vitesse moteur (0 à 255)", 0, 255, 120)
     mute = st.checkbox("Couper le buzzer (mute alarme)", value=False)
+    envoi_direct = st.checkbox("Envoyer dès que le slider bouge", value=False)
 
     payload_send = {"target_speed": int(vitesse), "mute": 1 if mute else 0}
     payload_stop = {"target_speed": 0, "mute": 1 if mute else 0}
@@ -429,21 +1069,23 @@ elif page == "Commandes Salle technique":
     b1, b2 = st.columns(2)
     with b1:
         if st.button("Envoyer la commande", use_container_width=True):
-            try:
-                r = requests.post(API_CMD, json=payload_send, timeout=10)
-                r.raise_for_status()
-                st.success("Commande envoyée !")
-            except Exception as e:
-                st.error(f"Erreur envoi commande : {e}")
+            send_command("cmd", API_CMD, payload_send, {"motor_speed": payload_send["target_speed"]})
+            st.success("Commande mise en file !")
 
     with b2:
         if st.button("Arrêter le moteur", use_container_width=True):
-            try:
-                r = requests.post(API_CMD, json=payload_stop, timeout=10)
-                r.raise_for_status()
-                st.warning("Moteur arrêté !")
-            except Exception as e:
-                st.error(f"Erreur arrêt moteur : {e}")
+            send_command("cmd", API_CMD, payload_stop, {"motor_speed": 0})
+            st.warning("Arrêt moteur mis en file !")
+
+    # Envoi direct : les mouvements rapides du slider sont fusionnés, seule la dernière vitesse part
+    if envoi_direct and st.session_state.get("payload_direct") != payload_send:
+        if "payload_direct" in st.session_state:
+            send_command("cmd", API_CMD, payload_send, {"motor_speed": payload_send["target_speed"]})
+        st.session_state["payload_direct"] = payload_send
+    elif not envoi_direct:
+        st.session_state.pop("payload_direct", None)
+
+    command_status("cmd")
 
     st.markdown("<div class='section-title'>Aperçu état actuel</div>", unsafe_allow_html=True)
     a1, a2, a3, a4 = st.columns(4)
@@ -459,46 +1101,397 @@ elif page == "Commandes Salle technique":
 elif page == "Historique":
     st.markdown("<div class='section-title'>Historique - mesures_hvac</div>", unsafe_allow_html=True)
 
-    if df.empty:
-        st.error("Aucun historique (API_HISTORY pas configurée ou pas de données).")
+    # Seulement la période demandée (bornes en dates entières -> clé de cache stable)
+    debut, fin = (periode if len(periode) == 2 else (periode[0], periode[0]))
+    debut, fin = pd.Timestamp(debut), pd.Timestamp(fin) + pd.Timedelta(days=1)
+
+    if API_HISTORY:
+        export_section(debut, fin)
+
+    # Anomalies capteurs déjà détectées par le poller au fil des mesures (marquées sur les graphes)
+    anomalies = history_poller().anomalies.query(debut, fin)
+
+    # Commandes du journal sur la période : repères sur les graphes pour relier un réglage à la réponse
+    commandes = command_log(debut, fin)
+
+    # Plus de deux jours : on lit les agrégats, jamais les mesures brutes
+    if fin - debut > pd.Timedelta(days=2):
+        resolution = pick_resolution((fin - debut).total_seconds())
+        r = history_poller().rollups.query(debut, fin, resolution)
+
+        if r.empty:
+            st.error("Pas encore d'agrégats pour cette période (préchargement en cours ou pas de données).")
+        else:
+            st.markdown(f"<div class='section-title'>Graphes (agrégats {resolution})</div>", unsafe_allow_html=True)
+            rollup_chart(r, "temperature_lt", "Température dans le temps", "Température (°C)", y_range=[0, 40],
+                         ev=anomalies, cmds=commandes)
+            rollup_chart(r, "humidite_lt", "Humidité dans le temps", "Humidité (%)", y_range=[0, 100],
+                         ev=anomalies, cmds=commandes)
+            rollup_chart(r, "gaz", "Gaz MQ-2 dans le temps", "Gaz (ADC)", y_range=[0, 4095],
+                         ev=anomalies, cmds=commandes)
+            rollup_chart(r, "motor_speed", "Vitesse moteur dans le temps", "Vitesse (0–255)", y_range=[0, 255],
+                         cmds=commandes)
+
+            st.markdown("<div class='section-title'>Tableau (agrégats)</div>", unsafe_allow_html=True)
+            r_show = r.sort_values("date_local", ascending=(ordre_tableau == "Plus ancien → plus récent"))
+            r_show = r_show.assign(
+                date_local=r_show["date_local"].dt.strftime("%d/%m/%Y %H:%M"),
+                motor_on_mean=(r_show["motor_on_mean"] * 100).round(1)
+            ).rename(columns={"motor_on_mean": "marche_moteur_%", "gaz_count": "nb_mesures"})
+            cols = ["date_local", "temperature_lt_mean", "temperature_lt_min", "temperature_lt_max",
+                    "humidite_lt_mean", "gaz_mean", "gaz_max", "motor_speed_mean", "marche_moteur_%", "nb_mesures"]
+            with METRICS.timer("table_seconds", table="agregats"):
+                st.dataframe(r_show[[c for c in cols if c in r_show.columns]], use_container_width=True)
     else:
-        st.markdown("<div class='section-title'>Graphes</div>", unsafe_allow_html=True)
+        df = ring_window(debut, fin, fields=HISTORY_FIELDS)
+        if df is None:
+            df = disk_window(debut, fin, fields=HISTORY_FIELDS)
+        if df is None:
+            df = METRICS.cached("get_history", get_history, DEVICE.key, start=debut, end=fin, fields=HISTORY_FIELDS)
+
+        if df.empty:
+            st.error("Aucun historique (API_HISTORY pas configurée ou pas de données).")
+        else:
+            st.markdown("<div class='section-title'>Graphes</div>", unsafe_allow_html=True)
 
-        if "date_local" in df.columns:
-            if "temperature_lt" in df.columns:
-                fig = px.line(df, x="date_local", y="temperature_lt", title="Température dans le temps")
-                style_plot(fig, "Date / heure", "Température (°C)", y_range=[0, 40])
-                st.plotly_chart(fig, use_container_width=True)
+            if "date_local" in df.columns:
+                if "temperature_lt" in df.columns:
+                    line_chart(df, "temperature_lt", "Température dans le temps", "Température (°C)", y_range=[0, 40],
+                               ev=anomalies, cmds=commandes)
 
-            if "humidite_lt" in df.columns:
-                fig = px.line(df, x="date_local", y="humidite_lt", title="Humidité dans le temps")
-                style_plot(fig, "Date / heure", "Humidité (%)", y_range=[0, 100])
-                st.plotly_chart(fig, use_container_width=True)
+                if "humidite_lt" in df.columns:
+                    line_chart(df, "humidite_lt", "Humidité dans le temps", "Humidité (%)", y_range=[0, 100],
+                               ev=anomalies, cmds=commandes)
 
-            if "gaz" in df.columns:
-                fig = px.line(df, x="date_local", y="gaz", title="Gaz MQ-2 dans le temps")
-                style_plot(fig, "Date / heure", "Gaz (ADC)", y_range=[0, 4095])
-                st.plotly_chart(fig, use_container_width=True)
+                if "gaz" in df.columns:
+                    line_chart(df, "gaz", "Gaz MQ-2 dans le temps", "Gaz (ADC)", y_range=[0, 4095],
+                               ev=anomalies, cmds=commandes)
 
-            if "motor_speed" in df.columns:
-                fig = px.line(df, x="date_local", y="motor_speed", title="Vitesse moteur dans le temps")
-                style_plot(fig, "Date / heure", "Vitesse (0–255)", y_range=[0, 255])
-                st.plotly_chart(fig, use_container_width=True)
+                if "motor_speed" in df.columns:
+                    line_chart(df, "motor_speed", "Vitesse moteur dans le temps", "Vitesse (0–255)", y_range=[0, 255],
+                               cmds=commandes)
 
-        st.markdown("<div class='section-title'>Tableau</div>", unsafe_allow_html=True)
+            st.markdown("<div class='section-title'>Tableau</div>", unsafe_allow_html=True)
+            history_table(df, ascending=(ordre_tableau == "Plus ancien → plus récent"))
 
-        df_show = df.copy()
-        if "mode" in df_show.columns:
-            df_show["mode"] = df_show["mode"].str.upper()
+    st.markdown("<div class='section-title'>Anomalies capteurs</div>", unsafe_allow_html=True)
+    if anomalies.empty:
+        st.info("Aucune anomalie détectée sur cette période (pics, capteur figé, hors plage, trous).")
+    else:
+        # Déjà triées du plus récent au plus ancien
+        a = anomalies if ordre_tableau == "Plus récent → plus ancien" else anomalies.iloc[::-1]
+        with METRICS.timer("table_seconds", table="anomalies"):
+            st.dataframe(pd.DataFrame({
+                "Type": a["type"],
+                "Champ": a["field"],
+                "Début": a["debut"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+                "Fin": a["fin"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+                "Durée (s)": a["duree_s"].round(0),
+                "Valeur": a["valeur"].round(1),
+                "Écart (σ)": a["score"].round(1).where(a["kind"] == "pic"),
+                "Mesures": a["mesures"],
+                "En cours": np.where(a["en_cours"], "oui", ""),
+            }), use_container_width=True, hide_index=True)
+
+    st.markdown("<div class='section-title'>Journal des commandes</div>", unsafe_allow_html=True)
+    if commandes.empty:
+        st.info("Aucune commande envoyée depuis le dashboard sur cette période.")
+    else:
+        c = commandes if ordre_tableau == "Plus récent → plus ancien" else commandes.iloc[::-1]
+        journal = pd.DataFrame({
+            "Heure": c["heure"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+            "Cible": c["target"].map({"cmd": "Salle technique", "salle": "Salle"}).fillna(c["target"]),
+            "Commande": c["commande"],
+            "État": c["status"],
+            "HTTP": c["http_status"].astype("Int64"),
+            "Latence (ms)": c["latency_ms"].round(0),
+            "Essais": c["attempts"],
+            "Session": c["session"].fillna(""),
+            "Erreur": c["error"].fillna(""),
+        })
+        with METRICS.timer("table_seconds", table="commandes"):
+            st.dataframe(journal, use_container_width=True, hide_index=True)
+        st.download_button("Télécharger le journal (CSV)", journal.to_csv(index=False).encode("utf-8"),
+                           file_name=f"commandes_{DEVICE.key}_{debut:%Y%m%d}_{fin:%Y%m%d}.csv", mime="text/csv")
+
+        # Chronologie d'un réglage : valeur envoyée dans le temps (marches d'escalier)
+        with st.expander("Chronologie des réglages"):
+            valeurs = pd.DataFrame([{"heure": h, "reglage": k, "valeur": safe_float(v)}
+                                    for h, p in zip(commandes["heure"], commandes["payload"]) for k, v in p.items()])
+            valeurs = valeurs.dropna(subset=["valeur"]).sort_values("heure")
+            if valeurs.empty:
+                st.caption("Pas de réglage numérique sur cette période.")
+            else:
+                reglage = st.selectbox("Réglage", sorted(valeurs["reglage"].unique()))
+                v = valeurs[valeurs["reglage"] == reglage]
+                x, y = v["heure"].to_numpy(), v["valeur"].to_numpy(dtype=np.float64)
+
+                def build():
+                    fig = go.Figure(go.Scatter(x=x, y=y, mode="lines+markers", line_shape="hv"))
+                    fig.update_layout(title=f"{reglage} envoyé")
+                    style_plot(fig, "Date / heure", reglage)
+                    return fig
+
+                def patch(fig):
+                    fig.data[0].x = x
+                    fig.data[0].y = y
+
+                cached_chart(f"reglage:{reglage}", data_signature(x, y), build, patch)
+
+        # Rejouer une commande passée : elle repasse par la file (dédoublonnage, suivi, journal)
+        with st.expander("Renvoyer une commande"):
+            urls = {"cmd": API_CMD, "salle": API_SALLE_CMD}
+            choix = st.selectbox("Commande", list(range(len(commandes))),
+                                 format_func=lambda i: f"{commandes['heure'].iloc[i]:%d/%m %H:%M:%S} — "
+                                                       f"{commandes['resume'].iloc[i]}")
+            cible = commandes["target"].iloc[choix]
+            if st.button("Renvoyer", disabled=not urls.get(cible)):
+                send_command(cible, urls[cible], commandes["payload"].iloc[choix], commandes["expect"].iloc[choix])
+                st.success("Commande remise en file (suivi sur la page de commande).")
+
+elif page == "Alarmes":
+    st.markdown("<div class='section-title'>Alarmes - épisodes</div>", unsafe_allow_html=True)
+
+    debut, fin = (periode if len(periode) == 2 else (periode[0], periode[0]))
+    debut, fin = pd.Timestamp(debut), pd.Timestamp(fin) + pd.Timedelta(days=1)
+
+    alarms = history_poller().alarms
+    regles = " · ".join(
+        f"{r.label} ({'< ' + format(r.low, 'g') if r.low is not None else ''}"
+        f"{' / ' if r.low is not None and r.high is not None else ''}"
+        f"{'> ' + format(r.high, 'g') if r.high is not None else ''}"
+        f"{f', ≥ {r.min_seconds:g} s' if r.min_seconds else ''})"
+        for r in alarms.rules
+    )
+    st.markdown(f"<div class='note'>Règles : {regles}</div>", unsafe_allow_html=True)
 
-        if "date_local" in df_show.columns:
-            ascending = True if ordre_tableau == "Plus ancien → plus récent" else False
-            df_show = df_show.sort_values(by="date_local", ascending=ascending)
-            df_show["date_local"] = df_show["date_local"].dt.strftime("%d/%m/%Y %H:%M:%S")
+    t = time.perf_counter()
+    ev = alarms.query(debut, fin)
+    duree_requete = time.perf_counter() - t
 
-        cols = ["id", "date_local", "mode", "temperature_lt", "humidite_lt", "gaz", "motor_speed", "alarme"]
-        cols = [c for c in cols if c in df_show.columns]
-        st.dataframe(df_show[cols], use_container_width=True)
+    if ev.empty:
+        st.info("Aucune alarme sur cette période.")
+    else:
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            kpi_card("Épisodes", f"{len(ev)}")
+        with c2:
+            kpi_card("En cours", f"{int(ev['en_cours'].sum())}")
+        with c3:
+            kpi_card("Durée totale", f"{ev['duree_s'].sum() / 3600:.1f} h")
+        with c4:
+            gaz_ev = ev[ev["rule"] == "gaz"]
+            kpi_card("Pic gaz", f"{gaz_ev['pic'].max():.0f} ADC" if len(gaz_ev) else "—")
+
+        st.markdown("<div class='section-title'>Par règle</div>", unsafe_allow_html=True)
+        resume = ev.groupby("regle").agg(episodes=("duree_s", "size"), duree_totale_min=("duree_s", "sum"),
+                                         duree_max_min=("duree_s", "max"))
+        resume[["duree_totale_min", "duree_max_min"]] = (resume[["duree_totale_min", "duree_max_min"]] / 60).round(1)
+        st.dataframe(resume, use_container_width=True)
+
+        st.markdown("<div class='section-title'>Épisodes</div>", unsafe_allow_html=True)
+        with METRICS.timer("table_seconds", table="alarmes"):
+            st.dataframe(pd.DataFrame({
+                "Règle": ev["regle"],
+                "Début": ev["debut"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+                "Fin": ev["fin"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+                "Durée (s)": ev["duree_s"].round(0),
+                "Pic": ev["pic"].round(1),
+                "En cours": np.where(ev["en_cours"], "oui", ""),
+            }), use_container_width=True, hide_index=True)
+
+    st.markdown(f"<div class='note'>Requête : {duree_requete * 1000:.0f} ms</div>", unsafe_allow_html=True)
+
+    if st.button("Recalculer avec les seuils actuels"):
+        # Tout l'historique disque est réévalué en arrière-plan, jour par jour
+        threading.Thread(target=alarms.rebuild_all, args=(history_poller().disk,),
+                         name="hvac-alarms-rebuild", daemon=True).start()
+        st.info("Recalcul lancé en arrière-plan.")
+
+elif page == "Prévisions":
+    st.markdown(f"<div class='section-title'>Prévisions - {horizon} prochaines heures</div>", unsafe_allow_html=True)
+
+    poller = history_poller()
+    prevision = get_forecaster(DEVICE.key)
+    t = time.perf_counter()
+    with METRICS.timer("stage_seconds", stage="forecast"):
+        # Seuls les seaux 15 min terminés depuis le dernier rerun passent dans les modèles
+        nouveaux = prevision.update(poller.rollups)
+        fc = prevision.forecast(horizon)
+    duree_prevision = time.perf_counter() - t
+
+    if fc.empty:
+        st.error("Pas encore d'agrégats 15 min pour prévoir (préchargement en cours ou pas de données).")
+    else:
+        # Mêmes seuils que les alarmes : T1 / T3, H1 / H2 (réglages de la Salle) et zone rouge du gaz
+        regles = {r.field: r for r in poller.alarms.rules}
+        alertes = crossings(fc, regles.values())
+        maintenant = pd.Timestamp.now(tz="Europe/Brussels")
+        for a in alertes:
+            dans = max((a["quand"] - maintenant).total_seconds(), 0) / 60
+            texte = (f"{a['regle']} : {a['valeur']:.1f} prévu vers {a['quand']:%H:%M} "
+                     f"(dans {dans // 60:.0f} h {dans % 60:02.0f}), seuil {'haut' if a['sens'] == 'haut' else 'bas'} "
+                     f"{a['seuil']:g}")
+            if a["niveau"] == "probable":
+                st.error(f"Dépassement probable — {texte}")
+            else:
+                st.warning(f"Dépassement possible (bande 10–90 %) — {texte}")
+        if not alertes:
+            st.success(f"Aucun dépassement de seuil prévu sur les {horizon} prochaines heures.")
+
+        fin = fc["date_local"].iloc[0].tz_localize(None)
+        recent = poller.rollups.query(fin - pd.Timedelta(hours=24), fin, "15min", prevision.fields)
+
+        def seuils(champ):
+            r = regles.get(champ)
+            return tuple(v for v in (r.low, r.high) if v is not None) if r else ()
+
+        forecast_chart(recent, fc, "temperature_lt", "Température prévue", "Température (°C)", y_range=[0, 40],
+                       seuils=seuils("temperature_lt"))
+        forecast_chart(recent, fc, "humidite_lt", "Humidité prévue", "Humidité (%)", y_range=[0, 100],
+                       seuils=seuils("humidite_lt"))
+        forecast_chart(recent, fc, "gaz", "Gaz MQ-2 prévu", "Gaz (ADC)", y_range=[0, 4095], seuils=seuils("gaz"))
+
+        modeles = " · ".join(f"{f} α={p[0]:g} β={p[1]:g} γ={p[2]:g} ({p[3]} seaux)"
+                             for f, p in prevision.params().items())
+        st.markdown(f"<div class='note'>Holt-Winters 15 min, saison journalière — {modeles}<br>"
+                    f"{nouveaux} nouveau(x) seau(x) · calcul : {duree_prevision * 1000:.0f} ms</div>",
+                    unsafe_allow_html=True)
+
+elif page == "Moteur":
+    st.markdown("<div class='section-title'>Moteur - marche et énergie</div>", unsafe_allow_html=True)
+
+    debut, fin = (periode if len(periode) == 2 else (periode[0], periode[0]))
+    debut, fin = pd.Timestamp(debut), pd.Timestamp(fin) + pd.Timedelta(days=1)
+
+    # Un histogramme PWM par jour, déjà calculé par le poller : la courbe de puissance s'applique ici
+    moteur = history_poller().motor
+    t = time.perf_counter()
+    m = moteur.query(debut, fin, parse_curve(MOTOR_POWER_CURVE), freq="W" if regroupement == "Semaine" else "D")
+    duree_requete = time.perf_counter() - t
+
+    if m.empty:
+        st.info("Pas encore de mesures moteur sur cette période (préchargement en cours ou pas de données).")
+    else:
+        mesure_h, marche_h = m["mesure_h"].sum(), m["marche_h"].sum()
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            kpi_card("Taux de marche", f"{marche_h / mesure_h * 100:.0f} %" if mesure_h else "—")
+        with c2:
+            kpi_card("Énergie estimée", f"{m['energie_kwh'].sum():.2f} kWh")
+        with c3:
+            kpi_card("Démarrages", f"{int(m['demarrages'].sum())}")
+        with c4:
+            kpi_card("Plus longue marche", f"{m['marche_continue_max_h'].max():.1f} h")
+
+        en_marche = moteur.running_for()
+        if en_marche:
+            st.markdown(f"<div class='note'>En marche sans arrêt depuis {en_marche / 3600:.1f} h</div>",
+                        unsafe_allow_html=True)
+
+        libelle = (m["periode"].dt.strftime("%d/%m/%Y") if regroupement == "Jour"
+                   else "sem. du " + m["periode"].dt.strftime("%d/%m/%Y"))
+        continu = m["taux_marche"].to_numpy() >= CONTINU
+        if continu.any():
+            st.warning(f"Moteur en marche quasi continue (≥ {CONTINU * 100:.0f} % du temps mesuré) : "
+                       + ", ".join(libelle[continu]))
+
+        motor_charts(m, regroupement.lower())
+
+        st.markdown("<div class='section-title'>Détail</div>", unsafe_allow_html=True)
+        with METRICS.timer("table_seconds", table="moteur"):
+            st.dataframe(pd.DataFrame({
+                "Période": libelle,
+                "Mesuré (h)": m["mesure_h"].round(1),
+                "Marche (%)": (m["taux_marche"] * 100).round(1),
+                **{f"{nom.capitalize()} (h)": m[f"{nom}_h"].round(1) for nom, _, _ in BANDS},
+                "Vitesse moy. en marche": m["vitesse_moy"].round(0),
+                "Énergie (kWh)": m["energie_kwh"].round(3),
+                "Démarrages": m["demarrages"],
+                "Arrêts": m["arrets"],
+                "Marche continue max (h)": m["marche_continue_max_h"].round(1),
+            }), use_container_width=True, hide_index=True)
+
+    st.markdown(f"<div class='note'>Requête : {duree_requete * 1000:.0f} ms</div>", unsafe_allow_html=True)
+
+elif page == "Comparaison":
+    semaine = alignement == "semaine"
+    st.markdown(f"<div class='section-title'>Comparaison - {'semaines' if semaine else 'journées'} superposées</div>",
+                unsafe_allow_html=True)
+
+    resolution, duree = MODES[alignement]
+    duree = pd.Timedelta(duree)
+    ref = pd.Timestamp(reference)
+    if semaine:
+        ref = ref - pd.Timedelta(days=ref.weekday())
+    debut = ref - nb_periodes * duree
+
+    # Une seule lecture des agrégats pour toutes les périodes (jamais les mesures brutes)
+    t = time.perf_counter()
+    r = history_poller().rollups.query(debut, ref + duree, resolution, [mesure_comparee])
+    p = profile(r, mesure_comparee, alignement)
+    passe = p[p["periode"] < ref]
+    b = bands(passe)
+    duree_calcul = time.perf_counter() - t
+
+    if p.empty:
+        st.error("Pas encore d'agrégats pour cette période (préchargement en cours ou pas de données).")
+    else:
+        # Seuils réglés sur la page « Commandes Salle » (dernière mesure), gaz : règle d'alarme
+        if mesure_comparee == "temperature_lt":
+            seuils = tuple(safe_float(last.get(k), d) for k, d in (("tempT1", 18.0), ("tempT2", 24.0), ("tempT3", 28.0)))
+            libelle, unite, y_range = "Température", "°C", [0, 40]
+        elif mesure_comparee == "humidite_lt":
+            seuils = tuple(safe_float(last.get(k), d) for k, d in (("humH1", 40.0), ("humH2", 70.0)))
+            libelle, unite, y_range = "Humidité", "%", [0, 100]
+        else:
+            seuils = (ALARM_GAS_THRESHOLD,)
+            libelle, unite, y_range = "Gaz", "ADC", [0, 4095]
+
+        if semaine:
+            periodes = [("Cette semaine", ref), ("Semaine dernière", ref - duree)]
+        else:
+            periodes = [("Jour de référence", ref), ("Veille", ref - duree),
+                        ("Même jour, semaine précédente", ref - 7 * duree)]
+        lignes = [(nom, *overlay(p, debut_periode)) for nom, debut_periode in periodes]
+        lignes = [l for l in lignes if len(l[1])]
+
+        ref_x, ref_y = overlay(p, ref)
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            kpi_card("Périodes comparées", f"{passe['periode'].nunique()}")
+        with c2:
+            if len(ref_y) and not b.empty:
+                med = b.set_index("creneau")["p50"].reindex(ref_x).to_numpy()
+                kpi_card("Écart à la médiane", f"{np.nanmean(ref_y - med):+.1f} {unite}")
+            else:
+                kpi_card("Écart à la médiane", "—")
+        with c3:
+            if len(ref_y) and not b.empty:
+                bb = b.set_index("creneau").reindex(ref_x)
+                hors = (ref_y < bb["p10"].to_numpy()) | (ref_y > bb["p90"].to_numpy())
+                kpi_card("Hors bande p10–p90", f"{hors.mean() * 100:.0f} % du temps")
+            else:
+                kpi_card("Hors bande p10–p90", "—")
+
+        compare_chart(b, lignes, f"{libelle} ({resolution}, {nb_periodes} {'semaines' if semaine else 'jours'})",
+                      f"{libelle} ({unite})", y_range=y_range, seuils=seuils, semaine=semaine)
+
+        # Par période : moyenne / extrêmes des moyennes et part du temps au-delà du seuil le plus haut
+        st.markdown("<div class='section-title'>Par période</div>", unsafe_allow_html=True)
+        resume = p.assign(au_dessus=p["valeur"] > max(seuils)).groupby("periode").agg(
+            moyenne=("valeur", "mean"), mini=("valeur", "min"), maxi=("valeur", "max"), au_dessus=("au_dessus", "mean"))
+        resume = resume.sort_index(ascending=False)
+        st.dataframe(pd.DataFrame({
+            "Période": resume.index.strftime("sem. du %d/%m/%Y" if semaine else "%d/%m/%Y"),
+            "Moyenne": resume["moyenne"].round(1).to_numpy(),
+            "Min": resume["mini"].round(1).to_numpy(),
+            "Max": resume["maxi"].round(1).to_numpy(),
+            f"Au-dessus de {max(seuils):g} {unite} (%)": (resume["au_dessus"] * 100).round(1).to_numpy(),
+        }), use_container_width=True, hide_index=True)
+
+    st.markdown(f"<div class='note'>Agrégats {resolution} · calcul : {duree_calcul * 1000:.0f} ms</div>",
+                unsafe_allow_html=True)
 
 elif page == "Commandes Salle":
     st.markdown("<div class='section-title'>Gestion de commande de la Salle</div>", unsafe_allow_html=True)
@@ -607,12 +1600,8 @@ elif page == "Commandes Salle":
     b1, b2 = st.columns(2)
     with b1:
         if st.button("Envoyer vers la Salle", use_container_width=True, disabled=erreur):
-            try:
-                r = requests.post(API_SALLE_CMD, json=payload_salle, timeout=10)
-                r.raise_for_status()
-                st.success("Commande envoyée à la Salle")
-            except Exception as e:
-                st.error(f"Erreur d’envoi : {e}")
+            send_command("salle", API_SALLE_CMD, payload_salle, {"brightness": payload_salle["brightness"]})
+            st.success("Commande mise en file pour la Salle")
 
     with b2:
         if st.button("Réglages par défaut", use_container_width=True):
@@ -625,14 +1614,83 @@ elif page == "Commandes Salle":
                 "humH1": 40.0,
                 "humH2": 70.0
             }
-            try:
-                r = requests.post(API_SALLE_CMD, json=payload_default, timeout=10)
-                r.raise_for_status()
-                st.warning("Valeurs par défaut envoyées")
-            except Exception as e:
-                st.error(f"Erreur reset : {e}")
+            send_command("salle", API_SALLE_CMD, payload_default, {"brightness": payload_default["brightness"]})
+            st.warning("Valeurs par défaut mises en file")
+
+    command_status("salle")
+
+elif page == "Diagnostics":
+    st.markdown("<div class='section-title'>Diagnostics - où part le temps</div>", unsafe_allow_html=True)
+
+    # Pas de pandas ici : la page reste légère et lisible même quand le reste rame
+    @st.fragment(run_every=refresh_seconds or 5)
+    def diagnostics():
+        stats = METRICS.summary()
+        compteurs = METRICS.counter_rows()
+        sessions = METRICS.viewer_rows()
+
+        caches = {}
+        for c in compteurs:
+            if c["metric"] == "cache_requests_total":
+                parts = dict(p.split("=", 1) for p in c["labels"].split(", "))
+                caches.setdefault(parts["fn"], {"hit": 0, "miss": 0})[parts["result"]] += c["value"]
+
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            kpi_card("En service depuis", f"{(time.time() - METRICS.started) / 3600:.1f} h")
+        with c2:
+            kpi_card("Sessions vues", f"{len(sessions)}")
+        with c3:
+            pages = [s for s in stats if s["metric"] == "page_seconds"]
+            pire = max(pages, key=lambda s: s["p95"], default=None)
+            kpi_card("Page la plus lente (p95)", f"{pire['p95'] * 1000:.0f} ms" if pire else "—")
+        with c4:
+            hits = sum(v["hit"] for v in caches.values())
+            total = hits + sum(v["miss"] for v in caches.values())
+            kpi_card("Cache historique", f"{hits / total * 100:.0f} % hit" if total else "—")
+
+        st.markdown(f"<div class='section-title'>Percentiles (fenêtre des {METRICS.window} dernières valeurs)</div>",
+                    unsafe_allow_html=True)
+        lignes = []
+        for s in stats:
+            en_ms = s["metric"].endswith("_seconds")
+            f = (lambda v: None if v is None else round(v * 1000, 1)) if en_ms else \
+                (lambda v: None if v is None else round(v))
+            lignes.append({
+                "Métrique": s["metric"], "Labels": s["labels"], "Unité": "ms" if en_ms else "octets",
+                "n": s["n"], "p50": f(s["p50"]), "p95": f(s["p95"]), "p99": f(s["p99"]),
+                "max": f(s["max"]), "dernier": f(s["last"]),
+            })
+        st.dataframe(lignes, use_container_width=True, hide_index=True)
+
+        st.markdown("<div class='section-title'>Compteurs</div>", unsafe_allow_html=True)
+        st.dataframe([{"Métrique": c["metric"], "Labels": c["labels"], "Valeur": c["value"]} for c in compteurs],
+                     use_container_width=True, hide_index=True)
+
+        st.markdown("<div class='section-title'>Sessions (la plus coûteuse en premier)</div>", unsafe_allow_html=True)
+        st.dataframe([{
+            "Session": v["session"], "Page": v["page"], "Exécutions": v["runs"],
+            "Total (s)": round(v["total_s"], 2), "Max (ms)": round(v["max_s"] * 1000),
+            "Vue à": datetime.fromtimestamp(v["vu"], ZoneInfo("Europe/Brussels")).strftime("%H:%M:%S"),
+        } for v in sessions], use_container_width=True, hide_index=True)
+
+    diagnostics()
+
+    st.markdown("<div class='section-title'>Format Prometheus</div>", unsafe_allow_html=True)
+    texte = METRICS.prometheus()
+    if METRICS_EXPORT_SECONDS:
+        st.markdown(f"<div class='note'>Aussi servi sur <code>app/static/metrics.txt</code> "
+                    f"(réécrit toutes les {METRICS_EXPORT_SECONDS:g} s)</div>", unsafe_allow_html=True)
+    st.download_button("Télécharger metrics.txt", texte, file_name="metrics.txt", mime="text/plain")
+    with st.expander("Voir le texte"):
+        st.code(texte, language="text")
 
 st.markdown(
     "<hr><p style='text-align:center; font-size:12px; color:rgba(183,198,230,0.9);'>© 2025 - Binôme A_02 : LFRAH Abdelrahman [HE304830] – IQBAL Adil [HE305031]</p>",
     unsafe_allow_html=True
 )
+
+# Temps du script complet (les fragments rafraîchis seuls sont mesurés à part)
+duree_run = time.perf_counter() - debut_run
+METRICS.observe("page_seconds", duree_run, page=page)
+METRICS.viewer(st.session_state.setdefault("viewer_id", uuid.uuid4().hex[:8]), page, duree_run)
@@ -0,0 +1,215 @@
+# Journal des commandes envoyées à Node-RED (LFRAH & IQBAL)
+# Chaque changement d'état d'une commande (en file, envoi, essai raté, envoyée, appliquée, remplacée,
+# échec, non confirmée) ajoute une ligne : heure, heure du clic, salle, cible, session, payload, statut
+# HTTP, latence du POST et numéro d'essai. Un payload parti puis remplacé reste donc tracé.
+# Un fichier SQLite par mois, en ajout seul (les triggers refusent UPDATE / DELETE), index sur
+# (salle, heure du clic). Au changement de mois, le mois terminé est compacté (WAL recopié puis
+# VACUUM) et n'est plus modifié ; keep_months supprime les archives trop vieilles.
+# Bibliothèque standard seulement : chargé avec la file de commandes.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evenements (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,            -- changement d'état, ms depuis 1970 (UTC)
+    created INTEGER NOT NULL,       -- clic
+    device TEXT NOT NULL,
+    target TEXT NOT NULL,           -- "cmd" (salle technique) ou "salle"
+    session TEXT,
+    key TEXT NOT NULL,              -- clé d'idempotence envoyée à Node-RED, une par commande
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    expect TEXT,
+    http_status INTEGER,
+    latency_ms REAL,
+    attempts INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS evenements_device_created ON evenements (device, created);
+CREATE TRIGGER IF NOT EXISTS evenements_sans_update BEFORE UPDATE ON evenements
+BEGIN SELECT RAISE(ABORT, 'journal des commandes en ajout seul'); END;
+CREATE TRIGGER IF NOT EXISTS evenements_sans_delete BEFORE DELETE ON evenements
+BEGIN SELECT RAISE(ABORT, 'journal des commandes en ajout seul'); END;
+"""
+COLUMNS = ["id", "ts", "created", "device", "target", "session", "key", "status", "payload", "expect",
+           "http_status", "latency_ms", "attempts", "error"]
+PREFIX = "commandes-"
+# Un changement d'état arrive au plus quelques minutes après le clic (ack_timeout) : un jour de marge
+SLACK_MS = 86400 * 1000
+
+
+def _ms(t):
+    return None if t is None else int(t * 1000)
+
+
+def month_of(ms):
+    return time.strftime("%Y-%m", time.gmtime(ms / 1000))
+
+
+class AuditLog:
+    def __init__(self, root, keep_months=None):
+        self.root = root
+        self.keep_months = keep_months
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = None          # connexion du mois en cours (écriture)
+        self.month = None
+        # Mois passés jamais archivés (process arrêté avant le changement de mois) : compactés maintenant
+        courant = month_of(_ms(time.time()))
+        for month in self.months():
+            if month < courant and self._in_wal(month):
+                try:
+                    self._archive(month)
+                except sqlite3.OperationalError:
+                    pass        # encore ouvert par un autre process : il le compactera lui-même
+        self._purge(courant)
+
+    def _path(self, month):
+        return os.path.join(self.root, f"{PREFIX}{month}.sqlite")
+
+    def months(self):
+        return sorted(n[len(PREFIX):-len(".sqlite")] for n in os.listdir(self.root)
+                      if n.startswith(PREFIX) and n.endswith(".sqlite"))
+
+    def _in_wal(self, month):
+        # Octet 18 de l'en-tête SQLite : 2 tant que la base est en WAL, 1 une fois archivée
+        with open(self._path(month), "rb") as f:
+            return f.read(19)[18:] == b"\x02"
+
+    def _open(self, month):
+        # Une connexion partagée par les threads d'envoi et les sessions, protégée par le verrou.
+        # WAL : les lectures des pages ne bloquent pas l'écriture d'une commande
+        db = sqlite3.connect(self._path(month), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.executescript(SCHEMA)
+        return db
+
+    def _archive(self, month):
+        # Mois terminé : WAL recopié dans la base, fichier réécrit sans pages libres, plus de WAL
+        db = self.db if month == self.month else sqlite3.connect(self._path(month), isolation_level=None)
+        try:
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.execute("PRAGMA journal_mode = DELETE")
+            db.execute("VACUUM")
+            db.execute("PRAGMA optimize")
+        finally:
+            db.close()
+            if month == self.month:
+                self.db, self.month = None, None
+
+    def _purge(self, courant):
+        # Rétention : on ne garde que les keep_months derniers mois (None = tout garder)
+        if not self.keep_months:
+            return
+        for month in self.months()[:-int(self.keep_months)]:
+            if month < courant:
+                os.remove(self._path(month))
+
+    def _writer(self, ms):
+        month = month_of(ms)
+        if month != self.month:
+            ancien = self.month if self.db is not None and self.month < month else None
+            if ancien is not None:
+                self._archive(ancien)
+            if self.db is None:
+                self.db, self.month = self._open(month), month
+            if ancien is not None:
+                self._purge(month)
+        return self.db
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db, self.month = None, None
+
+    def record(self, cmd, status=None):
+        # Callback de CommandQueue.on_change : une ligne par changement d'état
+        now = _ms(time.time())
+        device, _, target = cmd.target.rpartition(":")
+        row = (
+            now, _ms(cmd.created), device, target, getattr(cmd, "session", None), cmd.key,
+            status or cmd.status,
+            json.dumps(cmd.payload, ensure_ascii=False, sort_keys=True),
+            json.dumps(cmd.expect, ensure_ascii=False, sort_keys=True),
+            getattr(cmd, "http_status", None),
+            None if getattr(cmd, "latency", None) is None else round(cmd.latency * 1000, 1),
+            cmd.attempts, cmd.error,
+        )
+        with self.lock:
+            self._writer(now).execute(
+                f"INSERT INTO evenements ({', '.join(COLUMNS[1:])}) "
+                f"VALUES ({', '.join('?' * (len(COLUMNS) - 1))})", row)
+
+    def events(self, start_ms=None, end_ms=None, device=None):
+        # Évènements des commandes cliquées dans [start_ms, end_ms), dans l'ordre où ils ont été écrits
+        where, args = [], []
+        if device is not None:
+            where.append("device = ?")
+            args.append(device)
+        if start_ms is not None:
+            where.append("created >= ?")
+            args.append(int(start_ms))
+        if end_ms is not None:
+            where.append("created < ?")
+            args.append(int(end_ms))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM evenements"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+
+        # Fichiers des mois où ces évènements ont pu être écrits
+        months = self.months()
+        lo = month_of(start_ms) if start_ms is not None else ""
+        hi = month_of((end_ms if end_ms is not None else _ms(time.time())) + SLACK_MS)
+        months = [m for m in months if lo <= m <= hi]
+        out = []
+        with self.lock:
+            for month in months:
+                db = self.db if month == self.month else sqlite3.connect(self._path(month))
+                try:
+                    rows = db.execute(sql, args).fetchall()
+                finally:
+                    if db is not self.db:
+                        db.close()
+                for r in rows:
+                    d = dict(zip(COLUMNS, r))
+                    d["payload"] = json.loads(d["payload"])
+                    d["expect"] = json.loads(d["expect"]) if d["expect"] else {}
+                    out.append(d)
+        return out
+
+    def query(self, start_ms=None, end_ms=None, device=None, limit=None):
+        # Une ligne par commande (clé), plus récentes en premier : état final, envoi et confirmation
+        cmds = {}
+        for e in self.events(start_ms, end_ms, device):
+            c = cmds.get(e["key"])
+            if c is None:
+                c = cmds[e["key"]] = dict(e, ts=e["created"], sent_at=None, applied_at=None, events=0)
+            c["events"] += 1
+            c["status"] = e["status"]
+            for k in ("http_status", "latency_ms", "attempts", "error"):
+                if e[k] is not None or k == "error":
+                    c[k] = e[k]
+            if e["status"] == "envoyée":
+                c["sent_at"] = e["ts"]
+            elif e["status"] == "appliquée":
+                c["applied_at"] = e["ts"]
+        out = sorted(cmds.values(), key=lambda c: c["ts"], reverse=True)
+        return out[:int(limit)] if limit else out
+
+    def count(self):
+        total = 0
+        with self.lock:
+            for month in self.months():
+                db = self.db if month == self.month else sqlite3.connect(self._path(month))
+                total += db.execute("SELECT COUNT(*) FROM evenements").fetchone()[0]
+                if db is not self.db:
+                    db.close()
+        return total
@@ -0,0 +1,193 @@
+# Banc de performance reproductible du dashboard (LFRAH & IQBAL)
+# Un jeu mesures_hvac synthétique (synthetic.py, de 10 000 à 50 M lignes) est servi par un faux Node-RED
+# local, puis chaque page est jouée de bout en bout avec AppTest dans un processus neuf par taille.
+# Pour chaque page : premier affichage, reruns, et temps passé par étape (appels API, décodage,
+# fuseau horaire, buffer / disque / agrégats, graphes, tableaux) lu dans metrics.py.
+#
+# Lancement : python bench.py                                   (10 k, 1 M et 10 M lignes)
+#             python bench.py --rows 10000 50000000 --json r.json
+#             python bench.py --json nouveau.json --compare ancien.json   (code 1 si une page régresse)
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_startup import APP_DIR, PAGES
+
+SIZES = [10_000, 1_000_000, 10_000_000]
+
+# Familles de métriques (metrics.py) résumées dans les résultats
+ETAPES = {
+    "api": lambda m, l: m == "fetch_seconds",
+    "decodage": lambda m, l: m == "stage_seconds" and l == "stage=decode",
+    "fuseau": lambda m, l: m == "stage_seconds" and l == "stage=timezone",
+    "traitement": lambda m, l: m == "stage_seconds" and l in ("stage=ring", "stage=disk", "stage=rollups",
+                                                              "stage=alarms", "stage=downsample",
+                                                              "stage=forecast", "stage=motor", "stage=anomalies"),
+    "graphes": lambda m, l: m == "chart_seconds",
+    "tableaux": lambda m, l: m == "table_seconds",
+}
+# En dessous, un écart est du bruit (ms de l'ordonnanceur, GC...)
+BRUIT_S = 0.05
+
+
+def stage_totals(summary):
+    out = dict.fromkeys(ETAPES, 0.0)
+    for s in summary:
+        for name, match in ETAPES.items():
+            if match(s["metric"], s["labels"]):
+                out[name] += s["total"]
+    return out
+
+
+def size_child(rows, interval, pages, runs, cache_dir, fmt="json"):
+    # Processus neuf : le premier affichage de la première page paie le démarrage du poller
+    sys.path.insert(0, APP_DIR)
+    from metrics import METRICS
+    from streamlit.testing.v1 import AppTest
+    from synthetic import SyntheticNodeRed
+
+    fake = SyntheticNodeRed(rows, interval)
+    srv = fake.serve(port=0, generate=False)
+    base = f"http://127.0.0.1:{srv.server_port}"
+
+    results = []
+    for page in pages:
+        at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=600)
+        for k, path in {"API_LATEST": "/latest", "API_HISTORY": "/history", "API_CMD": "/cmd",
+                        "API_SALLE_CMD": "/salle"}.items():
+            at.secrets[k] = base + path
+        at.secrets["CACHE_DIR"] = cache_dir
+        at.secrets["SAMPLE_SECONDS"] = interval
+        at.secrets["METRICS_EXPORT_SECONDS"] = 0
+        at.secrets["HISTORY_FORMAT"] = fmt
+        at.query_params["page"] = page
+
+        avant = stage_totals(METRICS.summary())
+        t = time.perf_counter()
+        at.run()
+        first = time.perf_counter() - t
+        reruns = []
+        for _ in range(runs):
+            t = time.perf_counter()
+            at.run()
+            reruns.append(time.perf_counter() - t)
+        apres = stage_totals(METRICS.summary())
+
+        results.append({
+            "rows": rows,
+            "page": page,
+            "premier_affichage_s": round(first, 4),
+            "rerun_p50_s": round(statistics.median(reruns), 4) if reruns else None,
+            "rerun_max_s": round(max(reruns), 4) if reruns else None,
+            # Process entier pendant la page (le thread du poller compris)
+            "etapes_s": {k: round(apres[k] - avant[k], 4) for k in ETAPES},
+            "erreurs": [str(e.value) for e in at.exception] + [str(e.value) for e in at.error],
+        })
+    return results
+
+
+def size_run(rows, interval, pages, runs, fmt="json"):
+    cache_dir = tempfile.mkdtemp(prefix="hvac-bench-")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(rows), "--interval", str(interval),
+           "--runs", str(runs), "--cache", cache_dir, "--format", fmt, "--pages", *pages]
+    out = subprocess.run(cmd, cwd=APP_DIR, capture_output=True, text=True)
+    for line in reversed(out.stdout.splitlines()):
+        if line.startswith("["):
+            return json.loads(line)
+    return [{"rows": rows, "page": p, "erreurs": [out.stderr.strip()[-500:]]} for p in pages]
+
+
+def environment():
+    import numpy
+    import pandas
+    import streamlit
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "streamlit": streamlit.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(base, new, tolerance):
+    # Écart page par page (même taille, même page) ; une régression = plus lent au-delà de la tolérance
+    ref = {(r["rows"], r["page"]): r for r in base["resultats"] if not r.get("erreurs")}
+    regressions = 0
+    print(f"Comparaison avec {base.get('env', {}).get('commit') or 'la référence'}")
+    for r in new["resultats"]:
+        old = ref.get((r["rows"], r["page"]))
+        if old is None or r.get("erreurs"):
+            continue
+        for k in ("premier_affichage_s", "rerun_p50_s"):
+            a, b = old.get(k), r.get(k)
+            if a is None or b is None:
+                continue
+            pire = b > a * (1 + tolerance) and b - a > BRUIT_S
+            regressions += pire
+            print(f"  {r['rows']:>11,} {r['page']:<28} {k:<20} {a * 1000:8.0f} → {b * 1000:8.0f} ms"
+                  f"{'  RÉGRESSION' if pire else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de performance du dashboard HVAC")
+    parser.add_argument("--rows", type=int, nargs="+", default=SIZES, help="tailles du jeu de données")
+    parser.add_argument("--interval", type=float, default=2.0, help="secondes entre deux mesures")
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--runs", type=int, default=3, help="reruns mesurés par page")
+    parser.add_argument("--format", default="json", choices=["json", "columns", "ndjson"],
+                        help="format des réponses /history (HISTORY_FORMAT)")
+    parser.add_argument("--json", help="fichier de résultats JSON")
+    parser.add_argument("--compare", help="résultats JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="écart toléré avant régression (0.25 = +25 %%)")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--cache", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(size_child(args.child, args.interval, args.pages, args.runs, args.cache, args.format),
+                         ensure_ascii=False))
+        return
+
+    results = {"env": environment(), "interval_s": args.interval, "runs": args.runs, "format": args.format,
+               "resultats": []}
+    for rows in args.rows:
+        print(f"{rows:,} lignes ({rows * args.interval / 86400:.1f} jours de mesures)")
+        for r in size_run(rows, args.interval, args.pages, args.runs, args.format):
+            results["resultats"].append(r)
+            if r.get("erreurs"):
+                print(f"  {r['page']:<28} ERREUR {r['erreurs'][0][:120]}")
+                continue
+            etapes = " ".join(f"{k}={v * 1000:.0f}" for k, v in r["etapes_s"].items() if v)
+            print(f"  {r['page']:<28} {r['premier_affichage_s'] * 1000:7.0f} ms / {r['rerun_p50_s'] * 1000:5.0f} ms"
+                  f"  ({etapes} ms)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            if compare(json.load(f), results, args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
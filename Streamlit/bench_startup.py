@@ -0,0 +1,110 @@
+# Mesure du démarrage à froid du dashboard (LFRAH & IQBAL)
+# - temps d'import de chaque module (processus Python neuf à chaque fois)
+# - temps du premier affichage de chaque page dans un processus neuf, puis d'un rerun
+# Le faux Node-RED (fake_nodered.py) tourne dans le même processus : aucun réseau nécessaire.
+#
+# Lancement : python bench_startup.py            (tableau)
+#             python bench_startup.py --json r.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Importés par app.py à chaque démarrage, puis seulement par les pages qui en ont besoin
+MODULES_TOUJOURS = ["streamlit", "requests", "poller", "commands", "audit", "devices", "push", "mqtt_live"]
+MODULES_PAGES = ["numpy", "pandas", "plotly.graph_objects", "pyarrow", "downsample", "export",
+                 "rollups", "alarms", "anomalies", "disk_cache", "forecast", "energy",
+                 "compare"]
+PAGES = ["Vue générale", "Flotte", "Commandes Salle technique", "Commandes Salle", "Historique", "Alarmes",
+         "Prévisions", "Moteur", "Comparaison"]
+
+
+def import_time(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, capture_output=True, text=True)
+    try:
+        return float(out.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def page_child(page, cache_dir, history_hours):
+    # Processus neuf : premier affichage (démarrage à froid) puis un rerun (process chaud)
+    sys.path.insert(0, APP_DIR)
+    from fake_nodered import FakeNodeRed
+    from streamlit.testing.v1 import AppTest
+
+    fake = FakeNodeRed(history_hours=history_hours, interval=2.0)
+    srv = fake.serve(port=0)
+    base = f"http://127.0.0.1:{srv.server_port}"
+
+    at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=120)
+    for k, path in {"API_LATEST": "/latest", "API_HISTORY": "/history", "API_CMD": "/cmd",
+                    "API_SALLE_CMD": "/salle"}.items():
+        at.secrets[k] = base + path
+    at.secrets["CACHE_DIR"] = cache_dir
+    at.query_params["page"] = page
+
+    t = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - t
+    t = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter() - t
+    errors = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+    return {"page": page, "premier_affichage_s": round(first, 3), "rerun_s": round(rerun, 3), "erreurs": errors}
+
+
+def page_time(page, cache_dir, history_hours):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", page, "--cache", cache_dir,
+           "--history-hours", str(history_hours)]
+    out = subprocess.run(cmd, cwd=APP_DIR, capture_output=True, text=True)
+    for line in reversed(out.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"page": page, "erreurs": [out.stderr.strip()[-500:]]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage du dashboard HVAC")
+    parser.add_argument("--json", help="fichier de résultats JSON")
+    parser.add_argument("--history-hours", type=float, default=24.0)
+    parser.add_argument("--cache", help="dossier de cache (par défaut : dossier temporaire vide par page)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(page_child(args.child, args.cache, args.history_hours), ensure_ascii=False))
+        return
+
+    results = {"imports": {}, "pages": []}
+    print("Imports (processus neuf, dépendances comprises)")
+    for m in MODULES_TOUJOURS + MODULES_PAGES:
+        dt = import_time(m)
+        results["imports"][m] = None if dt is None else round(dt, 3)
+        tag = "toujours" if m in MODULES_TOUJOURS else "à la demande"
+        print(f"  {m:<22} {'—' if dt is None else f'{dt * 1000:7.0f} ms'}  ({tag})")
+
+    print("Pages (processus neuf : premier affichage / rerun)")
+    for page in PAGES:
+        cache_dir = args.cache or tempfile.mkdtemp(prefix="hvac-bench-")
+        r = page_time(page, cache_dir, args.history_hours)
+        results["pages"].append(r)
+        if r.get("erreurs"):
+            print(f"  {page:<28} ERREUR {r['erreurs'][0][:120]}")
+        else:
+            print(f"  {page:<28} {r['premier_affichage_s'] * 1000:7.0f} ms / {r['rerun_s'] * 1000:5.0f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
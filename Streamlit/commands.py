@@ -0,0 +1,211 @@
+# File de commandes vers Node-RED, envoyées en arrière-plan (LFRAH & IQBAL)
+# Le script Streamlit ne bloque plus sur le POST : il dépose la commande et affiche son état
+# (en file -> envoyée -> appliquée) pendant qu'un petit pool de threads s'occupe de l'envoi.
+
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# États affichés dans l'interface
+EN_FILE = "en file"
+ENVOI = "envoi"
+ENVOYEE = "envoyée"
+APPLIQUEE = "appliquée"
+REMPLACEE = "remplacée"
+ECHEC = "échec"
+NON_CONFIRMEE = "non confirmée"
+
+ACTIVE = (EN_FILE, ENVOI, ENVOYEE)
+
+
+@dataclass
+class Command:
+    target: str
+    url: str
+    payload: dict
+    expect: dict = field(default_factory=dict)  # valeurs à retrouver dans la dernière mesure
+    baseline: object = None                     # id de la mesure visible au moment du clic
+    key: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created: float = field(default_factory=time.time)
+    status: str = EN_FILE
+    attempts: int = 0
+    error: str = None
+    sent_at: float = None
+    applied_at: float = None
+    session: str = None                         # session Streamlit qui a cliqué (journal des commandes)
+    http_status: int = None                     # dernière réponse de Node-RED
+    latency: float = None                       # durée du dernier POST (s)
+
+
+def matches(expect, latest, tol=0.5):
+    # La commande est appliquée quand chaque valeur attendue est relue (à la tolérance près pour les nombres)
+    for k, v in expect.items():
+        if k not in latest:
+            return False
+        got = latest[k]
+        try:
+            if abs(float(got) - float(v)) > tol:
+                return False
+        except (TypeError, ValueError):
+            if str(got).lower() != str(v).lower():
+                return False
+    return True
+
+
+class CommandQueue:
+    def __init__(self, session, workers=2, retries=3, backoff=0.5, timeout=10.0,
+                 ack_timeout=60.0, dedupe_seconds=2.0, keep=50):
+        self.session = session
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.timeout = float(timeout)
+        self.ack_timeout = float(ack_timeout)
+        self.dedupe_seconds = float(dedupe_seconds)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hvac-cmd")
+        self.lock = threading.Lock()
+        self.pending = {}   # cible -> dernière commande pas encore partie (les autres sont remplacées)
+        self.running = set()
+        self.history = deque(maxlen=keep)
+        self.on_done = []   # callbacks(commande) quand une commande change d'état final
+        # callbacks(commande, état) à chaque changement d'état et à chaque essai raté (journal)
+        self.on_change = []
+
+    def submit(self, target, url, payload, expect=None, baseline=None, session=None):
+        with self.lock:
+            # Double clic : même commande pour la même cible il y a moins de 2 s -> on la réutilise
+            for cmd in reversed(self.history):
+                if cmd.target != target:
+                    continue
+                if cmd.payload == payload and cmd.status in ACTIVE + (APPLIQUEE,) \
+                        and time.time() - cmd.created < self.dedupe_seconds:
+                    return cmd
+                break
+
+            cmd = Command(target, url, dict(payload), dict(expect or {}), baseline, session=session)
+            changes = [(cmd, EN_FILE)]
+            old = self.pending.get(target)
+            if old is not None:
+                # Slider bougé plusieurs fois : seule la dernière valeur sera envoyée
+                old.status = REMPLACEE
+                changes.append((old, REMPLACEE))
+            self.pending[target] = cmd
+            self.history.append(cmd)
+            if target not in self.running:
+                self.running.add(target)
+                self.pool.submit(self._drain, target)
+        self._notify(changes)
+        return cmd
+
+    def _notify(self, changes):
+        # Hors du verrou : un callback lent (écriture du journal) ne bloque pas la file
+        for cmd, status in changes:
+            for cb in self.on_change:
+                try:
+                    cb(cmd, status)
+                except Exception:
+                    pass
+
+    def _drain(self, target):
+        # Une seule commande en vol par cible : l'ordre des envois est garanti
+        while True:
+            with self.lock:
+                cmd = self.pending.pop(target, None)
+                if cmd is None:
+                    self.running.discard(target)
+                    return
+                cmd.status = ENVOI
+            self._notify([(cmd, ENVOI)])
+            self._send(cmd)
+
+    def _send(self, cmd):
+        for attempt in range(self.retries + 1):
+            cmd.attempts = attempt + 1
+            t = time.perf_counter()
+            try:
+                # Même clé d'idempotence à chaque essai : Node-RED peut ignorer un doublon
+                r = self.session.post(cmd.url, json=cmd.payload, timeout=self.timeout,
+                                      headers={"Idempotency-Key": cmd.key})
+                cmd.latency = time.perf_counter() - t
+                cmd.http_status = r.status_code
+                if r.status_code < 500:
+                    r.raise_for_status()
+                    with self.lock:
+                        # sent_at avant le statut, sous le verrou : observe() ne voit jamais
+                        # une commande "envoyée" sans heure d'envoi
+                        cmd.sent_at = time.time()
+                        cmd.error = None
+                        cmd.status = ENVOYEE
+                    self._notify([(cmd, ENVOYEE)])
+                    if not cmd.expect:
+                        self._finish(cmd, APPLIQUEE)
+                    return
+                cmd.error = f"HTTP {r.status_code}"
+            except Exception as e:
+                cmd.latency = time.perf_counter() - t
+                cmd.error = str(e)
+                if getattr(getattr(e, "response", None), "status_code", 500) < 500:
+                    # Erreur 4xx : inutile de réessayer, le payload est refusé
+                    break
+            # Essai raté : tracé avec son code HTTP / son erreur, l'état reste "envoi"
+            self._notify([(cmd, ENVOI)])
+            with self.lock:
+                remplacee = cmd.target in self.pending
+                if remplacee:
+                    # Une commande plus récente attend déjà : on abandonne celle-ci
+                    cmd.status = REMPLACEE
+            if remplacee:
+                self._notify([(cmd, REMPLACEE)])
+                return
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random() * 0.25))
+        self._finish(cmd, ECHEC)
+
+    def _finish(self, cmd, status):
+        with self.lock:
+            # Deux sessions peuvent relire la même mesure en même temps : un seul état final
+            if cmd.status not in ACTIVE:
+                return
+            cmd.status = status
+        changes = [(cmd, status)]
+        if status == APPLIQUEE:
+            cmd.applied_at = time.time()
+            with self.lock:
+                # Les commandes plus anciennes pour la même cible ne seront plus jamais relues
+                for old in self.history:
+                    if old is cmd:
+                        break
+                    if old.target == cmd.target and old.status == ENVOYEE:
+                        old.status = REMPLACEE
+                        changes.append((old, REMPLACEE))
+        self._notify(changes)
+        for cb in self.on_done:
+            try:
+                cb(cmd)
+            except Exception:
+                pass
+
+    def observe(self, latest, prefix=""):
+        # Appelé avec la dernière mesure : "envoyée" devient "appliquée" quand l'ESP32 la confirme
+        # (prefix : seulement les cibles de l'appareil dont vient la mesure)
+        now = time.time()
+        mesure = latest.get("id", latest.get("date"))
+        with self.lock:
+            waiting = [(c, c.sent_at) for c in self.history
+                       if c.status == ENVOYEE and c.sent_at is not None and c.target.startswith(prefix)]
+        for cmd, sent_at in waiting:
+            if mesure != cmd.baseline and matches(cmd.expect, latest):
+                self._finish(cmd, APPLIQUEE)
+            elif now - sent_at > self.ack_timeout:
+                self._finish(cmd, NON_CONFIRMEE)
+
+    def recent(self, target=None, n=5):
+        with self.lock:
+            cmds = [c for c in self.history if target is None or c.target == target]
+        return cmds[-n:][::-1]
+
+    def active(self, target=None):
+        return any(c.status in ACTIVE for c in self.recent(target, n=len(self.history)))
@@ -0,0 +1,54 @@
+# Comparaison de périodes alignées sur l'heure du jour ou le jour de la semaine (LFRAH & IQBAL)
+# Les séries viennent des agrégats (rollups.py) : 30 jours en 15 min = 2 880 seaux, donc comparer
+# 30 jours coûte à peu près comme en comparer un. Bandes p10 / p50 / p90 par créneau en un groupby.
+
+import numpy as np
+import pandas as pd
+
+DAY_NS = 86400 * 10**9
+WEEK_NS = 7 * DAY_NS
+# Alignement -> (résolution des agrégats, durée d'une période)
+MODES = {"jour": ("15min", DAY_NS), "semaine": ("1h", WEEK_NS)}
+QUANTILES = (0.1, 0.5, 0.9)
+# Lundi servant d'axe commun : chaque créneau est tracé à cette date + son décalage
+ORIGINE = pd.Timestamp("2001-01-01")
+
+
+def profile(r, field, mode="jour"):
+    # Agrégats (date_local, {champ}_mean) -> période (début du jour / de la semaine), créneau (ns), valeur
+    if r.empty or f"{field}_mean" not in r.columns:
+        return pd.DataFrame(columns=["periode", "creneau", "valeur"])
+    loc = r["date_local"].dt.tz_localize(None).astype("datetime64[ns]").to_numpy().view(np.int64)
+    jour = loc // DAY_NS * DAY_NS
+    if mode == "semaine":
+        # 1er janvier 1970 = jeudi : on recule jusqu'au lundi
+        debut = jour - ((jour // DAY_NS + 3) % 7) * DAY_NS
+    else:
+        debut = jour
+    return pd.DataFrame({
+        "periode": pd.to_datetime(debut, unit="ns"),
+        "creneau": loc - debut,
+        "valeur": r[f"{field}_mean"].to_numpy(dtype=np.float64),
+    })
+
+
+def bands(p, quantiles=QUANTILES):
+    # Percentiles par créneau sur toutes les périodes de p -> colonnes creneau, p10, p50, p90, periodes
+    if p.empty:
+        return pd.DataFrame(columns=["creneau", "periodes"] + [f"p{round(q * 100)}" for q in quantiles])
+    g = p.dropna(subset=["valeur"]).groupby("creneau")["valeur"]
+    out = g.quantile(list(quantiles)).unstack()
+    out.columns = [f"p{round(q * 100)}" for q in quantiles]
+    out["periodes"] = g.size()
+    return out.reset_index()
+
+
+def overlay(p, periode):
+    # Une période de p (début en Timestamp) -> (créneaux, valeurs) triés
+    s = p[p["periode"] == pd.Timestamp(periode)].sort_values("creneau")
+    return s["creneau"].to_numpy(), s["valeur"].to_numpy(dtype=np.float64)
+
+
+def axis(creneaux):
+    # Créneaux (ns depuis minuit / lundi) -> dates sur l'axe commun
+    return ORIGINE + pd.to_timedelta(np.asarray(creneaux, dtype=np.int64), unit="ns")
@@ -0,0 +1,111 @@
+# Registre des salles / locaux supervisés (LFRAH & IQBAL)
+# Chaque appareil a ses propres URL Node-RED, son préfixe MQTT et son dossier de cache.
+# Sans table [devices] dans les secrets, on garde l'ancien fonctionnement (un seul appareil, secrets API_*).
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from metrics import METRICS
+
+DEFAULT_KEY = "principal"
+
+# Chemins Node-RED par défaut quand seule l'adresse de base est donnée
+ENDPOINTS = {"latest": "/latest", "history": "/history", "cmd": "/cmd", "salle_cmd": "/salle", "events": "/events"}
+
+
+@dataclass(frozen=True)
+class Device:
+    key: str
+    name: str
+    latest_url: str
+    history_url: str = ""
+    cmd_url: str = ""
+    salle_cmd_url: str = ""
+    events_url: str = ""
+    mqtt_topics: tuple = ()
+    # Noms des champs chez cet appareil -> noms utilisés par le dashboard (ex. "temp" -> "temperature_lt")
+    rename: dict = field(default_factory=dict)
+
+    def cache_dir(self, root):
+        # Un dossier par appareil ; l'appareil historique garde le dossier d'origine
+        return root if self.key == DEFAULT_KEY else os.path.join(root, self.key)
+
+    def normalize(self, latest):
+        if not self.rename:
+            return dict(latest)
+        return {self.rename.get(k, k): v for k, v in latest.items()}
+
+    def remote_fields(self, fields):
+        # Noms du dashboard -> noms à demander à l'API de cet appareil
+        if not self.rename or fields is None:
+            return fields
+        inv = {v: k for k, v in self.rename.items()}
+        return tuple(inv.get(f, f) for f in fields)
+
+
+def _url(conf, name, base):
+    v = str(conf.get(name, "") or "").strip()
+    if v or not base:
+        return v
+    return base.rstrip("/") + ENDPOINTS[name]
+
+
+def load_devices(secrets):
+    # [devices.salle_a]
+    # name = "Salle A"
+    # api = "http://10.0.0.12:1880"          (ou latest / history / cmd / salle_cmd / events un par un)
+    # mqtt_prefix = "hvac/salle_a"
+    # fields = { temp = "temperature_lt" }
+    table = secrets.get("devices")
+    if not table:
+        return [Device(
+            DEFAULT_KEY, "Salle technique",
+            latest_url=str(secrets.get("API_LATEST", "")).strip(),
+            history_url=str(secrets.get("API_HISTORY", "")).strip(),
+            cmd_url=str(secrets.get("API_CMD", "")).strip(),
+            salle_cmd_url=str(secrets.get("API_SALLE_CMD", "")).strip(),
+            events_url=str(secrets.get("API_EVENTS", "")).strip(),
+            mqtt_topics=(str(secrets.get("MQTT_TOPIC_SALLE", "hvac/salle/#")).strip(),
+                         str(secrets.get("MQTT_TOPIC_LT", "hvac/lt/#")).strip()),
+        )]
+    devices = []
+    for key, conf in table.items():
+        base = str(conf.get("api", "") or "").strip()
+        prefix = str(conf.get("mqtt_prefix", "") or "").strip().rstrip("/")
+        devices.append(Device(
+            str(key), str(conf.get("name", key)),
+            latest_url=_url(conf, "latest", base),
+            history_url=_url(conf, "history", base),
+            cmd_url=_url(conf, "cmd", base),
+            salle_cmd_url=_url(conf, "salle_cmd", base),
+            events_url=_url(conf, "events", base),
+            mqtt_topics=(f"{prefix}/salle/#", f"{prefix}/lt/#") if prefix else (),
+            rename=dict(conf.get("fields", {}) or {}),
+        ))
+    return devices
+
+
+def fetch_latest(device, session, timeout=5.0):
+    # Dernière mesure d'un appareil : (mesure, erreur, durée en s)
+    t = time.perf_counter()
+    try:
+        r = session.get(device.latest_url, timeout=timeout)
+        r.raise_for_status()
+        out = device.normalize(r.json()), None, time.perf_counter() - t
+        METRICS.observe("payload_bytes", len(r.content), endpoint="fleet")
+    except Exception as e:
+        METRICS.inc("fetch_errors_total", endpoint="fleet")
+        out = {}, str(e), time.perf_counter() - t
+    METRICS.observe("fetch_seconds", out[2], endpoint="fleet")
+    return out
+
+
+def fetch_fleet(devices, session, timeout=5.0, workers=16):
+    # Tous les appareils en parallèle : la page attend l'appareil le plus lent, pas la somme
+    if not devices:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(devices)), thread_name_prefix="hvac-fleet") as pool:
+        results = pool.map(lambda d: fetch_latest(d, session, timeout), devices)
+        return {d.key: res for d, res in zip(devices, results)}
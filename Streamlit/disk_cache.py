@@ -0,0 +1,354 @@
+# Cache disque de l'historique, un fichier Arrow IPC par jour (LFRAH & IQBAL)
+# Au redémarrage on relit les jours déjà téléchargés (memory-map) au lieu de tout redemander à l'API.
+# Les lots du poller sont ajoutés au bout d'un segment Arrow en flux ("jour.tail.arrows") : coût
+# proportionnel au lot, pas au jour. Le segment est fusionné dans le fichier du jour au changement
+# de jour (ou au redémarrage du process).
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ring_buffer import CODED_FIELDS, NUMERIC_FIELDS, to_epoch_ns
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    pc = None
+    ipc = None
+
+
+class DiskCache:
+    def __init__(self, root, tz="Europe/Brussels"):
+        self.root = root
+        self.tz = tz
+        self.available = pa is not None
+        self.lock = threading.Lock()
+        if self.available:
+            os.makedirs(self.root, exist_ok=True)
+        # Pour chaque jour : à partir de quand il est couvert (ns UTC) et dernier id écrit
+        self.manifest_path = os.path.join(self.root, "_manifest.json")
+        self.manifest = self._load_manifest()
+        # Segments ouverts en écriture : jour -> (fichier, writer, schéma)
+        self.tails = {}
+        if self.available:
+            # Segments laissés par le process précédent : fusionnés tout de suite
+            for name in sorted(os.listdir(self.root)):
+                if name.endswith(".tail.arrows"):
+                    self._compact_day(name[:-len(".tail.arrows")])
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day}.arrow")
+
+    def _tail_path(self, day):
+        return os.path.join(self.root, f"{day}.tail.arrows")
+
+    def day_of(self, ts):
+        return pd.to_datetime(ts, unit="ns", utc=True).tz_convert(self.tz).strftime("%Y-%m-%d")
+
+    def day_start(self, day):
+        return pd.Timestamp(day).tz_localize(self.tz).value
+
+    def days(self):
+        # Copie d'abord (atomique) : le poller peut ajouter un jour pendant qu'une page trie la liste
+        return sorted(self.manifest.copy())
+
+    # ---------- lecture ----------
+
+    def _read_tail(self, day):
+        # Lots du segment en flux ; un lot coupé (écriture en cours, arrêt brutal) est ignoré
+        path = self._tail_path(day)
+        if not os.path.exists(path):
+            return None
+        batches = []
+        try:
+            with pa.memory_map(path, "r") as src:
+                for batch in ipc.open_stream(src):
+                    batches.append(batch)
+        except (pa.ArrowException, OSError, EOFError):
+            pass
+        return pa.Table.from_batches(batches) if batches else None
+
+    def _read_day(self, day, fields=None):
+        path = self._path(day)
+        table = None
+        if os.path.exists(path):
+            # Memory-map : le fichier n'est pas copié en RAM avant d'être utilisé
+            with pa.memory_map(path, "r") as src:
+                table = ipc.open_file(src).read_all()
+        tail = self._read_tail(day)
+        if tail is not None:
+            table = tail if table is None else pa.concat_tables([table, tail], promote_options="default")
+            ts = table.column("ts").to_numpy()
+            if len(ts) > 1 and (np.diff(ts) < 0).any():
+                table = table.take(pa.array(np.argsort(ts, kind="stable")))
+        if table is None:
+            return None
+        if fields:
+            table = table.select([c for c in ["ts", "id"] + list(fields) if c in table.column_names])
+        return table
+
+    def read_range(self, t0=None, t1=None, fields=None):
+        # DataFrame (colonne "ts" en int64 ns UTC) pour t0 <= ts < t1
+        if not self.available:
+            return pd.DataFrame()
+        # Fichiers du jour trouvés et ouverts sous le verrou : le poller ne peut pas fusionner ni
+        # supprimer un segment entre les deux. Lecture en memory-map, sans copie : le verrou est
+        # tenu peu de temps, la conversion en DataFrame se fait après
+        with self.lock:
+            days = self.days()
+            if t0 is not None:
+                days = [d for d in days if d >= self.day_of(np.array([t0]))[0]]
+            if t1 is not None:
+                days = [d for d in days if d <= self.day_of(np.array([t1 - 1]))[0]]
+            tables = [t for t in (self._read_day(d, fields) for d in days) if t is not None and t.num_rows]
+        if not tables:
+            return pd.DataFrame()
+        df = pa.concat_tables(tables, promote_options="default").to_pandas()
+        keep = np.ones(len(df), dtype=bool)
+        if t0 is not None:
+            keep &= df["ts"].to_numpy() >= t0
+        if t1 is not None:
+            keep &= df["ts"].to_numpy() < t1
+        return df[keep].reset_index(drop=True)
+
+    def read_frame(self, t0=None, t1=None, fields=None):
+        # Même format que RingBuffer.frame() : dates locales calculées sur la plage lue seulement
+        df = self.read_range(t0, t1, fields)
+        if df.empty:
+            return df
+        utc = pd.to_datetime(df.pop("ts").to_numpy(), unit="ns", utc=True)
+        df["date_local"] = utc.tz_convert(self.tz)
+        df["date"] = df["date_local"].dt.tz_localize(None)
+        return df
+
+    def covers(self, t0, t1):
+        # Vrai si chaque jour de [t0, t1) est sur disque et couvert depuis son début (ou depuis t0)
+        if not self.available:
+            return False
+        for day in pd.date_range(pd.to_datetime(t0, unit="ns", utc=True).tz_convert(self.tz).normalize(),
+                                 pd.to_datetime(t1 - 1, unit="ns", utc=True).tz_convert(self.tz).normalize(),
+                                 freq="D"):
+            info = self.manifest.get(day.strftime("%Y-%m-%d"))
+            if info is None or info["covered_from"] > max(t0, day.value):
+                return False
+        return True
+
+    def last_id(self):
+        with self.lock:
+            ids = [info.get("last_id") for info in self.manifest.values() if info.get("last_id") is not None]
+        return max(ids) if ids else None
+
+    def last_ts(self):
+        with self.lock:
+            ts = [info.get("last_ts") for info in self.manifest.values() if info.get("last_ts") is not None]
+        return max(ts) if ts else None
+
+    # ---------- écriture ----------
+
+    def _to_table(self, ts, df):
+        cols = {"ts": pa.array(ts, type=pa.int64())}
+        for f, dt in NUMERIC_FIELDS.items():
+            if f in df.columns:
+                v = pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+                cols[f] = pa.array(v if dt != np.int64 else np.nan_to_num(v, nan=-1).astype(np.int64))
+        for f in CODED_FIELDS:
+            if f in df.columns:
+                cols[f] = pa.array(df[f].astype("string").to_numpy(dtype=object, na_value=None), type=pa.string())
+        return pa.table(cols)
+
+    def _write_day(self, day, table):
+        path = self._path(day)
+        tmp = path + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _merge(old, table):
+        # Concaténation sans doublons (même ts + même id), dans l'ordre du temps
+        table = pa.concat_tables([old, table], promote_options="default")
+        d = table.select(["ts", "id"] if "id" in table.column_names else ["ts"]).to_pandas()
+        keep = ~d.duplicated(keep="last").to_numpy()
+        order = np.argsort(d["ts"].to_numpy()[keep], kind="stable")
+        return table.filter(pa.array(keep)).take(pa.array(order))
+
+    def _close_tail(self, day):
+        cur = self.tails.pop(day, None)
+        if cur is not None:
+            sink, writer, _ = cur
+            writer.close()
+            sink.close()
+
+    def _compact_day(self, day):
+        # Segment en flux fusionné dans le fichier du jour (une réécriture du jour, une seule fois)
+        self._close_tail(day)
+        tail = self._read_tail(day)
+        if tail is not None and tail.num_rows:
+            path = self._path(day)
+            old = None
+            if os.path.exists(path):
+                with pa.memory_map(path, "r") as src:
+                    old = ipc.open_file(src).read_all()
+            self._write_day(day, tail if old is None else self._merge(old, tail))
+        try:
+            os.remove(self._tail_path(day))
+        except OSError:
+            pass
+
+    def _append(self, day, table):
+        # Ajout au bout du segment du jour : O(taille du lot)
+        cur = self.tails.get(day)
+        if cur is not None and cur[2] != table.schema:
+            # Colonnes différentes (champs de l'API changés) : nouveau segment
+            self._compact_day(day)
+            cur = None
+        if cur is None:
+            if os.path.exists(self._tail_path(day)):
+                self._compact_day(day)
+            sink = pa.OSFile(self._tail_path(day), "wb")
+            cur = self.tails[day] = (sink, ipc.new_stream(sink, table.schema), table.schema)
+        cur[1].write_table(table)
+        cur[0].flush()
+
+    def compact(self):
+        # Fusionne tous les segments ouverts (arrêt propre, tests)
+        with self.lock:
+            for day in list(self.tails):
+                self._compact_day(day)
+
+    def write(self, ts, df, covered_from=None):
+        # Ajoute un lot au(x) jour(s) concerné(s). covered_from : début de la plage garantie complète
+        # (None = lot qui suit directement le précédent, donc le jour reste couvert comme avant)
+        if not self.available or len(ts) == 0:
+            return
+        ts = np.asarray(ts, dtype=np.int64)
+        with self.lock:
+            days = self.day_of(ts)
+            for day in np.unique(days):
+                m = days == day
+                table = self._to_table(ts[m], df[m])
+                info = self.manifest.get(day)
+                if covered_from is None and info is not None:
+                    # Suite directe du lot précédent : seules les lignes pas encore écrites sont ajoutées
+                    last_id = info.get("last_id")
+                    if "id" in table.column_names and last_id is not None and last_id >= 0:
+                        table = table.filter(pc.greater(table.column("id"), last_id))
+                    elif info.get("last_ts") is not None:
+                        table = table.filter(pc.greater(table.column("ts"), info["last_ts"]))
+                    if table.num_rows == 0:
+                        continue
+                if covered_from is None:
+                    self._append(day, table)
+                else:
+                    # Rechargement / préchauffage (rare) : le jour est fusionné et réécrit en entier
+                    self._compact_day(day)
+                    old = self._read_day(day)
+                    if old is not None and old.num_rows:
+                        table = self._merge(old, table)
+                    self._write_day(day, table)
+
+                cf = self.day_start(day) if covered_from is None else max(self.day_start(day), int(covered_from))
+                info = self.manifest.get(day)
+                if info is None:
+                    info = {"covered_from": cf}
+                elif covered_from is not None:
+                    if info.get("last_ts", -1) < int(covered_from):
+                        # Trou entre l'ancien contenu du jour et ce lot : couvert seulement depuis ce lot
+                        info["covered_from"] = cf
+                    else:
+                        info["covered_from"] = min(info["covered_from"], cf)
+                info["last_ts"] = max(info.get("last_ts", -1), int(pc.max(table.column("ts")).as_py()))
+                if "id" in table.column_names:
+                    info["last_id"] = max(info.get("last_id", -1), int(pc.max(table.column("id")).as_py()))
+                self.manifest[day] = info
+            # Changement de jour : les segments des jours terminés sont fusionnés une fois pour toutes
+            for day in [d for d in self.tails if d < days.max()]:
+                self._compact_day(day)
+            self._save_manifest()
+
+    def write_df(self, df, covered_from=None):
+        if df.empty or "date" not in df.columns:
+            return
+        # "ts" déjà calculé au décodage de la réponse (schema.py) : pas de nouvelle analyse des dates
+        ts = df["ts"].to_numpy() if "ts" in df.columns else to_epoch_ns(df["date"].to_numpy(), self.tz)
+        self.write(ts, df.reset_index(drop=True), covered_from)
+
+    def mark_tail_incomplete(self):
+        # Le process a été arrêté trop longtemps : la fin du dernier jour manque, il sera retéléchargé
+        with self.lock:
+            days = self.days()
+            if days:
+                info = self.manifest[days[-1]]
+                info["covered_from"] = info.get("last_ts", info["covered_from"]) + 1
+                self._save_manifest()
+
+    def invalidate_tail(self):
+        # Bouton "Rafraîchir maintenant" : on jette seulement le dernier jour, le reste est figé
+        with self.lock:
+            days = self.days()
+            if not days:
+                return None
+            day = days[-1]
+            self._close_tail(day)
+            for path in (self._path(day), self._tail_path(day)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.manifest.pop(day, None)
+            self._save_manifest()
+            return day
+
+    # ---------- préchauffage ----------
+
+    def warm(self, fetch_day, days_back, today=None, on_day=None, then=None):
+        # fetch_day(début, fin) -> DataFrame de l'API ; on télécharge les jours passés manquants
+        # on_day(jour) est appelé après chaque jour écrit, then() à la fin (ex. agrégats)
+        if not self.available:
+            if then is not None:
+                then()
+            return
+        today = today or pd.Timestamp.now(tz=self.tz).normalize().tz_localize(None)
+        for k in range(int(days_back), 0, -1):
+            start = today - pd.Timedelta(days=k)
+            day = start.strftime("%Y-%m-%d")
+            info = self.manifest.get(day)
+            if info is not None and info["covered_from"] <= self.day_start(day):
+                continue
+            try:
+                df = fetch_day(start, start + pd.Timedelta(days=1))
+            except Exception:
+                continue
+            if df.empty:
+                continue
+            self.write_df(df, covered_from=self.day_start(day))
+            if on_day is not None:
+                on_day(day)
+        if then is not None:
+            then()
+
+    def warm_async(self, fetch_day, days_back, on_day=None, then=None):
+        t = threading.Thread(target=self.warm, args=(fetch_day, days_back),
+                             kwargs={"on_day": on_day, "then": then}, name="hvac-disk-warm", daemon=True)
+        t.start()
+        return t
@@ -0,0 +1,121 @@
+# Réduction du nombre de points des graphes (LFRAH & IQBAL)
+# On découpe l'axe du temps en seaux selon la plage affichée et la largeur du graphe,
+# puis on garde soit le min/max de chaque seau, soit les points LTTB.
+
+import numpy as np
+import pandas as pd
+
+MODES = ["minmax", "lttb"]
+
+
+def bucket_ns(t_min, t_max, width_px, min_bucket_s=1.0):
+    # Un seau par pixel : en dessous, les points se superposent de toute façon
+    span = max(int(t_max) - int(t_min), 1)
+    return max(int(np.ceil(span / max(int(width_px), 1))), int(min_bucket_s * 1e9))
+
+
+def epoch_ns(s):
+    # Dates pandas (avec ou sans timezone) -> int64 en nanosecondes UTC
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        s = s.dt.tz_convert("UTC").dt.tz_localize(None)
+    return s.astype("datetime64[ns]").to_numpy().view(np.int64)
+
+
+def minmax_indices(t, y, width_px):
+    # t en int64 (ns), y en float ; on garde le premier, le dernier, et min + max de chaque seau
+    n = len(t)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    b = (t - t[0]) // bucket_ns(t[0], t[-1], width_px)
+    idx_max = pd.Series(y).fillna(-np.inf).groupby(b, sort=False).idxmax().to_numpy()
+    idx_min = pd.Series(y).fillna(np.inf).groupby(b, sort=False).idxmin().to_numpy()
+    return np.unique(np.concatenate([[0, n - 1], idx_min, idx_max]))
+
+
+def lttb_indices(t, y, width_px):
+    # Largest-Triangle-Three-Buckets : un point par seau, celui qui forme le plus grand triangle.
+    # Mêmes seaux de temps que minmax_indices : un trou ou une cadence irrégulière donne la même
+    # densité dans les deux modes (un seau sans mesure n'a pas de point)
+    n = len(t)
+    if n < 3:
+        return np.arange(n)
+    b = (t[1:-1] - t[0]) // bucket_ns(t[0], t[-1], width_px)
+    starts = 1 + np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    if len(starts) >= n - 2:
+        return np.arange(n)
+    # Seau k = [bounds[k], bounds[k + 1]) ; le dernier point est seul après le dernier seau
+    bounds = np.r_[starts, n - 1]
+
+    x = t.astype(np.float64)
+    y = y.astype(np.float64)
+    # Un trou de mesures (NaN) ne compte pas dans les triangles : remplacé par 0, il serait
+    # toujours choisi et dessinerait une fausse chute à zéro
+    ok = ~np.isnan(y)
+    out = np.empty(len(starts) + 2, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+
+    a = 0
+    for i in range(len(starts)):
+        lo, hi = bounds[i], bounds[i + 1]
+        nxt_lo, nxt_hi = hi, bounds[i + 2] if i + 2 < len(bounds) else n
+        nxt = ok[nxt_lo:nxt_hi]
+        if not ok[lo:hi].any():
+            # Seau entièrement vide : on garde un NaN, le graphe montre le trou
+            out[i + 1] = lo
+            continue
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi][nxt].mean() if nxt.any() else np.nan
+        ya = y[a]
+        if np.isnan(ya):
+            ya = avg_y if not np.isnan(avg_y) else y[lo:hi][ok[lo:hi]].mean()
+        if np.isnan(avg_y):
+            avg_y = ya
+
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - ya) - (x[a] - x[lo:hi]) * (avg_y - ya))
+        a = lo + int(np.argmax(np.where(ok[lo:hi], area, -1.0)))
+        out[i + 1] = a
+    return out
+
+
+def gap_indices(values):
+    # Premier point de chaque trou (NaN) : gardé pour que la ligne se coupe au lieu de relier le trou
+    nan = np.isnan(values)
+    if not nan.any():
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(nan & ~np.r_[False, nan[:-1]])
+
+
+def edge_indices(values):
+    # Indices où une valeur d'état change (ex : front montant/descendant de l'alarme)
+    v = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy()
+    if len(v) < 2:
+        return np.arange(len(v))
+    ch = np.flatnonzero(v[1:] != v[:-1])
+    return np.unique(np.concatenate([ch, ch + 1]))
+
+
+def downsample(df, x, y, mode="minmax", width_px=1200, edge_col="alarme"):
+    if df.empty or x not in df.columns or y not in df.columns:
+        return df
+
+    # Assez peu de points : rien à faire
+    max_points = 2 * int(width_px)
+    if len(df) <= max_points:
+        return df
+
+    d = df[df[x].notna()]
+    t = epoch_ns(d[x])
+    vals = pd.to_numeric(d[y], errors="coerce").to_numpy(dtype=np.float64)
+
+    if mode == "lttb":
+        idx = lttb_indices(t, vals, width_px)
+    else:
+        idx = minmax_indices(t, vals, width_px)
+
+    # On ne perd jamais un trou de mesures ni un changement d'état d'alarme
+    idx = np.union1d(idx, gap_indices(vals))
+    if edge_col and edge_col in d.columns:
+        idx = np.union1d(idx, edge_indices(d[edge_col]))
+
+    return d.iloc[idx]
@@ -0,0 +1,262 @@
+# Marche du moteur et énergie estimée à partir de motor_speed (LFRAH & IQBAL)
+# Chaque mesure vaut jusqu'à la suivante (intégration sur l'intervalle d'échantillonnage) : par jour on
+# garde le temps passé à chaque valeur PWM (256 cases), les démarrages / arrêts et la plus longue marche
+# continue. Taux de marche, plages de vitesse et énergie (courbe PWM -> W réglable) s'en déduisent à la
+# requête : changer la courbe ne demande aucun recalcul, et une année se relit en un produit matriciel.
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rollups import DAY_NS, local_ns
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+PWM = np.arange(256)
+# Plages de vitesse affichées (bornes PWM incluses)
+BANDS = (("arrêt", 0, 0), ("lente", 1, 85), ("moyenne", 86, 170), ("rapide", 171, 255))
+# Courbe par défaut : ventilateur 90 W, puissance ~ vitesse³ (lois de similitude)
+DEFAULT_CURVE = ((0, 0.0), (64, 2.0), (128, 12.0), (192, 38.0), (255, 90.0))
+CONTINU = 0.95              # taux de marche à partir duquel un jour est signalé "en continu"
+
+
+def parse_curve(value):
+    # Secret MOTOR_POWER_CURVE : [[pwm, W], ...] ou "0:0, 128:12, 255:90" -> ((pwm, W), ...) trié
+    if not value:
+        return DEFAULT_CURVE
+    try:
+        if isinstance(value, str):
+            points = [p.split(":") for p in value.replace(";", ",").split(",") if p.strip()]
+        else:
+            points = list(value)
+        curve = tuple(sorted((float(p), float(w)) for p, w in points))
+    except (TypeError, ValueError):
+        return DEFAULT_CURVE
+    return curve or DEFAULT_CURVE
+
+
+def watts(curve):
+    # Puissance estimée pour chaque valeur PWM 0..255 (interpolation linéaire)
+    p, w = zip(*curve)
+    return np.interp(PWM, p, w)
+
+
+def empty_day():
+    return {"hist": np.zeros(256), "starts": 0, "stops": 0, "max_run_s": 0.0}
+
+
+def integrate(ts, speed, prev=None, run_s=0.0, max_gap_ns=60 * 10**9, tz="Europe/Brussels"):
+    # Un écart de plus de max_gap_ns entre deux mesures est un trou (capteur muet) : pas compté.
+    # ts triés (ns UTC), speed en PWM ; prev = dernière mesure du lot précédent (ts, speed),
+    # run_s = marche continue en cours à la fin du lot précédent.
+    # -> ({jour: stats}, nouvelle dernière mesure, nouvelle marche en cours)
+    ok = ~np.isnan(speed)
+    ts, speed = ts[ok], speed[ok]
+    if prev is not None:
+        ts, speed = np.r_[prev[0], ts], np.r_[prev[1], speed]
+    if len(ts) < 2:
+        return {}, ((int(ts[-1]), float(speed[-1])) if len(ts) else prev), run_s
+
+    pwm = np.clip(np.rint(speed), 0, 255).astype(np.int64)
+    on = pwm > 0
+    # Intervalle i = [ts[i], ts[i+1]) à la vitesse de ts[i], compté dans le jour où il commence
+    dt = np.diff(ts)
+    dt = np.where(dt <= max_gap_ns, dt, 0) / 1e9
+    p, o = pwm[:-1], on[:-1]
+    # Jour local de chaque mesure en entier : le texte "YYYY-MM-DD" n'est formaté qu'une fois par jour.
+    # Les jours viennent de toutes les mesures, dernière comprise : un démarrage sur la toute
+    # dernière mesure compte dans son propre jour, même si ce jour n'a pas encore d'intervalle
+    jour = local_ns(ts, tz) // DAY_NS
+    uniques, code_tout = np.unique(jour, return_inverse=True)
+    code, code_fin = code_tout[:-1], code_tout[1:]
+    jours = pd.to_datetime(uniques * DAY_NS, unit="ns").strftime("%Y-%m-%d")
+
+    # Marche continue : somme des intervalles "en marche" depuis le dernier intervalle à l'arrêt
+    # (un trou de mesures coupe aussi la marche)
+    dur = dt * o
+    coupe = ~o | (dt == 0)
+    cs = np.cumsum(dur)
+    base = np.maximum.accumulate(np.where(coupe, cs, 0.0))
+    continu = cs - base + np.where(np.cumsum(coupe) == 0, run_s, 0.0)
+
+    # Démarrages / arrêts : changement d'état entre deux mesures, compté le jour de la seconde
+    starts = np.bincount(code_fin, weights=(~o & on[1:]).astype(np.float64), minlength=len(jours))
+    stops = np.bincount(code_fin, weights=(o & ~on[1:]).astype(np.float64), minlength=len(jours))
+
+    out = {}
+    for k, day in enumerate(jours):
+        m = code == k
+        out[day] = {
+            "hist": np.bincount(p[m], weights=dt[m], minlength=256),
+            "starts": int(starts[k]),
+            "stops": int(stops[k]),
+            "max_run_s": float(continu[m].max()) if m.any() else 0.0,
+        }
+    run_s = float(continu[-1]) if on[-1] and not coupe[-1] else 0.0
+    return out, (int(ts[-1]), float(speed[-1])), run_s
+
+
+class MotorStats:
+    def __init__(self, root=None, tz="Europe/Brussels", max_gap_s=60):
+        self.root = root
+        self.tz = tz
+        self.max_gap_ns = int(max_gap_s * 10**9)
+        self.days = {}      # "YYYY-MM-DD" -> {"hist": secondes par valeur PWM, "starts", "stops", "max_run_s"}
+        self.saved = set()
+        self.last_ts = None
+        self.prev = None    # dernière mesure vue (ts, vitesse) : l'intervalle suivant part d'elle
+        self.run_s = 0.0    # marche continue en cours
+        self.lock = threading.Lock()
+        if self.root and pa is not None:
+            os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def _speed(df):
+        if "motor_speed" not in df.columns:
+            return None
+        return pd.to_numeric(df["motor_speed"], errors="coerce").to_numpy(dtype=np.float64)
+
+    def add(self, ts, df):
+        # Mise à jour incrémentale : seules les lignes plus récentes que le dernier lot sont intégrées
+        ts = np.asarray(ts, dtype=np.int64)
+        speed = self._speed(df)
+        if len(ts) == 0 or speed is None:
+            return
+        order = np.argsort(ts, kind="stable")
+        ts, speed = ts[order], speed[order]
+        with self.lock:
+            if self.last_ts is not None:
+                keep = ts > self.last_ts
+                if not keep.any():
+                    return
+                ts, speed = ts[keep], speed[keep]
+            days, self.prev, self.run_s = integrate(ts, speed, self.prev, self.run_s, self.max_gap_ns, self.tz)
+            for day, s in days.items():
+                if day in self.saved:
+                    continue
+                cur = self.days.setdefault(day, empty_day())
+                cur["hist"] = cur["hist"] + s["hist"]
+                cur["starts"] += s["starts"]
+                cur["stops"] += s["stops"]
+                cur["max_run_s"] = max(cur["max_run_s"], s["max_run_s"])
+            self.last_ts = int(ts[-1])
+            if days:
+                self._save_finished(max(days))
+
+    def replace_day(self, day, ts, df):
+        # Recalcul complet d'un jour (préchauffage) : idempotent, pas de double comptage.
+        # ts / df peuvent déborder sur les jours voisins : seules les stats de `day` sont gardées
+        ts = np.asarray(ts, dtype=np.int64)
+        speed = self._speed(df)
+        if len(ts) == 0 or speed is None:
+            return
+        order = np.argsort(ts, kind="stable")
+        days, _, _ = integrate(ts[order], speed[order], max_gap_ns=self.max_gap_ns, tz=self.tz)
+        with self.lock:
+            self.days[day] = days.get(day, empty_day())
+            self.saved.discard(day)
+            today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+            self._save_finished(today)
+
+    def _save_finished(self, current_day):
+        for day in [d for d in self.days if d < current_day and d not in self.saved]:
+            self._save_day(day)
+            self.saved.add(day)
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day}.arrow")
+
+    def _save_day(self, day):
+        if not self.root or pa is None:
+            return
+        s = self.days[day]
+        table = pa.table({"seconds": s["hist"]}).replace_schema_metadata(
+            {k: str(s[k]) for k in ("starts", "stops", "max_run_s")})
+        tmp = self._path(day) + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self._path(day))
+
+    def load(self):
+        if not self.root or pa is None or not os.path.isdir(self.root):
+            return self
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".arrow"):
+                continue
+            day = name[:-len(".arrow")]
+            with pa.memory_map(self._path(day), "r") as src:
+                table = ipc.open_file(src).read_all()
+            meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+            self.days[day] = {
+                "hist": table.column("seconds").to_numpy(),
+                "starts": int(meta.get("starts", 0)),
+                "stops": int(meta.get("stops", 0)),
+                "max_run_s": float(meta.get("max_run_s", 0.0)),
+            }
+            self.saved.add(day)
+        return self
+
+    def backfill(self, disk):
+        today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+        for day in disk.days():
+            if day < today and day not in self.saved:
+                self.rebuild_day(disk, day)
+
+    def rebuild_day(self, disk, day):
+        # Lecture débordant d'un écart max de chaque côté : le démarrage / arrêt sur la première mesure
+        # du jour (transition depuis la veille) et le dernier intervalle (jusqu'au lendemain) sont comptés
+        t0 = disk.day_start(day)
+        df = disk.read_range(t0 - self.max_gap_ns, t0 + DAY_NS + self.max_gap_ns)
+        if not df.empty:
+            self.replace_day(day, df["ts"].to_numpy(), df)
+
+    def running_for(self):
+        # Durée (s) de la marche continue en cours, 0 si le moteur est à l'arrêt
+        with self.lock:
+            return self.run_s
+
+    def query(self, start, end, curve=DEFAULT_CURVE, freq="D"):
+        # start / end : dates locales (fin exclue) ; freq "D" (jour) ou "W" (semaine du lundi)
+        d0, d1 = pd.Timestamp(start).strftime("%Y-%m-%d"), pd.Timestamp(end).strftime("%Y-%m-%d")
+        with self.lock:
+            keys = [d for d in sorted(self.days) if d0 <= d < d1]
+            if not keys:
+                return pd.DataFrame()
+            hist = np.vstack([self.days[d]["hist"] for d in keys])
+            extra = pd.DataFrame([{k: self.days[d][k] for k in ("starts", "stops", "max_run_s")} for d in keys])
+
+        periode = pd.to_datetime(pd.Series(keys))
+        if freq == "W":
+            periode = periode - pd.to_timedelta(periode.dt.weekday, unit="D")
+        groupes = periode.to_numpy()
+        uniques, code = np.unique(groupes, return_inverse=True)
+        h = np.zeros((len(uniques), 256))
+        np.add.at(h, code, hist)
+        agg = extra.groupby(code).agg(starts=("starts", "sum"), stops=("stops", "sum"), max_run_s=("max_run_s", "max"))
+
+        # Tout le reste en produits matriciels sur l'histogramme PWM
+        couvert = h.sum(axis=1)
+        marche = h[:, 1:].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = pd.DataFrame({
+                "periode": uniques,
+                "mesure_h": couvert / 3600,
+                "marche_h": marche / 3600,
+                "taux_marche": marche / np.where(couvert > 0, couvert, np.nan),
+                "vitesse_moy": h[:, 1:] @ PWM[1:] / np.where(marche > 0, marche, np.nan),
+                "energie_kwh": h @ watts(curve) / 3.6e6,
+                "demarrages": agg["starts"].to_numpy(dtype=np.int64),
+                "arrets": agg["stops"].to_numpy(dtype=np.int64),
+                "marche_continue_max_h": agg["max_run_s"].to_numpy() / 3600,
+            })
+        for nom, lo, hi in BANDS:
+            out[f"{nom}_h"] = h[:, lo:hi + 1].sum(axis=1) / 3600
+        return out
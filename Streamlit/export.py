@@ -0,0 +1,120 @@
+# Export de l'historique en CSV / Parquet, morceau par morceau (LFRAH & IQBAL)
+# Les morceaux sont lus (disque ou API), écrits dans un fichier puis oubliés : la RAM reste petite.
+
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_COLUMNS = ["id", "date", "mode", "temperature_lt", "humidite_lt", "gaz", "motor_speed", "alarme"]
+CHUNK_HOURS = 6
+
+# Schéma fixe : un morceau sans "mode" ou sans "id" ne doit pas changer les types du fichier
+SCHEMA = None
+if pa is not None:
+    SCHEMA = pa.schema([("id", pa.int64()), ("date", pa.string()), ("mode", pa.string())] +
+                       [(c, pa.float64()) for c in EXPORT_COLUMNS[3:]])
+
+
+def windows(start, end, hours=CHUNK_HOURS):
+    # Découpe [start, end) en fenêtres de quelques heures
+    t = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    while t < end:
+        nxt = min(t + pd.Timedelta(hours=hours), end)
+        yield t, nxt
+        t = nxt
+
+
+def iter_chunks(start, end, read_disk=None, fetch_api=None, hours=CHUNK_HOURS):
+    # Générateur : chaque fenêtre vient du cache disque si possible, sinon de l'API
+    for w0, w1 in windows(start, end, hours):
+        df = read_disk(w0, w1) if read_disk is not None else None
+        if df is None:
+            df = fetch_api(w0, w1)
+        if df is not None and not df.empty:
+            yield w0, w1, normalize(df)
+
+
+def normalize(df):
+    # Même colonnes et mêmes types pour chaque morceau (obligatoire pour Parquet)
+    n = len(df)
+    out = {}
+    if "date_local" in df.columns:
+        dates = df["date_local"]
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        out["date"] = dates.dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    else:
+        out["date"] = df["date"].astype("string").to_numpy(dtype=object, na_value=None)
+    out["id"] = pd.to_numeric(df["id"], errors="coerce").astype("Int64").array if "id" in df.columns \
+        else pd.array([pd.NA] * n, dtype="Int64")
+    out["mode"] = df["mode"].astype("string").to_numpy(dtype=object, na_value=None) if "mode" in df.columns \
+        else np.full(n, None, dtype=object)
+    for c in EXPORT_COLUMNS[3:]:
+        out[c] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) if c in df.columns \
+            else np.full(n, np.nan)
+    return pd.DataFrame(out)[EXPORT_COLUMNS]
+
+
+def export_file(chunks, path, fmt="csv", total=None, progress=None):
+    # Écrit les morceaux au fur et à mesure ; progress(fraction, lignes) pour la barre de progression
+    rows = 0
+    writer = None
+    done = 0
+    try:
+        if fmt == "parquet":
+            if pq is None:
+                raise RuntimeError("pyarrow n'est pas installé (export Parquet indisponible)")
+            for w0, w1, df in chunks:
+                table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+                writer.write_table(table)
+                rows += len(df)
+                done += 1
+                if progress is not None:
+                    progress(done / total if total else 0.0, rows)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                first = True
+                for w0, w1, df in chunks:
+                    df.to_csv(f, index=False, header=first)
+                    first = False
+                    rows += len(df)
+                    done += 1
+                    if progress is not None:
+                        progress(done / total if total else 0.0, rows)
+                if first:
+                    f.write(",".join(EXPORT_COLUMNS) + "\n")
+    finally:
+        if writer is not None:
+            writer.close()
+    if fmt == "parquet" and writer is None:
+        # Période vide : fichier Parquet vide mais valide
+        pq.write_table(SCHEMA.empty_table(), path)
+    return rows
+
+
+def new_export_path(folder, start, end, fmt, keep_seconds=3600):
+    # Fichier temporaire (hors de static/) ; on supprime au passage les exports de plus d'une heure
+    os.makedirs(folder, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(folder):
+        p = os.path.join(folder, name)
+        try:
+            if now - os.path.getmtime(p) > keep_seconds:
+                os.remove(p)
+        except OSError:
+            pass
+    name = f"mesures_hvac_{pd.Timestamp(start):%Y%m%d}_{pd.Timestamp(end):%Y%m%d}_{uuid.uuid4().hex[:8]}.{fmt}"
+    return os.path.join(folder, name)
@@ -0,0 +1,241 @@
+# Faux Node-RED local pour développer / tester le dashboard sans la VM Azure (LFRAH & IQBAL)
+# Lancement : python fake_nodered.py --port 1880
+# Puis dans .streamlit/secrets.toml :
+#   API_LATEST = "http://127.0.0.1:1880/latest"
+#   API_HISTORY = "http://127.0.0.1:1880/history"
+#   API_CMD = "http://127.0.0.1:1880/cmd"
+#   API_SALLE_CMD = "http://127.0.0.1:1880/salle"
+#   API_EVENTS = "http://127.0.0.1:1880/events"
+
+import argparse
+import json
+import math
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+DATE_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def now_local():
+    # Comme MariaDB : heure locale de Bruxelles, sans timezone
+    return datetime.now(ZoneInfo("Europe/Brussels")).replace(tzinfo=None, microsecond=0)
+
+
+def make_row(i, when, target_speed=120, mode="eco", rnd=random):
+    # Une mesure "réaliste" : cycle jour/nuit sur la température, pics de gaz de temps en temps
+    h = when.hour + when.minute / 60
+    temp = 22 + 3 * math.sin((h - 9) / 24 * 2 * math.pi) + rnd.gauss(0, 0.3)
+    hum = 50 - 8 * math.sin((h - 9) / 24 * 2 * math.pi) + rnd.gauss(0, 1.0)
+    gaz = 450 + rnd.gauss(0, 40)
+    if rnd.random() < 0.002:
+        gaz = rnd.uniform(3000, 4095)
+    return {
+        "id": i,
+        "date": when.strftime(DATE_FMT),
+        "mode": mode,
+        "temperature_lt": round(temp, 1),
+        "humidite_lt": round(max(0, min(100, hum)), 1),
+        "gaz": int(max(0, min(4095, gaz))),
+        "motor_speed": int(target_speed),
+        "alarme": 1 if gaz > 3000 else 0,
+    }
+
+
+class FakeNodeRed:
+    def __init__(self, history_hours=24.0, interval=2.0, seed=0, delay=0.0):
+        self.interval = float(interval)
+        self.delay = float(delay)  # latence simulée (Node-RED lent)
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.settings = {"lampMode": "auto", "brightness": 30, "tempT1": 18.0, "tempT2": 24.0,
+                         "tempT3": 28.0, "humH1": 40.0, "humH2": 70.0}
+        self.target_speed = 120
+        self.mute = 0
+        self.commands = []
+        self.subscribers = []
+        self.rows = []
+        now = now_local()
+        n = int(history_hours * 3600 / self.interval)
+        for k in range(n):
+            self.rows.append(make_row(k + 1, now - timedelta(seconds=(n - k) * self.interval),
+                                      self.target_speed, rnd=self.rnd))
+
+    def latest(self):
+        with self.lock:
+            row = dict(self.rows[-1]) if self.rows else {}
+        row.update(self.settings)
+        row["mute"] = self.mute
+        return row
+
+    def add_row(self):
+        with self.lock:
+            prev = self.rows[-1] if self.rows else None
+            row = make_row(prev["id"] + 1 if prev else 1, now_local(),
+                           self.target_speed, rnd=self.rnd)
+            self.rows.append(row)
+        self.publish("measure", row)
+        if prev is not None and prev["alarme"] != row["alarme"]:
+            self.publish("alarm", {"alarme": row["alarme"], "date": row["date"]})
+        return row
+
+    def publish(self, event, data):
+        for q in list(self.subscribers):
+            q.put((event, data))
+
+    def query(self, q):
+        # Mêmes paramètres que l'API réelle : since / from / to / fields / limit / order
+        with self.lock:
+            rows = self.rows
+            if "since" in q:
+                since = q["since"][0]
+                try:
+                    since_id = int(since)
+                except ValueError:
+                    return None
+                # Les id sont consécutifs : on saute directement au bon endroit
+                first = rows[0]["id"] if rows else 0
+                rows = rows[max(since_id - first + 1, 0):]
+            if "from" in q:
+                rows = [r for r in rows if r["date"] >= q["from"][0]]
+            if "to" in q:
+                rows = [r for r in rows if r["date"] < q["to"][0]]
+            if q.get("order", ["asc"])[0] == "desc":
+                rows = rows[::-1]
+            if "limit" in q:
+                rows = rows[-int(q["limit"][0]):] if q.get("order", ["asc"])[0] == "asc" else rows[:int(q["limit"][0])]
+            if "fields" in q:
+                keep = q["fields"][0].split(",")
+                rows = [{k: r[k] for k in keep if k in r} for r in rows]
+            return list(rows)
+
+    def history_body(self, q):
+        # Corps de /history dans le format demandé (None = curseur invalide -> 400)
+        rows = self.query(q)
+        if rows is None:
+            return None
+        fmt = q.get("format", ["json"])[0]
+        if fmt == "columns":
+            keys = list(dict.fromkeys(k for r in rows for k in r))
+            return json.dumps({k: [r.get(k) for r in rows] for k in keys}).encode("utf-8")
+        if fmt == "ndjson":
+            return "".join(json.dumps(r) + "\n" for r in rows).encode("utf-8")
+        return json.dumps(rows).encode("utf-8")
+
+    def handler(self):
+        app = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, body, status=200):
+                self._send(json.dumps(body).encode("utf-8"), status)
+
+            def _send(self, data, status=200, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                q = parse_qs(u.query)
+                if app.delay and u.path != "/events":
+                    time.sleep(app.delay)
+                if u.path == "/latest":
+                    self._json(app.latest())
+                elif u.path == "/history":
+                    body = app.history_body(q)
+                    if body is None:
+                        self._json({"error": "curseur invalide"}, 400)
+                    elif q.get("format", ["json"])[0] == "ndjson":
+                        self._send(body, content_type="application/x-ndjson")
+                    else:
+                        self._send(body)
+                elif u.path == "/events":
+                    self._events()
+                else:
+                    self._json({"error": "introuvable"}, 404)
+
+            def _events(self):
+                # Server-Sent Events : une ligne "event:" + "data:" par nouvelle mesure
+                sub = queue.Queue()
+                app.subscribers.append(sub)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    self.wfile.write(b"retry: 2000\n\n")
+                    self.wfile.flush()
+                    while True:
+                        try:
+                            event, data = sub.get(timeout=15)
+                        except queue.Empty:
+                            self.wfile.write(b": keepalive\n\n")
+                        else:
+                            msg = f"id: {data.get('id', '')}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                            self.wfile.write(msg.encode("utf-8"))
+                        self.wfile.flush()
+                except OSError:
+                    pass
+                finally:
+                    app.subscribers.remove(sub)
+
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length", 0) or 0)
+                try:
+                    body = json.loads(self.rfile.read(n) or b"{}")
+                except ValueError:
+                    self._json({"error": "JSON invalide"}, 400)
+                    return
+                app.commands.append((self.path, body, dict(self.headers)))
+                if self.path.startswith("/cmd"):
+                    app.target_speed = int(body.get("target_speed", app.target_speed))
+                    app.mute = int(body.get("mute", app.mute))
+                elif self.path.startswith("/salle"):
+                    app.settings.update({k: v for k, v in body.items() if k in app.settings})
+                self._json({"ok": True})
+
+        return Handler
+
+    def run_generator(self):
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                self.add_row()
+        threading.Thread(target=loop, name="fake-nodered-gen", daemon=True).start()
+
+    def serve(self, host="127.0.0.1", port=1880, generate=True):
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-nodered", daemon=True).start()
+        if generate:
+            self.run_generator()
+        return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux Node-RED pour le dashboard HVAC")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1880)
+    parser.add_argument("--interval", type=float, default=2.0, help="secondes entre deux mesures")
+    parser.add_argument("--history-hours", type=float, default=24.0)
+    parser.add_argument("--delay", type=float, default=0.0, help="latence ajoutée à chaque GET (s)")
+    args = parser.parse_args()
+
+    fake = FakeNodeRed(args.history_hours, args.interval, delay=args.delay)
+    srv = fake.serve(args.host, args.port)
+    print(f"Faux Node-RED sur http://{args.host}:{srv.server_port} ({len(fake.rows)} mesures)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
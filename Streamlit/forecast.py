@@ -0,0 +1,211 @@
+# Prévisions température / humidité / gaz sur les prochaines heures (LFRAH & IQBAL)
+# Holt-Winters additif (niveau + tendance amortie + profil journalier) sur les agrégats 15 min.
+# Le modèle avance seau par seau : à chaque rerun on ne lui donne que les seaux terminés depuis
+# la dernière fois. Seul le premier appel parcourt tout l'historique (un an = 35 000 seaux).
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+RES = "15min"
+STEP_NS = 900 * 10**9
+SEASON = 96                 # seaux 15 min par jour
+DAY_NS = 86400 * 10**9
+FIELDS = ["temperature_lt", "humidite_lt", "gaz"]
+PHI = 0.98                  # amortissement de la tendance (pas de droite qui part à l'infini)
+# Couples (alpha, beta, gamma) essayés au premier calage, sur les derniers jours
+GRID = [(a, b, g) for a in (0.1, 0.3, 0.6) for b in (0.01, 0.05) for g in (0.05, 0.2)]
+TUNE_DAYS = 14
+MAX_GAP_DAYS = 7            # au-delà, le modèle repart de zéro plutôt que d'extrapoler le trou
+Z90 = 1.2816                # bande 10 % – 90 %
+
+
+def seasonal_start(y, slot):
+    # Niveau et profil journalier de départ : moyenne par créneau horaire sur la première semaine
+    n = min(len(y), 7 * SEASON)
+    y, slot = y[:n], slot[:n]
+    ok = ~np.isnan(y)
+    if not ok.any():
+        return None, np.zeros(SEASON)
+    level = float(y[ok].mean())
+    somme = np.bincount(slot[ok], weights=y[ok] - level, minlength=SEASON)
+    nombre = np.bincount(slot[ok], minlength=SEASON)
+    season = np.divide(somme, nombre, out=np.zeros(SEASON), where=nombre > 0)
+    return level, season
+
+
+def tune(y, slot):
+    # Tous les couples de GRID en même temps (une colonne NumPy par couple), erreur à un pas
+    level, season = seasonal_start(y, slot)
+    if level is None:
+        return GRID[0]
+    a, b, g = (np.array(p, dtype=np.float64) for p in zip(*GRID))
+    k = len(GRID)
+    lv, tr = np.full(k, level), np.zeros(k)
+    se = np.tile(season, (k, 1))
+    rows = np.arange(k)
+    sse = np.zeros(k)
+    for i, (v, s) in enumerate(zip(y, slot)):
+        f = lv + PHI * tr + se[:, s]
+        if v != v:
+            lv = lv + PHI * tr
+            tr = PHI * tr
+            continue
+        if i >= SEASON:
+            sse += (v - f) ** 2
+        nl = a * (v - se[:, s]) + (1 - a) * (lv + PHI * tr)
+        tr = b * (nl - lv) + (1 - b) * PHI * tr
+        se[rows, s] = g * (v - nl) + (1 - g) * se[:, s]
+        lv = nl
+    return GRID[int(np.argmin(sse))]
+
+
+class HoltWinters:
+    def __init__(self, alpha, beta, gamma):
+        self.alpha, self.beta, self.gamma = alpha, beta, gamma
+        self.level = None
+        self.trend = 0.0
+        self.season = [0.0] * SEASON
+        self.var = None     # variance (moyenne mobile) de l'erreur à un pas
+        self.n = 0
+
+    def start(self, y, slot):
+        level, season = seasonal_start(y, slot)
+        self.level = level
+        self.season = season.tolist()
+
+    def step(self, v, s):
+        # Un seau : v = moyenne 15 min (NaN si le seau est vide), s = créneau dans la journée
+        if self.level is None:
+            if v == v:
+                self.level = float(v)
+            return
+        a, b, g = self.alpha, self.beta, self.gamma
+        prev = self.level + PHI * self.trend
+        if v != v:
+            # Trou : on laisse avancer le modèle sans le corriger
+            self.level, self.trend = prev, PHI * self.trend
+            return
+        err = v - prev - self.season[s]
+        self.var = err * err if self.var is None else 0.98 * self.var + 0.02 * err * err
+        level = a * (v - self.season[s]) + (1 - a) * prev
+        self.trend = b * (level - self.level) + (1 - b) * PHI * self.trend
+        self.season[s] = g * (v - level) + (1 - g) * self.season[s]
+        self.level = level
+        self.n += 1
+
+    def feed(self, y, slot):
+        step = self.step
+        for v, s in zip(y.tolist(), slot.tolist()):
+            step(v, s)
+
+    def forecast(self, slots):
+        # Moyenne et écart type pour h = 1..len(slots) seaux après le dernier seau vu
+        h = np.arange(1, len(slots) + 1)
+        damp = np.cumsum(PHI ** h)
+        mean = self.level + damp * self.trend + np.asarray(self.season)[slots]
+        sigma = np.sqrt((self.var or 0.0) * (1 + (h - 1) * self.alpha ** 2))
+        return mean, sigma
+
+
+class Forecaster:
+    # Un par salle (st.cache_resource) : les modèles survivent aux reruns et aux sessions
+    def __init__(self, fields=FIELDS, tz="Europe/Brussels"):
+        self.fields = list(fields)
+        self.tz = tz
+        self.models = {}
+        self.last_bucket = None     # début (ns heure locale) du dernier seau donné aux modèles
+        self.lock = threading.Lock()
+
+    def update(self, rollups):
+        # Donne aux modèles les seaux 15 min terminés depuis le dernier appel
+        if rollups is None or rollups.last_ts is None:
+            return 0
+        with self.lock:
+            now = pd.Timestamp(rollups.last_ts, tz="UTC").tz_convert(self.tz).tz_localize(None).value
+            courant = now // STEP_NS * STEP_NS
+            if self.last_bucket is None:
+                jours = sorted(rollups.days)
+                if not jours:
+                    return 0
+                debut = pd.Timestamp(jours[0])
+            else:
+                debut = pd.Timestamp(self.last_bucket + STEP_NS)
+            if debut.value >= courant:
+                return 0
+            r = rollups.query(debut, pd.Timestamp(courant), RES, self.fields)
+            if r.empty:
+                return 0
+            seaux = r["date_local"].dt.tz_localize(None).astype("datetime64[ns]").to_numpy().view(np.int64)
+            # Grille régulière : un seau vide reste NaN (le modèle avance sans correction)
+            t0 = seaux[0] if self.last_bucket is None else self.last_bucket + STEP_NS
+            if self.last_bucket is not None and t0 < seaux[0] - MAX_GAP_DAYS * DAY_NS:
+                self.models, self.last_bucket = {}, None
+                t0 = seaux[0]
+            grille = np.arange(t0, seaux[-1] + STEP_NS, STEP_NS, dtype=np.int64)
+            pos = (seaux - t0) // STEP_NS
+            slot = (grille % DAY_NS // STEP_NS).astype(np.int64)
+            for f in self.fields:
+                if f"{f}_mean" not in r.columns:
+                    continue
+                y = np.full(len(grille), np.nan)
+                y[pos] = r[f"{f}_mean"].to_numpy(dtype=np.float64)
+                m = self.models.get(f)
+                if m is None:
+                    recent = -TUNE_DAYS * SEASON
+                    m = self.models[f] = HoltWinters(*tune(y[recent:], slot[recent:]))
+                    m.start(y, slot)
+                m.feed(y, slot)
+            self.last_bucket = int(grille[-1])
+            return len(grille)
+
+    def forecast(self, hours):
+        # DataFrame : date_local (fin de chaque seau futur) + {champ} / {champ}_lo / {champ}_hi
+        with self.lock:
+            if self.last_bucket is None or not self.models:
+                return pd.DataFrame()
+            n = max(int(hours * 3600e9 // STEP_NS), 1)
+            futurs = self.last_bucket + STEP_NS * np.arange(1, n + 1, dtype=np.int64)
+            slots = futurs % DAY_NS // STEP_NS
+            out = {}
+            for f, m in self.models.items():
+                if m.level is None:
+                    continue
+                mean, sigma = m.forecast(slots)
+                out[f] = mean
+                out[f"{f}_lo"] = mean - Z90 * sigma
+                out[f"{f}_hi"] = mean + Z90 * sigma
+        # Point au milieu du seau : la moyenne 15 min représente ce moment-là
+        out["date_local"] = pd.to_datetime(futurs + STEP_NS // 2, unit="ns").tz_localize(
+            self.tz, ambiguous=False, nonexistent="shift_forward")
+        return pd.DataFrame(out)
+
+    def params(self):
+        with self.lock:
+            return {f: (m.alpha, m.beta, m.gamma, m.n) for f, m in self.models.items()}
+
+
+def crossings(fc, rules):
+    # Premier seau où la prévision sort des seuils des règles d'alarme :
+    # "probable" si la moyenne sort, "possible" si seule la bande 10–90 % sort
+    out = []
+    if fc.empty:
+        return out
+    for rule in rules:
+        f = rule.field
+        if f not in fc.columns:
+            continue
+        for sens, seuil in (("haut", rule.high), ("bas", rule.low)):
+            if seuil is None:
+                continue
+            mean, bord = fc[f].to_numpy(), fc[f"{f}_hi" if sens == "haut" else f"{f}_lo"].to_numpy()
+            sort = (mean > seuil) if sens == "haut" else (mean < seuil)
+            risque = (bord > seuil) if sens == "haut" else (bord < seuil)
+            for masque, niveau in ((sort, "probable"), (risque, "possible")):
+                if masque.any():
+                    i = int(np.argmax(masque))
+                    out.append({"regle": rule.label, "champ": f, "sens": sens, "seuil": seuil,
+                                "quand": fc["date_local"].iloc[i], "valeur": float(mean[i]), "niveau": niveau})
+                    break
+    return out
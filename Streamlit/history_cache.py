@@ -0,0 +1,184 @@
+# Cache incrémental de l'historique (mesures_hvac) LFRAH & IQBAL
+# On garde les lignes déjà chargées et on demande à l'API seulement les nouvelles (curseur "since").
+
+import threading
+
+import pandas as pd
+import requests
+
+from metrics import METRICS
+from schema import decode_response
+
+# Format des dates envoyées à l'API (même format que la colonne "date" de MariaDB)
+DATE_FMT = "%Y-%m-%d %H:%M:%S"
+BASE_FIELDS = ["id", "date"]
+
+
+class CursorRejected(Exception):
+    pass
+
+
+def history_params(start=None, end=None, fields=None, limit=None, since=None, fmt=None):
+    # On pousse la plage de temps, les colonnes, la limite et le format de réponse vers l'API
+    params = {}
+    if since is not None:
+        params["since"] = since
+    if start is not None:
+        params["from"] = pd.Timestamp(start).strftime(DATE_FMT)
+    if end is not None:
+        params["to"] = pd.Timestamp(end).strftime(DATE_FMT)
+    if fields:
+        cols = BASE_FIELDS + [f for f in fields if f not in BASE_FIELDS]
+        params["fields"] = ",".join(cols)
+    if limit:
+        params["limit"] = int(limit)
+    if fmt and fmt != "json":
+        params["format"] = fmt
+    return params
+
+
+def filter_local(df, start=None, end=None, fields=None):
+    # Si l'API ignore les paramètres, on applique quand même la plage et les colonnes ici
+    if df.empty:
+        return df
+    if fields:
+        # "ts" (epoch UTC) est calculé au décodage, il suit toujours la date
+        cols = BASE_FIELDS + ["ts"] + [f for f in fields if f not in BASE_FIELDS]
+        df = df[[c for c in cols if c in df.columns]]
+    if (start is not None or end is not None) and "date" in df.columns:
+        ts = pd.to_datetime(df["date"], errors="coerce")
+        if ts.dt.tz is not None:
+            ts = ts.dt.tz_convert("Europe/Brussels").dt.tz_localize(None)
+        keep = ts.notna()
+        if start is not None:
+            keep &= ts >= pd.Timestamp(start)
+        if end is not None:
+            keep &= ts < pd.Timestamp(end)
+        df = df[keep]
+    return df.reset_index(drop=True)
+
+
+def fetch_range(url, start=None, end=None, fields=None, limit=None, timeout=12, session=None, fmt=None):
+    # stream=True : en NDJSON les lignes sont décodées pendant la réception (voir schema.py)
+    with METRICS.timer("fetch_seconds", endpoint="history_range"):
+        r = (session or requests).get(url, params=history_params(start, end, fields, limit, fmt=fmt),
+                                      timeout=timeout, stream=True)
+    with r:
+        r.raise_for_status()
+        with METRICS.timer("stage_seconds", stage="decode"):
+            df, recu = decode_response(r)
+            df = filter_local(df if df is not None else pd.DataFrame(), start, end, fields)
+    METRICS.observe("payload_bytes", recu, endpoint="history_range")
+    METRICS.inc("rows_parsed_total", len(df), endpoint="history_range")
+    if limit and len(df) > int(limit):
+        df = df.tail(int(limit)).reset_index(drop=True)
+    return df
+
+
+class IncrementalHistory:
+    # Ne garde que le curseur : les lignes reçues sont rendues à l'appelant (buffer, caches...)
+    def __init__(self, url, retention_hours=24.0, timeout=12, fields=None, tz="Europe/Brussels",
+                 session=None, fmt=None):
+        self.url = url
+        self.fmt = fmt
+        self.retention = pd.Timedelta(hours=float(retention_hours))
+        self.timeout = timeout
+        self.fields = list(fields) if fields else None
+        self.tz = tz
+        self.session = session or requests.Session()
+        self.last_id = None
+        self.last_date = None
+        self.lock = threading.Lock()
+
+    def cursor(self):
+        # On préfère l'id (strictement croissant), sinon la date de la dernière ligne
+        if self.last_id is not None:
+            return str(self.last_id)
+        if self.last_date is not None:
+            return str(self.last_date)
+        return None
+
+    def _get(self, params=None):
+        with METRICS.timer("fetch_seconds", endpoint="history"):
+            r = self.session.get(self.url, params=params, timeout=self.timeout, stream=True)
+        with r:
+            if params and r.status_code in (400, 404, 409, 410, 422):
+                raise CursorRejected(f"HTTP {r.status_code}")
+            r.raise_for_status()
+            with METRICS.timer("stage_seconds", stage="decode"):
+                df, recu = decode_response(r, self.tz)
+                METRICS.observe("payload_bytes", recu, endpoint="history")
+                if df is None:
+                    if params:
+                        raise CursorRejected("réponse inattendue")
+                    df = pd.DataFrame()
+                df = filter_local(df, fields=self.fields)
+        METRICS.inc("rows_parsed_total", len(df), endpoint="history")
+        return df
+
+    def _only_new(self, new):
+        # Si l'API ignore le curseur et renvoie tout, on enlève les lignes déjà connues
+        if new.empty:
+            return new
+        if self.last_id is not None and "id" in new.columns:
+            ids = pd.to_numeric(new["id"], errors="coerce")
+            return new[ids > self.last_id]
+        if self.last_date is not None and "_ts" in new.columns:
+            return new[new["_ts"] > self.last_date]
+        return new
+
+    def _prepare(self, new):
+        if not new.empty and "date" in new.columns:
+            # On ne parse que les nouvelles lignes, jamais tout l'historique
+            new["_ts"] = pd.to_datetime(new["date"], errors="coerce")
+            new = new.sort_values("_ts", kind="stable").reset_index(drop=True)
+        return new
+
+    def _trim(self, df):
+        if df.empty or "_ts" not in df.columns:
+            return df
+        newest = df["_ts"].max()
+        if pd.isna(newest):
+            return df
+        return df[df["_ts"] >= newest - self.retention].reset_index(drop=True)
+
+    def _update_cursor(self, df):
+        if df.empty:
+            return
+        if "id" in df.columns:
+            ids = pd.to_numeric(df["id"], errors="coerce")
+            if ids.notna().any():
+                self.last_id = int(ids.max())
+        if "_ts" in df.columns and df["_ts"].notna().any():
+            self.last_date = df["_ts"].max()
+
+    def full_reload(self):
+        with self.lock:
+            self.last_id = None
+            self.last_date = None
+            # Premier chargement : seulement la fenêtre de rétention, sinon tout (API sans paramètres)
+            start = pd.Timestamp.now(tz=self.tz).tz_localize(None) - self.retention
+            try:
+                df = self._prepare(self._get(history_params(start=start, fields=self.fields, fmt=self.fmt)))
+            except CursorRejected:
+                df = self._prepare(self._get())
+            df = self._trim(df)
+            self._update_cursor(df)
+        return df.drop(columns=["_ts"], errors="ignore")
+
+    def refresh(self):
+        # Renvoie (nouvelles lignes, rechargement complet ?)
+        cur = self.cursor()
+        if cur is None:
+            return self.full_reload(), True
+
+        try:
+            new = self._prepare(self._get(history_params(fields=self.fields, since=cur, fmt=self.fmt)))
+        except CursorRejected:
+            # Curseur refusé par l'API : on recharge tout
+            return self.full_reload(), True
+
+        with self.lock:
+            new = self._only_new(new)
+            self._update_cursor(new)
+        return new.drop(columns=["_ts"], errors="ignore"), False
@@ -0,0 +1,224 @@
+# Instrumentation du dashboard (LFRAH & IQBAL)
+# Chaque étape chaude (appel API, octets reçus, lignes lues, fuseau horaire, figures, tableaux)
+# est mesurée dans une fenêtre glissante : percentiles p50 / p95 / p99 pour la page Diagnostics
+# et texte au format Prometheus. Bibliothèque standard seulement : importé au démarrage.
+
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = 512               # dernières valeurs gardées par série
+QUANTILES = (0.5, 0.95, 0.99)
+MAX_VIEWERS = 200
+
+# Aide affichée dans le texte Prometheus
+HELP = {
+    "fetch_seconds": "Durée des appels HTTP vers Node-RED",
+    "payload_bytes": "Taille des réponses HTTP",
+    "rows_parsed_total": "Lignes d'historique décodées",
+    "fetch_errors_total": "Appels HTTP en erreur",
+    "stage_seconds": "Durée des étapes de traitement (fuseau horaire, buffer, disque, agrégats, alarmes, moteur, anomalies, prévisions)",
+    "chart_seconds": "Construction / mise à jour d'une figure et envoi au navigateur",
+    "table_seconds": "Mise en forme et envoi d'un tableau",
+    "page_seconds": "Exécution complète du script pour une page",
+    "fragment_seconds": "Exécution d'un fragment rafraîchi seul",
+    "cache_requests_total": "Appels aux fonctions st.cache_data (hit / miss)",
+}
+
+
+def percentile(values, q):
+    # Rang le plus proche sur une liste triée
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def _escape(v):
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = list(labels) + sorted((k, str(v)) for k, v in extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Series:
+    __slots__ = ("values", "count", "total", "last")
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+
+
+class Metrics:
+    def __init__(self, window=WINDOW):
+        self.window = int(window)
+        self.lock = threading.Lock()
+        self.series = {}     # (nom, labels) -> Series
+        self.counters = {}   # (nom, labels) -> total
+        self.viewers = {}    # id de session -> runs, durée, page, vu à
+        self.started = time.time()
+        self._local = threading.local()
+        self._writer = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = Series(self.window)
+            s.values.append(float(value))
+            s.count += 1
+            s.total += float(value)
+            s.last = float(value)
+
+    def inc(self, name, n=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t, **labels)
+
+    def timed(self, name, **labels):
+        # Décorateur : à placer sous @st.fragment pour mesurer chaque exécution du fragment
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    # ---------- caches st.cache_data ----------
+
+    def mark_miss(self):
+        # Appelé dans le corps d'une fonction en cache : il ne s'exécute que si le cache a raté
+        self._local.miss = True
+
+    def cached(self, name, fn, *args, **kwargs):
+        self._local.miss = False
+        out = fn(*args, **kwargs)
+        self.inc("cache_requests_total", fn=name, result="miss" if self._local.miss else "hit")
+        return out
+
+    # ---------- sessions ----------
+
+    def viewer(self, viewer_id, page, seconds):
+        # Quelle session / quelle page charge le process (affiché, pas exporté : trop de labels)
+        with self.lock:
+            v = self.viewers.get(viewer_id)
+            if v is None:
+                if len(self.viewers) >= MAX_VIEWERS:
+                    del self.viewers[min(self.viewers, key=lambda k: self.viewers[k]["vu"])]
+                v = self.viewers[viewer_id] = {"runs": 0, "total_s": 0.0, "max_s": 0.0}
+            v["runs"] += 1
+            v["total_s"] += seconds
+            v["max_s"] = max(v["max_s"], seconds)
+            v["page"] = page
+            v["vu"] = time.time()
+
+    # ---------- lecture ----------
+
+    def summary(self):
+        with self.lock:
+            items = [(k, sorted(s.values), s.count, s.total, s.last) for k, s in self.series.items()]
+        rows = []
+        for (name, labels), values, count, total, last in sorted(items):
+            rows.append({
+                "metric": name,
+                "labels": ", ".join(f"{k}={v}" for k, v in labels),
+                "n": count,
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": values[-1] if values else None,
+                "last": last,
+                "total": total,
+            })
+        return rows
+
+    def counter_rows(self):
+        with self.lock:
+            items = sorted(self.counters.items())
+        return [{"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": value}
+                for (name, labels), value in items]
+
+    def viewer_rows(self):
+        with self.lock:
+            items = [(k, dict(v)) for k, v in self.viewers.items()]
+        return sorted(({"session": k, **v} for k, v in items), key=lambda r: -r["total_s"])
+
+    def prometheus(self, prefix="hvac"):
+        # Format texte d'exposition Prometheus : séries en "summary" (fenêtre glissante), compteurs en "counter"
+        with self.lock:
+            series = [(k, sorted(s.values), s.count, s.total) for k, s in self.series.items()]
+            counters = sorted(self.counters.items())
+        out = []
+        seen = set()
+        for (name, labels), values, count, total in sorted(series):
+            full = f"{prefix}_{name}"
+            if full not in seen:
+                seen.add(full)
+                out.append(f"# HELP {full} {HELP.get(name, name)}")
+                out.append(f"# TYPE {full} summary")
+            for q in QUANTILES:
+                out.append(f"{full}{_labels(labels, quantile=q)} {percentile(values, q):.6g}")
+            out.append(f"{full}_sum{_labels(labels)} {total:.6g}")
+            out.append(f"{full}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            full = f"{prefix}_{name}"
+            if full not in seen:
+                seen.add(full)
+                out.append(f"# HELP {full} {HELP.get(name, name)}")
+                out.append(f"# TYPE {full} counter")
+            out.append(f"{full}{_labels(labels)} {value}")
+        out.append(f"# TYPE {prefix}_process_start_time_seconds gauge")
+        out.append(f"{prefix}_process_start_time_seconds {self.started:.0f}")
+        return "\n".join(out) + "\n"
+
+    # ---------- export fichier ----------
+
+    def write(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def export_every(self, path, seconds=15.0):
+        # Fichier réécrit en arrière-plan (servi par Streamlit dans static/ : Prometheus peut le scraper)
+        if self._writer is not None or not seconds:
+            return self
+
+        def loop():
+            while True:
+                try:
+                    self.write(path)
+                except OSError:
+                    pass
+                time.sleep(seconds)
+
+        self._writer = threading.Thread(target=loop, name="hvac-metrics", daemon=True)
+        self._writer.start()
+        return self
+
+
+# Registre unique du process (poller, file de commandes et sessions Streamlit)
+METRICS = Metrics()
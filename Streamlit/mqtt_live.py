@@ -0,0 +1,99 @@
+# Lecture directe des topics MQTT des ESP32 (LFRAH & IQBAL)
+# On garde en mémoire la dernière valeur de chaque champ ; le polling HTTP reste le plan B.
+
+import json
+import threading
+import time
+from types import MappingProxyType
+
+from schema import typed_record
+
+
+def parse_value(raw):
+    # Les ESP32 publient du JSON ou juste un nombre / texte
+    txt = raw.decode("utf-8", errors="replace") if isinstance(raw, (bytes, bytearray)) else str(raw)
+    txt = txt.strip()
+    try:
+        return json.loads(txt)
+    except ValueError:
+        return txt
+
+
+class MqttLive:
+    def __init__(self, host, port=1883, topics=("hvac/salle/#", "hvac/lt/#"),
+                 username=None, password=None, stale_seconds=30.0, client=None, rename=None):
+        self.host = host
+        self.port = int(port)
+        self.topics = [t for t in topics if t]
+        self.username = username
+        self.password = password
+        self.stale_seconds = float(stale_seconds)
+        self.client = client
+        self.rename = dict(rename or {})    # noms de l'appareil -> noms du dashboard
+        self.connected = False
+        self.error = None
+        self.values = {}
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+
+    def handle(self, topic, payload):
+        # Appelé pour chaque message (par paho ou directement par un faux broker en test)
+        value = parse_value(payload)
+        now = time.time()
+        with self.lock:
+            if isinstance(value, dict):
+                # Message complet : {"temperature_lt": 22.5, "humidite_lt": 48, ...}
+                self.values.update(value)
+            else:
+                # Un topic par champ : hvac/lt/gaz -> "gaz"
+                self.values[topic.rsplit("/", 1)[-1]] = value
+            if not (isinstance(value, dict) and "date" in value):
+                # Pas de date dans le message : on prend l'heure de réception
+                self.values["date"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+            self.updated_at = now
+
+    def latest(self):
+        # None si rien n'est arrivé depuis stale_seconds : l'appelant repasse sur HTTP
+        with self.lock:
+            if not self.values or time.time() - self.updated_at > self.stale_seconds:
+                return None
+            values = dict(self.values)
+        # Même typage que les réponses HTTP / SSE du poller : "22.5 " ou "812" deviennent des nombres
+        return MappingProxyType(typed_record({self.rename.get(k, k): v for k, v in values.items()}))
+
+    def _on_connect(self, client, userdata, flags, *args):
+        self.connected = True
+        for t in self.topics:
+            client.subscribe(t)
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected = False
+
+    def _on_message(self, client, userdata, msg):
+        self.handle(msg.topic, msg.payload)
+
+    def start(self):
+        if self.client is None:
+            try:
+                import paho.mqtt.client as mqtt
+            except ImportError as e:
+                self.error = f"paho-mqtt indisponible : {e}"
+                return self
+            try:
+                self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            except AttributeError:
+                # paho-mqtt 1.x
+                self.client = mqtt.Client()
+
+        if self.username:
+            self.client.username_pw_set(self.username, self.password)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        try:
+            # Connexion en arrière-plan : paho se reconnecte tout seul si le broker tombe
+            self.client.connect_async(self.host, self.port, keepalive=30)
+            self.client.loop_start()
+        except Exception as e:
+            self.error = str(e)
+        return self
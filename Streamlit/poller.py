@@ -0,0 +1,259 @@
+# Poller partagé par tout le process Streamlit (LFRAH & IQBAL)
+# Un seul thread interroge Node-RED ; chaque session lit juste le dernier instantané publié.
+# Seule la dernière mesure est lue avant la première page : pandas, le buffer, le cache disque
+# et l'historique sont chargés ensuite dans le thread du poller.
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+from schema import typed_record
+
+log = logging.getLogger(__name__)
+
+
+def make_session(pool_size=8):
+    # Session avec pool de connexions (keep-alive) réutilisée par tous les appels
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    latest: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    ring: object = None  # RingBuffer (None tant que l'historique n'est pas prêt)
+    rows: int = 0
+    fetched_at: float = 0.0
+    error: str = None
+    version: int = 0
+
+
+class Poller:
+    def __init__(self, latest_url, history_url="", interval=2.0, history_interval=8.0,
+                 retention_hours=24.0, history_fields=None, sample_seconds=1.0, disk=None,
+                 rollups=None, idle_interval=30.0, rename=None, alarms=None, setup=None, history_format=None,
+                 motor=None, anomalies=None):
+        self.latest_url = latest_url
+        self.history_url = history_url
+        self.interval = float(interval)
+        # Quand le canal push est connecté, le poll n'est plus qu'un filet de sécurité
+        self.idle_interval = max(float(idle_interval), self.interval)
+        self.push = None
+        self.history_interval = float(history_interval)
+        self.session = make_session()
+        self.history = None
+        self.retention_hours = float(retention_hours)
+        self.retention_ns = int(self.retention_hours * 3600e9)
+        self.history_fields = history_fields
+        # Format demandé à /history : "json", "columns" ou "ndjson" (voir schema.py)
+        self.history_format = history_format
+        self.sample_seconds = sample_seconds
+        self.ring = None
+        self.disk = disk
+        self.rollups = rollups
+        self.alarms = alarms
+        # Marche / énergie du moteur par jour (energy.py)
+        self.motor = motor
+        # Pics, capteurs figés, valeurs hors plage et trous (anomalies.py)
+        self.anomalies = anomalies
+        # Champs nommés autrement chez cet appareil -> noms du dashboard
+        self.rename = dict(rename or {})
+        # setup(poller) : crée cache disque / agrégats / alarmes / moteur / anomalies dans le thread du poller
+        self.setup = setup
+        self.ready = threading.Event()
+        # Erreur de préparation de l'historique (fichier .arrow corrompu...) : le live continue sans
+        self.init_error = None
+        self._snapshot = Snapshot()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+        self._last_history = 0.0
+
+    def snapshot(self):
+        # Lecture sans verrou : on remplace l'objet entier, on ne le modifie jamais
+        return self._snapshot
+
+    def wait_ready(self, timeout=30.0):
+        # Pages avec historique : attendent le buffer (seulement au premier démarrage du process).
+        # False si l'historique n'est pas prêt à temps ou si sa préparation a échoué
+        return self.ready.wait(timeout) and self.init_error is None
+
+    def refresh_now(self):
+        # Poll immédiat (bouton "Rafraîchir maintenant") : on ne jette que le dernier jour sur disque
+        self.wait_ready()
+        with self._lock:
+            if self.disk is not None and self.history is not None:
+                self.disk.invalidate_tail()
+                self.history.last_id = None
+                self.history.last_date = None
+            self._last_history = 0.0
+            self._poll()
+
+    def on_push(self, event, data):
+        # Évènement SSE : la valeur live est publiée tout de suite, les lignes suivent au poll réveillé
+        if not isinstance(data, dict):
+            return
+        if event in ("measure", "alarm"):
+            with self._lock:
+                snap = self._snapshot
+                latest = dict(snap.latest)
+                latest.update(typed_record({self.rename.get(k, k): v for k, v in data.items()}))
+                self._snapshot = Snapshot(MappingProxyType(latest), snap.ring, snap.rows, time.time(),
+                                          snap.error, snap.version + 1)
+            if event == "measure":
+                self._last_history = 0.0
+                self._wake.set()
+
+    def _init_history(self):
+        # Dans le thread du poller : modules lourds, buffer, cache disque puis premier historique
+        from history_cache import IncrementalHistory
+        from ring_buffer import RingBuffer
+
+        self.ring = RingBuffer.for_hours(self.retention_hours, self.sample_seconds)
+        if self.setup is not None:
+            self.setup(self)
+        if self.history_url:
+            self.history = IncrementalHistory(self.history_url, retention_hours=self.retention_hours,
+                                              fields=self.history_fields, session=self.session,
+                                              fmt=self.history_format)
+        self.load_from_disk()
+        self.poll_once()
+
+    def load_from_disk(self):
+        # Démarrage à froid : on remplit le buffer depuis le disque et on repart du dernier id connu
+        import numpy as np
+
+        if self.disk is None or not self.disk.available or self.history is None:
+            return
+        last_ts = self.disk.last_ts()
+        if last_ts is None:
+            return
+        if time.time() * 1e9 - last_ts > self.retention_ns:
+            # Trop ancien pour reprendre au curseur : rechargement complet, dernier jour à refaire
+            self.disk.mark_tail_incomplete()
+            return
+        # Agrégats, alarmes, moteur et anomalies repartent du début du jour : un jour à moitié relu serait enregistré incomplet
+        t0 = self.disk.day_start(self.disk.day_of(np.array([last_ts - self.retention_ns]))[0])
+        df = self.disk.read_range(t0=t0)
+        if df.empty:
+            return
+        ts = df["ts"].to_numpy()
+        tail = ts >= last_ts - self.retention_ns
+        self.ring.extend_ts(ts[tail], df[tail])
+        if self.rollups is not None:
+            self.rollups.add(ts, df)
+        if self.alarms is not None:
+            self.alarms.add(ts, df)
+        if self.motor is not None:
+            self.motor.add(ts, df)
+        if self.anomalies is not None:
+            self.anomalies.add(ts, df)
+        self.history.last_id = self.disk.last_id()
+
+    def poll_once(self):
+        with self._lock:
+            self._poll()
+
+    def _poll(self):
+        snap = self._snapshot
+        latest, error = snap.latest, None
+        added = 0
+
+        try:
+            with METRICS.timer("fetch_seconds", endpoint="latest"):
+                r = self.session.get(self.latest_url, timeout=8)
+            METRICS.observe("payload_bytes", len(r.content), endpoint="latest")
+            r.raise_for_status()
+            # Champs du schéma en nombres : plus de textes "22.5" à convertir côté pages
+            latest = MappingProxyType(typed_record({self.rename.get(k, k): v for k, v in dict(r.json()).items()}))
+            if self.alarms is not None:
+                # Seuils T1 / T3 et H1 / H2 de la Salle
+                self.alarms.update_settings(latest)
+        except Exception as e:
+            METRICS.inc("fetch_errors_total", endpoint="latest")
+            error = f"latest : {e}"
+
+        now = time.monotonic()
+        if self.history is not None and now - self._last_history >= self.history_interval:
+            from ring_buffer import to_epoch_ns
+            try:
+                new, reloaded = self.history.refresh()
+                if self.rename:
+                    new = new.rename(columns=self.rename)
+                with METRICS.timer("stage_seconds", stage="timezone"):
+                    if "ts" in new.columns:
+                        ts = new["ts"].to_numpy()
+                    else:
+                        ts = to_epoch_ns(new["date"].to_numpy()) if "date" in new.columns else []
+                if reloaded:
+                    self.ring.clear()
+                if len(ts):
+                    with METRICS.timer("stage_seconds", stage="ring"):
+                        added = self.ring.extend_ts(ts, new)
+                    if self.disk is not None:
+                        # Après un rechargement complet, le jour n'est garanti complet qu'à partir du 1er point
+                        with METRICS.timer("stage_seconds", stage="disk"):
+                            self.disk.write(ts, new, covered_from=int(ts.min()) if reloaded else None)
+                    if self.rollups is not None:
+                        with METRICS.timer("stage_seconds", stage="rollups"):
+                            self.rollups.add(ts, new)
+                    if self.alarms is not None:
+                        with METRICS.timer("stage_seconds", stage="alarms"):
+                            self.alarms.add(ts, new)
+                    if self.motor is not None:
+                        with METRICS.timer("stage_seconds", stage="motor"):
+                            self.motor.add(ts, new)
+                    if self.anomalies is not None:
+                        with METRICS.timer("stage_seconds", stage="anomalies"):
+                            self.anomalies.add(ts, new)
+                self._last_history = now
+            except Exception as e:
+                METRICS.inc("fetch_errors_total", endpoint="history")
+                error = f"history : {e}" if error is None else error
+
+        # La version ne bouge que si quelque chose a changé : les pages qui la surveillent
+        # ne se relancent pas pour rien
+        if error is None:
+            error = self.init_error
+        changed = added or error != snap.error or latest != snap.latest
+        self._snapshot = Snapshot(latest, self.ring, self.ring.size if self.ring is not None else 0,
+                                  time.time(), error, snap.version + 1 if changed else snap.version)
+
+    def _run(self):
+        try:
+            self._init_history()
+        except Exception as e:
+            # Sans historique le poll des valeurs live doit continuer : l'erreur est publiée
+            log.exception("préparation de l'historique")
+            self.init_error = f"historique : {e}"
+            with self._lock:
+                snap = self._snapshot
+                self._snapshot = Snapshot(snap.latest, snap.ring, snap.rows, snap.fetched_at,
+                                          self.init_error, snap.version + 1)
+        finally:
+            self.ready.set()
+        while True:
+            push_ok = self.push is not None and self.push.connected
+            self._wake.wait(self.idle_interval if push_ok else self.interval)
+            self._wake.clear()
+            try:
+                self.poll_once()
+            except Exception:
+                log.exception("poll")
+
+    def start(self):
+        if self._thread is None:
+            # Premier poll en direct (dernière mesure seulement) pour que la première page l'ait déjà
+            self.poll_once()
+            self._thread = threading.Thread(target=self._run, name="hvac-poller", daemon=True)
+            self._thread.start()
+        return self
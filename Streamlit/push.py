@@ -0,0 +1,143 @@
+# Canal push Server-Sent Events (SSE) depuis Node-RED (LFRAH & IQBAL)
+# Client asyncio (bibliothèque standard) dans un thread à part : Node-RED prévient dès qu'une
+# mesure ou un changement d'alarme arrive, au lieu d'attendre le prochain tour du poller.
+
+import asyncio
+import json
+import ssl
+import threading
+from urllib.parse import urlsplit
+
+
+def version_moved(state, key, version):
+    # Vrai une seule fois quand l'instantané a changé depuis le dernier rendu de la session
+    # (state = st.session_state) : tant que la version ne bouge pas, rien n'est redessiné
+    if state.get(key) == version:
+        return False
+    state[key] = version
+    return True
+
+
+class SseClient:
+    def __init__(self, url, on_event, retry=3.0, timeout=45.0):
+        # on_event(nom, données) est appelé depuis le thread du client
+        self.url = url
+        self.on_event = on_event
+        self.retry = float(retry)
+        self.timeout = float(timeout)
+        self.connected = False
+        self.error = None
+        self.received = 0
+        self.last_event_id = None
+        self._thread = None
+
+    # ---------- connexion ----------
+
+    async def _open(self):
+        u = urlsplit(self.url)
+        secure = u.scheme == "https"
+        port = u.port or (443 if secure else 80)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(u.hostname, port, ssl=ssl.create_default_context() if secure else None),
+            self.timeout)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        head = [f"GET {path} HTTP/1.1", f"Host: {u.netloc}", "Accept: text/event-stream",
+                "Cache-Control: no-cache", "Connection: keep-alive"]
+        if self.last_event_id:
+            # Reprise : le serveur peut renvoyer ce qu'on a manqué pendant la coupure
+            head.append(f"Last-Event-ID: {self.last_event_id}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status = (await asyncio.wait_for(reader.readline(), self.timeout)).decode("latin-1").split()
+        if len(status) < 2 or status[1] != "200":
+            writer.close()
+            raise ConnectionError(f"réponse SSE inattendue : {' '.join(status)}")
+        headers = {}
+        while True:
+            line = (await asyncio.wait_for(reader.readline(), self.timeout)).decode("latin-1").strip()
+            if not line:
+                break
+            k, _, v = line.partition(":")
+            headers[k.strip().lower()] = v.strip().lower()
+        return reader, writer, headers.get("transfer-encoding") == "chunked"
+
+    async def _lines(self, reader, chunked):
+        # Lignes du flux ; le timeout détecte une connexion morte (Node-RED envoie des keepalive)
+        if not chunked:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not line:
+                    return
+                yield line.decode("utf-8", "replace").rstrip("\r\n")
+        buf = b""
+        while True:
+            size = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not size:
+                return
+            n = int(size.split(b";")[0].strip() or b"0", 16)
+            if n == 0:
+                return
+            buf += (await asyncio.wait_for(reader.readexactly(n + 2), self.timeout))[:-2]
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", "replace").rstrip("\r")
+
+    async def _listen(self):
+        reader, writer, chunked = await self._open()
+        self.connected = True
+        self.error = None
+        event, data = "message", []
+        try:
+            async for line in self._lines(reader, chunked):
+                if line == "":
+                    # Ligne vide = fin d'un évènement
+                    if data:
+                        self._dispatch(event, "\n".join(data))
+                    event, data = "message", []
+                    continue
+                if line.startswith(":"):
+                    continue
+                name, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if name == "event":
+                    event = value
+                elif name == "data":
+                    data.append(value)
+                elif name == "id":
+                    self.last_event_id = value or None
+                elif name == "retry" and value.isdigit():
+                    self.retry = int(value) / 1000
+        finally:
+            self.connected = False
+            writer.close()
+
+    def _dispatch(self, event, raw):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = raw
+        self.received += 1
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            self.error = f"évènement {event} : {e}"
+
+    async def _main(self):
+        # Reconnexion automatique avec attente croissante (plafonnée à 30 s)
+        wait = self.retry
+        while True:
+            try:
+                await self._listen()
+                wait = self.retry
+            except Exception as e:
+                self.error = str(e) or type(e).__name__
+                wait = min(max(wait * 2, self.retry), 30.0)
+            await asyncio.sleep(wait)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()),
+                                            name="hvac-sse", daemon=True)
+            self._thread.start()
+        return self
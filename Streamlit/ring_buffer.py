@@ -0,0 +1,162 @@
+# Buffer circulaire en colonnes NumPy pour les dernières heures de mesures (LFRAH & IQBAL)
+# Chaque colonne est stockée deux fois d'affilée (taille 2 x capacité) : n'importe quelle fenêtre
+# est donc un morceau contigu du tableau et se copie d'un bloc, sous le verrou, pour les pages.
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Colonnes numériques gardées dans le buffer (le texte "mode" est codé en petits entiers)
+NUMERIC_FIELDS = {
+    "id": np.int64,
+    "temperature_lt": np.float32,
+    "humidite_lt": np.float32,
+    "gaz": np.float32,
+    "motor_speed": np.float32,
+    "alarme": np.float32,
+}
+CODED_FIELDS = ["mode"]
+
+
+def to_epoch_ns(dates, tz="Europe/Brussels"):
+    # Dates texte (heure locale sans timezone, comme MariaDB) -> int64 ns UTC, seulement pour le lot reçu
+    ts = pd.to_datetime(pd.Series(dates), errors="coerce")
+    if ts.dt.tz is None:
+        try:
+            ts = ts.dt.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward")
+        except Exception:
+            # Petit lot pendant le changement d'heure : "infer" n'a pas assez de contexte
+            ts = ts.dt.tz_localize(tz, ambiguous=False, nonexistent="shift_forward")
+    ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    return ts.astype("datetime64[ns]").to_numpy().view(np.int64)
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        n = 2 * self.capacity
+        self.ts = np.zeros(n, dtype=np.int64)
+        self.cols = {f: np.zeros(n, dtype=dt) for f, dt in NUMERIC_FIELDS.items()}
+        self.codes = {f: np.zeros(n, dtype=np.int16) for f in CODED_FIELDS}
+        self.labels = {f: [] for f in CODED_FIELDS}
+        self.index = {f: {} for f in CODED_FIELDS}     # libellé -> code
+        self.start = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_hours(cls, hours, sample_seconds=1.0):
+        # Budget mémoire fixe : N heures à la cadence d'échantillonnage la plus rapide
+        return cls(max(int(hours * 3600 / max(sample_seconds, 0.1)), 16))
+
+    def nbytes(self):
+        total = self.ts.nbytes
+        total += sum(a.nbytes for a in self.cols.values())
+        total += sum(a.nbytes for a in self.codes.values())
+        return total
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.size = 0
+
+    def _encode(self, field, values):
+        # Codes du lot en une passe (pd.factorize, vides -> -1), puis petite table de traduction
+        # vers les codes du buffer : la boucle Python ne porte que sur les valeurs distinctes du lot
+        codes, uniques = pd.factorize(values)
+        labels, index = self.labels[field], self.index[field]
+        lut = np.full(len(uniques) + 1, -1, dtype=np.int16)
+        for j, v in enumerate(uniques):
+            v = str(v)
+            if v not in index:
+                index[v] = len(labels)
+                labels.append(v)
+            lut[j] = index[v]
+        return lut[codes]
+
+    def extend(self, df, tz="Europe/Brussels"):
+        # Ajout d'un lot de lignes (DataFrame de l'API) : O(taille du lot), pas O(taille du buffer)
+        if df.empty or "date" not in df.columns:
+            return 0
+        return self.extend_ts(to_epoch_ns(df["date"].to_numpy(), tz), df)
+
+    def extend_ts(self, ts, df):
+        # Même chose quand les timestamps int64 sont déjà calculés (cache disque, poller)
+        ts = np.asarray(ts, dtype=np.int64)
+        ok = ts != np.iinfo(np.int64).min
+        df, ts = df[ok], ts[ok]
+        order = np.argsort(ts, kind="stable")
+        df, ts = df.iloc[order], ts[order]
+
+        with self.lock:
+            # window() cherche par dichotomie : une ligne en retard (plus ancienne que la dernière
+            # gardée) casserait l'ordre du buffer, elle est ignorée
+            if self.size:
+                keep = ts >= self.ts[self.start + self.size - 1]
+                if not keep.all():
+                    df, ts = df[keep], ts[keep]
+            n = len(ts)
+            if n == 0:
+                return 0
+            if n > self.capacity:
+                df, ts, n = df.iloc[-self.capacity:], ts[-self.capacity:], self.capacity
+
+            pos = (self.start + self.size + np.arange(n)) % self.capacity
+            both = np.concatenate([pos, pos + self.capacity])
+            self.ts[both] = np.tile(ts, 2)
+            for f, arr in self.cols.items():
+                if f in df.columns:
+                    v = pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+                    if arr.dtype.kind == "i":
+                        v = np.nan_to_num(v, nan=-1)
+                    arr[both] = np.tile(v.astype(arr.dtype), 2)
+                else:
+                    arr[both] = np.nan if arr.dtype.kind == "f" else -1
+            for f, arr in self.codes.items():
+                if f in df.columns:
+                    arr[both] = np.tile(self._encode(f, df[f].to_numpy()), 2)
+                else:
+                    arr[both] = -1
+
+            overflow = max(self.size + n - self.capacity, 0)
+            self.start = (self.start + overflow) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+        return n
+
+    def append(self, date, row, tz="Europe/Brussels"):
+        # Ajout d'une seule ligne en O(1)
+        return self.extend(pd.DataFrame([dict(row, date=date)]), tz)
+
+    def bounds(self):
+        with self.lock:
+            if self.size == 0:
+                return None, None
+            return int(self.ts[self.start]), int(self.ts[self.start + self.size - 1])
+
+    def window(self, t0=None, t1=None):
+        # Renvoie (ts, {colonne: copie}) pour t0 <= ts < t1. Copie faite sous le verrou : le poller
+        # réécrit les cases les plus anciennes pendant qu'une page dessine encore sa fenêtre
+        with self.lock:
+            lo, hi = self.start, self.start + self.size
+            ts = self.ts[lo:hi]
+            a = 0 if t0 is None else int(np.searchsorted(ts, t0, side="left"))
+            b = len(ts) if t1 is None else int(np.searchsorted(ts, t1, side="left"))
+            cols = {f: arr[lo + a:lo + b].copy() for f, arr in self.cols.items()}
+            cols.update({f: arr[lo + a:lo + b].copy() for f, arr in self.codes.items()})
+            labels = {f: list(v) for f, v in self.labels.items()}
+            return ts[a:b].copy(), cols, labels
+
+    def frame(self, t0=None, t1=None, fields=None, tz="Europe/Brussels"):
+        # DataFrame prêt pour les graphes : la conversion de timezone ne touche que la fenêtre visible
+        ts, cols, labels = self.window(t0, t1)
+        data = {}
+        for f in ["id"] + list(fields or (list(NUMERIC_FIELDS) + CODED_FIELDS)):
+            if f in self.codes:
+                data[f] = pd.Categorical.from_codes(cols[f], categories=labels[f])
+            elif f in cols:
+                data[f] = cols[f]
+        utc = pd.to_datetime(ts, unit="ns", utc=True)
+        data["date_local"] = utc.tz_convert(tz)
+        data["date"] = utc.tz_convert(tz).tz_localize(None)
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,184 @@
+# Agrégats précalculés (1 min / 15 min / 1 h / 1 jour) LFRAH & IQBAL
+# Pour chaque jour et chaque résolution on garde min / max / somme / nombre par champ.
+# Les jours terminés sont enregistrés sur disque : une vue sur plusieurs mois ne relit jamais les mesures brutes.
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+RESOLUTIONS = {"1min": 60, "15min": 900, "1h": 3600, "1d": 86400}
+# motor_on = 1 quand le moteur tourne : sa moyenne donne directement le taux de marche
+FIELDS = ["temperature_lt", "humidite_lt", "gaz", "motor_speed", "motor_on"]
+STATS = ["min", "max", "sum", "count"]
+DAY_NS = 86400 * 10**9
+
+
+def local_ns(ts, tz="Europe/Brussels"):
+    # int64 ns UTC -> int64 ns "heure murale" locale (pour que les seaux 1 jour tombent à minuit)
+    return pd.to_datetime(ts, unit="ns", utc=True).tz_convert(tz).tz_localize(None).to_numpy().view(np.int64)
+
+
+def aggregate(loc, df, res_s):
+    # Un passage groupby vectorisé par résolution
+    step = int(res_s) * 10**9
+    data = {}
+    for f in FIELDS:
+        if f == "motor_on" and "motor_speed" in df.columns:
+            v = pd.to_numeric(df["motor_speed"], errors="coerce").to_numpy(dtype=np.float64)
+            data[f] = np.where(np.isnan(v), np.nan, (v > 0).astype(np.float64))
+        elif f in df.columns:
+            data[f] = pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+    if not data:
+        return pd.DataFrame()
+    out = pd.DataFrame(data).groupby(loc // step * step).agg(STATS)
+    out.columns = [f"{f}_{s}" for f, s in out.columns]
+    return out
+
+
+def combine(a, b):
+    # Fusion de deux morceaux d'agrégats sur les mêmes seaux
+    if a is None or a.empty:
+        return b
+    both = pd.concat([a, b])
+    how = {c: ("sum" if c.endswith(("_sum", "_count")) else c.rsplit("_", 1)[1]) for c in both.columns}
+    return both.groupby(level=0).agg(how).sort_index()
+
+
+def pick_resolution(span_s, width_px=1200):
+    # La plus fine qui garde moins d'un point par pixel
+    for name, res in RESOLUTIONS.items():
+        if span_s / res <= width_px:
+            return name
+    return "1d"
+
+
+class Rollups:
+    def __init__(self, root=None, tz="Europe/Brussels"):
+        self.root = root
+        self.tz = tz
+        self.days = {}      # "YYYY-MM-DD" -> {résolution: DataFrame indexé par début de seau (ns local)}
+        self.saved = set()  # jours terminés déjà enregistrés
+        self.last_ts = None
+        self.lock = threading.Lock()
+        if self.root and pa is not None:
+            os.makedirs(self.root, exist_ok=True)
+
+    def add(self, ts, df):
+        # Mise à jour incrémentale avec les nouvelles lignes (celles déjà vues sont ignorées)
+        ts = np.asarray(ts, dtype=np.int64)
+        if len(ts) == 0:
+            return
+        with self.lock:
+            keep = ts > self.last_ts if self.last_ts is not None else np.ones(len(ts), dtype=bool)
+            if not keep.any():
+                return
+            ts, df = ts[keep], df[keep]
+            loc = local_ns(ts, self.tz)
+            names = pd.to_datetime(loc // DAY_NS * DAY_NS, unit="ns").strftime("%Y-%m-%d").to_numpy()
+            for day in np.unique(names):
+                if day in self.saved:
+                    continue
+                m = names == day
+                cur = self.days.setdefault(day, {})
+                for res, res_s in RESOLUTIONS.items():
+                    cur[res] = combine(cur.get(res), aggregate(loc[m], df[m], res_s))
+            self.last_ts = int(ts.max())
+            self._save_finished(names.max())
+
+    def replace_day(self, day, ts, df):
+        # Recalcul complet d'un jour (préchauffage disque) : idempotent, pas de double comptage
+        if len(ts) == 0:
+            return
+        loc = local_ns(np.asarray(ts, dtype=np.int64), self.tz)
+        with self.lock:
+            self.days[day] = {res: aggregate(loc, df, res_s) for res, res_s in RESOLUTIONS.items()}
+            self.saved.discard(day)
+            today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+            self._save_finished(today)
+
+    def _save_finished(self, current_day):
+        # Les jours avant le jour courant ne bougent plus : on les écrit une fois pour toutes
+        for day in [d for d in self.days if d < current_day and d not in self.saved]:
+            self._save_day(day)
+            self.saved.add(day)
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{day}.arrow")
+
+    def _save_day(self, day):
+        if not self.root or pa is None:
+            return
+        parts = []
+        for res, frame in self.days[day].items():
+            if frame is not None and not frame.empty:
+                parts.append(frame.assign(res=res).rename_axis("bucket").reset_index())
+        if not parts:
+            return
+        table = pa.Table.from_pandas(pd.concat(parts, ignore_index=True), preserve_index=False)
+        tmp = self._path(day) + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self._path(day))
+
+    def load(self):
+        # Démarrage : relit les agrégats des jours terminés (quelques Ko par jour)
+        if not self.root or pa is None or not os.path.isdir(self.root):
+            return self
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".arrow"):
+                continue
+            day = name[:-len(".arrow")]
+            with pa.memory_map(self._path(day), "r") as src:
+                df = ipc.open_file(src).read_all().to_pandas()
+            self.days[day] = {res: g.drop(columns="res").set_index("bucket") for res, g in df.groupby("res")}
+            self.saved.add(day)
+        return self
+
+    def backfill(self, disk):
+        # Jours présents sur disque mais jamais agrégés (ex. premier démarrage avec cette version)
+        today = pd.Timestamp.now(tz=self.tz).strftime("%Y-%m-%d")
+        for day in disk.days():
+            if day < today and day not in self.saved:
+                self.rebuild_day(disk, day)
+
+    def rebuild_day(self, disk, day):
+        t0 = disk.day_start(day)
+        df = disk.read_range(t0, t0 + DAY_NS)
+        if not df.empty:
+            self.replace_day(day, df["ts"].to_numpy(), df)
+
+    def query(self, start, end, res, fields=None):
+        # start / end en heure locale (naïve) ; renvoie moyenne / min / max / nombre par seau
+        d0, d1 = pd.Timestamp(start).strftime("%Y-%m-%d"), pd.Timestamp(end).strftime("%Y-%m-%d")
+        with self.lock:
+            parts = [self.days[d][res] for d in sorted(self.days)
+                     if d0 <= d <= d1 and res in self.days[d] and not self.days[d][res].empty]
+        if not parts:
+            return pd.DataFrame()
+        agg = pd.concat(parts).sort_index()
+        t0, t1 = pd.Timestamp(start).value, pd.Timestamp(end).value
+        agg = agg[(agg.index >= t0) & (agg.index < t1)]
+
+        out = pd.DataFrame(index=agg.index)
+        for f in fields or FIELDS:
+            if f"{f}_count" not in agg.columns:
+                continue
+            n = agg[f"{f}_count"].to_numpy(dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[f"{f}_mean"] = agg[f"{f}_sum"].to_numpy() / np.where(n > 0, n, np.nan)
+            out[f"{f}_min"] = agg[f"{f}_min"]
+            out[f"{f}_max"] = agg[f"{f}_max"]
+            out[f"{f}_count"] = agg[f"{f}_count"]
+        out["date_local"] = pd.to_datetime(out.index.to_numpy(), unit="ns").tz_localize(
+            self.tz, ambiguous=False, nonexistent="shift_forward")
+        return out.reset_index(drop=True)
@@ -0,0 +1,194 @@
+# Schéma typé d'une mesure mesures_hvac et décodage colonne par colonne (LFRAH & IQBAL)
+# Les réponses de l'API vont directement dans des colonnes NumPy typées, sans passer par une liste
+# de dict Python puis l'inférence de types de pandas. Trois formats sont acceptés :
+#   - "json"    : liste d'objets, une mesure par objet (format d'origine de Node-RED)
+#   - "columns" : un objet avec une liste par colonne {"id": [...], "date": [...], ...}
+#   - "ndjson"  : une mesure JSON par ligne (lu par pyarrow s'il est installé), décodé au fil de la
+#                 réception par paquets de lignes : le corps complet n'est jamais gardé en mémoire
+
+import io
+import json
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+except ImportError:
+    pa = None
+    pa_json = None
+
+# Type de chaque champ d'une mesure. Un lot avec une valeur manquante ou hors plage garde la colonne
+# en flottant (NaN) plutôt que d'inventer une valeur.
+SCHEMA = {
+    "id": np.int64,
+    "temperature_lt": np.float32,
+    "humidite_lt": np.float32,
+    "gaz": np.uint16,
+    "motor_speed": np.uint8,
+    "alarme": np.bool_,
+}
+FORMATS = ("json", "columns", "ndjson")
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+STREAM_ROWS = 50_000        # lignes NDJSON décodées à la fois pendant la réception
+STREAM_CHUNK = 1 << 16      # octets lus sur la socket à chaque tour
+
+
+def loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def typed_column(name, values):
+    # Liste / tableau de valeurs brutes -> colonne NumPy au type du schéma
+    dt = SCHEMA.get(name)
+    if dt is None:
+        return np.asarray(values, dtype=object)
+    try:
+        # Nombres, None (-> NaN) et textes numériques ("22.5") en une seule passe C
+        v = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        v = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    return narrow(v, dt)
+
+
+def narrow(v, dt):
+    dt = np.dtype(dt)
+    if dt.kind == "f":
+        return v.astype(dt)
+    if len(v) == 0:
+        return v.astype(dt)
+    if np.isnan(v).any():
+        return v if dt == np.int64 else v.astype(np.float32)
+    if dt == np.bool_:
+        return v != 0
+    info = np.iinfo(dt)
+    if v.min() < info.min or v.max() > info.max:
+        return v.astype(np.float32)
+    return v.astype(dt)
+
+
+def typed_record(row):
+    # Dernière mesure (dict) : champs du schéma convertis en nombres Python, valeurs illisibles retirées
+    out = {}
+    for k, v in row.items():
+        dt = SCHEMA.get(k)
+        if dt is None:
+            out[k] = v
+            continue
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            continue
+        if f != f:
+            continue
+        out[k] = f if np.dtype(dt).kind == "f" else (bool(f) if dt == np.bool_ else int(f))
+    return out
+
+
+def parse_dates(values, tz="Europe/Brussels"):
+    # Texte "YYYY-MM-DD HH:MM:SS" (heure locale, comme MariaDB) ou ISO avec fuseau
+    # -> (date locale naïve datetime64, ts int64 ns UTC) ; une seule analyse du texte
+    d = pd.to_datetime(pd.Series(values), errors="coerce", format="ISO8601")
+    if d.dt.tz is None:
+        try:
+            aware = d.dt.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward")
+        except Exception:
+            # Petit lot pendant le changement d'heure : "infer" n'a pas assez de contexte
+            aware = d.dt.tz_localize(tz, ambiguous=False, nonexistent="shift_forward")
+    else:
+        aware = d.dt.tz_convert(tz)
+        d = aware.dt.tz_localize(None)
+    ts = aware.dt.tz_convert("UTC").dt.tz_localize(None).astype("datetime64[ns]").to_numpy().view(np.int64)
+    return d.astype("datetime64[ns]").to_numpy(), ts
+
+
+def frame_from_columns(cols, tz="Europe/Brussels"):
+    # {colonne: valeurs} -> DataFrame typé ; "date" devient datetime64 local et "ts" l'epoch UTC
+    if not cols:
+        return pd.DataFrame()
+    data = {}
+    for k, v in cols.items():
+        if k == "date":
+            data["date"], data["ts"] = parse_dates(v, tz)
+        else:
+            data[k] = typed_column(k, v)
+    return pd.DataFrame(data, copy=False)
+
+
+def _rows_to_columns(rows):
+    # Liste d'objets -> une liste par colonne (boucles en C : map / set.union)
+    keys = list(rows[0])
+    keys += sorted(set().union(*rows).difference(keys))
+    return {k: list(map(dict.get, rows, repeat(k))) for k in keys}
+
+
+def _ndjson(raw, tz):
+    if pa_json is not None:
+        # Lecteur NDJSON de pyarrow (C++, multithread) ; la date reste du texte, analysée ci-dessous
+        explicit = pa.schema([("date", pa.string())])
+        table = pa_json.read_json(io.BytesIO(raw), parse_options=pa_json.ParseOptions(explicit_schema=explicit))
+        return frame_from_columns({c: table.column(c).to_numpy(zero_copy_only=False) for c in table.column_names}, tz)
+    rows = [loads(line) for line in raw.splitlines() if line.strip()]
+    return frame_from_columns(_rows_to_columns(rows), tz)
+
+
+def is_ndjson(content_type):
+    return (content_type or "").split(";")[0].strip().lower() in NDJSON_TYPES
+
+
+def decode_lines(lines, tz="Europe/Brussels", rows=STREAM_ROWS):
+    # Lignes NDJSON (itérable de bytes) -> DataFrame typé, décodé par paquets de `rows` lignes
+    parts, batch = [], []
+    for line in lines:
+        if line.strip():
+            batch.append(line)
+        if len(batch) >= rows:
+            parts.append(_ndjson(b"\n".join(batch), tz))
+            batch = []
+    if batch:
+        parts.append(_ndjson(b"\n".join(batch), tz))
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+
+def decode(raw, content_type=None, tz="Europe/Brussels"):
+    # Corps HTTP (bytes) -> DataFrame typé, ou None si ce n'est pas une liste de mesures
+    if is_ndjson(content_type):
+        return _ndjson(raw, tz)
+    try:
+        data = loads(raw)
+    except ValueError:
+        # Plusieurs objets à la suite : du NDJSON envoyé sans le bon Content-Type
+        return _ndjson(raw, tz) if raw.lstrip()[:1] == b"{" else None
+    if isinstance(data, list):
+        return frame_from_columns(_rows_to_columns(data), tz) if data else pd.DataFrame()
+    if isinstance(data, dict) and data and all(isinstance(v, list) for v in data.values()):
+        return frame_from_columns(data, tz)
+    return None
+
+
+def decode_response(r, tz="Europe/Brussels"):
+    # Réponse requests (de préférence ouverte avec stream=True) -> (DataFrame ou None, octets reçus).
+    # NDJSON : lu ligne à ligne sur la socket ; autres formats : un seul document JSON, lu en entier
+    ctype = r.headers.get("Content-Type")
+    if is_ndjson(ctype):
+        recu = [0]
+
+        def lines():
+            for line in r.iter_lines(chunk_size=STREAM_CHUNK):
+                recu[0] += len(line) + 1
+                yield line
+
+        df = decode_lines(lines(), tz)
+        return df, recu[0]
+    raw = r.content
+    return decode(raw, ctype, tz), len(raw)
@@ -0,0 +1,137 @@
+# Jeux de données mesures_hvac synthétiques pour les benchmarks (LFRAH & IQBAL)
+# De 10 000 à 50 millions de lignes sans rien garder en mémoire : chaque bloc de lignes est
+# recalculé à la demande avec NumPy (graine fixe par bloc), donc deux runs voient les mêmes données.
+# SyntheticNodeRed sert ce jeu de données avec les mêmes routes que fake_nodered.py.
+
+import json
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from fake_nodered import DATE_FMT, FakeNodeRed, now_local
+
+BLOCK = 65536
+COLUMNS = ["id", "date", "mode", "temperature_lt", "humidite_lt", "gaz", "motor_speed", "alarme"]
+# Garde-fou côté serveur : jamais plus de lignes par réponse (comme une vraie API)
+MAX_ROWS_PER_RESPONSE = 2_000_000
+
+
+class SyntheticHistory:
+    def __init__(self, rows, interval=2.0, end=None, seed=0):
+        # rows mesures espacées de interval secondes, la dernière à end (heure locale naïve, comme MariaDB)
+        self.rows = int(rows)
+        self.interval_ms = max(int(round(float(interval) * 1000)), 1)
+        self.seed = int(seed)
+        end = pd.Timestamp(end if end is not None else now_local()).floor("s")
+        self.t0_ms = end.value // 10**6 - (self.rows - 1) * self.interval_ms
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def _block(self, b):
+        with self._lock:
+            cached = self._blocks.get(b)
+        if cached is not None:
+            return cached
+        rng = np.random.default_rng([self.seed, b])
+        i = np.arange(b * BLOCK, min((b + 1) * BLOCK, self.rows), dtype=np.int64)
+        t_ms = self.t0_ms + i * self.interval_ms
+        h = (t_ms // 1000 % 86400) / 3600
+        jour = np.sin((h - 9) / 24 * 2 * math.pi)
+        semaine = np.sin(t_ms / (7 * 86400e3) * 2 * math.pi)
+
+        temp = 22 + 3 * jour + 1.5 * semaine + rng.normal(0, 0.3, len(i))
+        hum = np.clip(50 - 8 * jour - 3 * semaine + rng.normal(0, 1.0, len(i)), 0, 100)
+        gaz = 450 + rng.normal(0, 40, len(i))
+        # Fuites de gaz : quelques épisodes de 5 à 60 mesures au-dessus du seuil
+        for s in np.flatnonzero(rng.random(len(i)) < 0.0005):
+            gaz[s:s + int(rng.integers(5, 60))] = rng.uniform(3000, 4095)
+        gaz = np.clip(gaz, 0, 4095).astype(np.int64)
+
+        confort = (h >= 7) & (h < 19)
+        speed = np.where(temp > 24, 200, 120)
+        speed = np.where(~confort & (h < 6), 0, speed)
+
+        out = {
+            "id": i + 1,
+            "t_ms": t_ms,
+            "mode": np.where(confort, "confort", "eco"),
+            "temperature_lt": np.round(temp, 1),
+            "humidite_lt": np.round(hum, 1),
+            "gaz": gaz,
+            "motor_speed": speed.astype(np.int64),
+            "alarme": (gaz > 3000).astype(np.int64),
+        }
+        with self._lock:
+            # Les 64 derniers blocs restent en mémoire (~4 M lignes) : les requêtes voisines sont gratuites
+            if len(self._blocks) >= 64:
+                self._blocks.pop(next(iter(self._blocks)))
+            self._blocks[b] = out
+        return out
+
+    def index_of(self, date):
+        # Première ligne dont la date est >= date
+        t = pd.Timestamp(date).value // 10**6
+        return int(min(max(-(-(t - self.t0_ms) // self.interval_ms), 0), self.rows))
+
+    def frame(self, a, b, fields=None):
+        # Lignes [a, b) au format de l'API (dates en texte)
+        a, b = max(int(a), 0), min(int(b), self.rows)
+        cols = [c for c in COLUMNS if not fields or c in fields or c in ("id", "date")]
+        if b <= a:
+            return pd.DataFrame(columns=cols)
+        parts = [self._block(k) for k in range(a // BLOCK, (b - 1) // BLOCK + 1)]
+        lo = a - (a // BLOCK) * BLOCK
+        data = {k: np.concatenate([p[k] for p in parts])[lo:lo + b - a] for k in parts[0]}
+        data["date"] = pd.to_datetime(data.pop("t_ms"), unit="ms").strftime(DATE_FMT)
+        return pd.DataFrame({c: data[c] for c in cols})
+
+    def latest(self):
+        row = self.frame(self.rows - 1, self.rows).iloc[0]
+        return {k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+
+
+class SyntheticNodeRed(FakeNodeRed):
+    # Même serveur que fake_nodered.py, mais /latest et /history lisent le jeu synthétique
+    def __init__(self, rows, interval=2.0, seed=0, delay=0.0, end=None):
+        super().__init__(history_hours=0, interval=interval, seed=seed, delay=delay)
+        self.data = SyntheticHistory(rows, interval, end=end, seed=seed)
+
+    def latest(self):
+        row = self.data.latest()
+        row.update(self.settings)
+        row["mute"] = self.mute
+        return row
+
+    def add_row(self):
+        # Jeu de données figé : le benchmark doit être reproductible
+        return None
+
+    def history_body(self, q):
+        data = self.data
+        a, b = 0, data.rows
+        if "since" in q:
+            try:
+                a = int(q["since"][0])
+            except ValueError:
+                return None
+        if "from" in q:
+            a = max(a, data.index_of(q["from"][0]))
+        if "to" in q:
+            b = min(b, data.index_of(q["to"][0]))
+        desc = q.get("order", ["asc"])[0] == "desc"
+        n = min(int(q["limit"][0]) if "limit" in q else MAX_ROWS_PER_RESPONSE, MAX_ROWS_PER_RESPONSE)
+        if b - a > n:
+            # Comme l'API : la limite garde toujours les lignes les plus récentes
+            a = b - n
+        fields = q["fields"][0].split(",") if "fields" in q else None
+        df = data.frame(a, b, fields)
+        if desc:
+            df = df.iloc[::-1]
+        fmt = q.get("format", ["json"])[0]
+        if fmt == "columns":
+            return json.dumps({c: df[c].tolist() for c in df.columns}).encode("utf-8")
+        if fmt == "ndjson":
+            return df.to_json(orient="records", lines=True).encode("utf-8")
+        return df.to_json(orient="records").encode("utf-8")
@@ -0,0 +1,88 @@
+# Tests du journal des commandes (LFRAH & IQBAL)
+
+import calendar
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import audit
+from audit import AuditLog
+
+
+def commande(key, created, status="envoyée", target="principal:cmd", **kw):
+    return SimpleNamespace(target=target, created=created, session="s", key=key, status=status,
+                           payload={"target_speed": 100}, expect={"motor_speed": 100}, http_status=200,
+                           latency=0.004, attempts=1, error=None, **kw)
+
+
+def horloge(monkeypatch, quand):
+    t = calendar.timegm(time.strptime(quand, "%Y-%m-%d %H:%M:%S"))
+    monkeypatch.setattr(audit.time, "time", lambda: t)
+    return t
+
+
+def test_ajout_seul(tmp_path):
+    log = AuditLog(str(tmp_path))
+    log.record(commande("a", time.time()))
+    db = sqlite3.connect(os.path.join(str(tmp_path), f"commandes-{audit.month_of(time.time() * 1000)}.sqlite"))
+    with pytest.raises(sqlite3.DatabaseError):
+        db.execute("DELETE FROM evenements")
+    with pytest.raises(sqlite3.DatabaseError):
+        db.execute("UPDATE evenements SET status = 'x'")
+    assert log.count() == 1
+
+
+def test_une_ligne_par_commande(tmp_path):
+    log = AuditLog(str(tmp_path))
+    t = time.time()
+    for status in ("en file", "envoi", "envoyée", "appliquée"):
+        log.record(commande("a", t), status)
+    log.record(commande("b", t + 1, target="annexe:salle"), "en file")
+    assert log.count() == 5
+    (a,) = log.query(device="principal")
+    assert a["status"] == "appliquée" and a["target"] == "cmd" and a["events"] == 4
+    assert a["ts"] == int(t * 1000)
+    assert [c["key"] for c in log.query()] == ["b", "a"]
+    # Filtre sur l'heure du clic
+    assert log.query(start_ms=int(t * 1000) + 500) == log.query(device="annexe")
+
+
+def test_changement_de_mois_compacte_l_archive(tmp_path, monkeypatch):
+    log = AuditLog(str(tmp_path))
+    t = horloge(monkeypatch, "2026-01-31 23:59:00")
+    log.record(commande("a", t), "en file")
+    log.record(commande("a", t), "envoi")
+    assert os.path.exists(tmp_path / "commandes-2026-01.sqlite-wal")
+    horloge(monkeypatch, "2026-02-01 00:00:05")
+    log.record(commande("a", t), "envoyée")
+    # Janvier : plus de WAL, fichier réécrit ; l'évènement de février va dans le nouveau fichier
+    assert not os.path.exists(tmp_path / "commandes-2026-01.sqlite-wal")
+    assert not log._in_wal("2026-01") and log._in_wal("2026-02")
+    assert log.months() == ["2026-01", "2026-02"]
+    (a,) = log.query(start_ms=int(t * 1000) - 1000, end_ms=int(t * 1000) + 1000)
+    assert a["status"] == "envoyée" and a["events"] == 3
+
+
+def test_retention(tmp_path, monkeypatch):
+    log = AuditLog(str(tmp_path), keep_months=2)
+    for mois in ("2026-01", "2026-02", "2026-03", "2026-04"):
+        t = horloge(monkeypatch, f"{mois}-15 12:00:00")
+        log.record(commande(mois, t))
+    assert log.months() == ["2026-03", "2026-04"]
+    assert [c["key"] for c in log.query()] == ["2026-04", "2026-03"]
+
+
+def test_redemarrage_compacte_les_mois_passes(tmp_path, monkeypatch):
+    t = horloge(monkeypatch, "2026-01-20 10:00:00")
+    avant = AuditLog(str(tmp_path))
+    avant.record(commande("a", t))
+    avant.close()           # process arrêté sans changement de mois : janvier reste en WAL
+    assert avant._in_wal("2026-01")
+    horloge(monkeypatch, "2026-03-01 10:00:00")
+    log = AuditLog(str(tmp_path))
+    assert not log._in_wal("2026-01")
+    assert not os.path.exists(tmp_path / "commandes-2026-01.sqlite-wal")
+    assert log.count() == 1
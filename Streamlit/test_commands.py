@@ -0,0 +1,163 @@
+# Tests de la file de commandes et de son journal (LFRAH & IQBAL)
+
+import threading
+import time
+
+import pytest
+
+from audit import AuditLog
+from commands import APPLIQUEE, ECHEC, EN_FILE, ENVOI, ENVOYEE, NON_CONFIRMEE, REMPLACEE, Command, CommandQueue
+
+
+class Reponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            err = RuntimeError(f"HTTP {self.status_code}")
+            err.response = self
+            raise err
+
+
+class FauxNodeRed:
+    # Session requests minimale : codes HTTP rejoués dans l'ordre, POST bloqués tant que `porte` est fermée
+    def __init__(self, codes=()):
+        self.codes = list(codes)
+        self.posts = []
+        self.porte = threading.Event()
+        self.porte.set()
+
+    def post(self, url, json=None, timeout=None, headers=None):
+        self.porte.wait(5)
+        self.posts.append(json)
+        return Reponse(self.codes.pop(0) if self.codes else 200)
+
+
+def attendre(cond, timeout=5.0):
+    fin = time.time() + timeout
+    while time.time() < fin:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return AuditLog(str(tmp_path / "audit"))
+
+
+def file_avec(journal, node, **kw):
+    q = CommandQueue(node, backoff=0.0, **kw)
+    q.on_change.append(journal.record)
+    return q
+
+
+def etats(journal, cmd):
+    return [e["status"] for e in journal.events() if e["key"] == cmd.key]
+
+
+def test_envoi_puis_confirmation(journal):
+    q = file_avec(journal, FauxNodeRed())
+    cmd = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 150}, expect={"motor_speed": 150},
+                   baseline=1, session="s1")
+    assert attendre(lambda: cmd.status == ENVOYEE)
+    q.observe({"id": 1, "motor_speed": 150})
+    assert cmd.status == ENVOYEE            # même mesure qu'au clic : pas encore une confirmation
+    q.observe({"id": 2, "motor_speed": 150})
+    assert cmd.status == APPLIQUEE
+    assert etats(journal, cmd) == [EN_FILE, ENVOI, ENVOYEE, APPLIQUEE]
+    (ligne,) = journal.query(device="principal")
+    assert ligne["status"] == APPLIQUEE and ligne["session"] == "s1" and ligne["http_status"] == 200
+    assert ligne["sent_at"] is not None and ligne["applied_at"] >= ligne["sent_at"]
+
+
+def test_commande_envoyee_puis_remplacee_reste_dans_le_journal(journal):
+    q = file_avec(journal, FauxNodeRed())
+    c100 = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 100}, expect={"motor_speed": 100}, baseline=1)
+    assert attendre(lambda: c100.status == ENVOYEE)
+    c150 = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 150}, expect={"motor_speed": 150}, baseline=1)
+    assert attendre(lambda: c150.status == ENVOYEE)
+    q.observe({"id": 2, "motor_speed": 150})
+    assert c150.status == APPLIQUEE and c100.status == REMPLACEE
+    assert etats(journal, c100) == [EN_FILE, ENVOI, ENVOYEE, REMPLACEE]
+    assert [c["payload"]["target_speed"] for c in journal.query()] == [150, 100]
+
+
+def test_commande_en_file_remplacee_avant_envoi(journal):
+    node = FauxNodeRed()
+    node.porte.clear()
+    q = file_avec(journal, node)
+    c1 = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 10})
+    assert attendre(lambda: c1.status == ENVOI)
+    c2 = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 20})
+    c3 = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 30})
+    node.porte.set()
+    assert attendre(lambda: c3.status == APPLIQUEE)
+    assert c2.status == REMPLACEE
+    assert etats(journal, c2) == [EN_FILE, REMPLACEE]
+    assert [p["target_speed"] for p in node.posts] == [10, 30]
+
+
+def test_essais_et_echec(journal):
+    q = file_avec(journal, FauxNodeRed([503, 200]))
+    ok = q.submit("principal:salle", "http://x/salle", {"brightness": 80})
+    assert attendre(lambda: ok.status == APPLIQUEE)
+    assert ok.attempts == 2
+    essais = [e for e in journal.events() if e["key"] == ok.key]
+    assert [e["status"] for e in essais] == [EN_FILE, ENVOI, ENVOI, ENVOYEE, APPLIQUEE]
+    assert essais[2]["http_status"] == 503 and essais[2]["error"] == "HTTP 503"
+
+    q2 = file_avec(journal, FauxNodeRed([422]))
+    refus = q2.submit("principal:salle", "http://x/salle", {"brightness": 999})
+    assert attendre(lambda: refus.status == ECHEC)
+    assert refus.attempts == 1                   # 4xx : pas de nouvel essai
+    assert journal.query(device="principal")[0]["status"] == ECHEC
+
+
+def test_double_clic_et_non_confirmee(journal):
+    q = file_avec(journal, FauxNodeRed(), ack_timeout=0.0)
+    a = q.submit("principal:cmd", "http://x/cmd", {"mute": 1}, expect={"mute": 1}, baseline=1)
+    assert q.submit("principal:cmd", "http://x/cmd", {"mute": 1}, expect={"mute": 1}, baseline=1) is a
+    assert attendre(lambda: a.status == ENVOYEE)
+    q.observe({"id": 1})
+    q.observe({"id": 1})
+    assert a.status == NON_CONFIRMEE
+    # Un seul état final même si deux sessions relisent la même mesure
+    assert etats(journal, a).count(NON_CONFIRMEE) == 1
+
+
+def test_observe_pendant_le_post(journal):
+    # Une session relit la mesure pendant que le POST est encore ouvert : pas de TypeError sur sent_at
+    node = FauxNodeRed()
+    node.porte.clear()
+    q = file_avec(journal, node)
+    cmd = q.submit("principal:cmd", "http://x/cmd", {"target_speed": 150}, expect={"motor_speed": 150}, baseline=1)
+    assert attendre(lambda: cmd.status == ENVOI)
+    erreurs, fini = [], threading.Event()
+
+    def relectures():
+        while not fini.is_set():
+            try:
+                q.observe({"id": 1, "motor_speed": 150})
+            except Exception as e:
+                erreurs.append(e)
+
+    t = threading.Thread(target=relectures)
+    t.start()
+    node.porte.set()
+    assert attendre(lambda: cmd.status == ENVOYEE)
+    fini.set()
+    t.join()
+    assert erreurs == [] and cmd.sent_at is not None
+    q.observe({"id": 2, "motor_speed": 150})
+    assert cmd.status == APPLIQUEE
+
+
+def test_observe_ignore_une_commande_sans_heure_d_envoi():
+    q = CommandQueue(FauxNodeRed(), ack_timeout=0.0)
+    cmd = Command("principal:cmd", "http://x/cmd", {"mute": 1}, {"mute": 1}, baseline=1, status=ENVOYEE)
+    q.history.append(cmd)
+    q.observe({"id": 1})
+    assert cmd.status == ENVOYEE
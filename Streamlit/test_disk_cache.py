@@ -0,0 +1,120 @@
+# Tests du cache disque par jour (LFRAH & IQBAL)
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from disk_cache import DiskCache
+
+S = 10**9
+TZ = "Europe/Brussels"
+
+
+def lot(debut, n, id0):
+    # n mesures à 1 s à partir de debut (heure locale), ids consécutifs à partir de id0
+    t0 = pd.Timestamp(debut).tz_localize(TZ).value
+    ts = t0 + np.arange(n, dtype=np.int64) * S
+    return ts, pd.DataFrame({"id": np.arange(id0, id0 + n), "temperature_lt": np.arange(n, dtype=float),
+                             "mode": ["eco"] * n})
+
+
+def test_ajouts_relus_dans_l_ordre(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    for k in range(5):
+        ts, df = lot(f"2026-03-10 10:00:{k * 10:02d}", 10, k * 10)
+        disk.write(ts, df)
+    assert os.path.exists(tmp_path / "2026-03-10.tail.arrows")
+    out = disk.read_range()
+    assert out["id"].tolist() == list(range(50))
+    assert disk.last_id() == 49
+    assert disk.last_ts() == out["ts"].iloc[-1]
+
+
+def test_lot_deja_ecrit_ignore(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    ts, df = lot("2026-03-10 10:00:00", 10, 0)
+    disk.write(ts, df)
+    disk.write(ts[5:], df.iloc[5:].reset_index(drop=True))
+    assert len(disk.read_range()) == 10
+
+
+def test_changement_de_jour_fusionne_le_segment(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 23:59:50", 5, 0))
+    disk.write(*lot("2026-03-11 00:00:10", 5, 5))
+    assert not os.path.exists(tmp_path / "2026-03-10.tail.arrows")
+    assert os.path.exists(tmp_path / "2026-03-10.arrow")
+    assert disk.days() == ["2026-03-10", "2026-03-11"]
+    assert len(disk.read_range(t0=disk.day_start("2026-03-11"))) == 5
+
+
+def test_redemarrage_fusionne_les_segments(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    disk.write(*lot("2026-03-10 10:00:10", 10, 10))
+    # Arrêt brutal : le writer n'est pas fermé ; un nouveau process relit tout
+    disk2 = DiskCache(str(tmp_path))
+    assert not os.path.exists(tmp_path / "2026-03-10.tail.arrows")
+    assert disk2.read_range()["id"].tolist() == list(range(20))
+    disk2.write(*lot("2026-03-10 10:00:20", 5, 20))
+    assert disk2.read_range()["id"].tolist() == list(range(25))
+
+
+def test_segment_coupe_lisible(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    disk.write(*lot("2026-03-10 10:00:10", 10, 10))
+    path = tmp_path / "2026-03-10.tail.arrows"
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 16)
+    # Le dernier lot, incomplet, est perdu ; le premier reste lisible
+    assert DiskCache(str(tmp_path)).read_range()["id"].tolist() == list(range(10))
+
+
+def test_rechargement_fusionne_sans_doublons(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    ts, df = lot("2026-03-10 10:00:05", 10, 5)
+    disk.write(ts, df, covered_from=int(ts[0]))
+    assert disk.read_range()["id"].tolist() == list(range(15))
+    assert disk.covers(int(ts[0]), int(ts[-1]))
+
+
+def test_invalidate_tail(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    assert disk.invalidate_tail() == "2026-03-10"
+    assert disk.read_range().empty
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    assert len(disk.read_range()) == 10
+
+
+
+def test_lecture_pendant_la_fusion_du_segment(tmp_path, monkeypatch):
+    # Le poller passe au jour suivant (fusion + suppression du segment de la veille) au moment
+    # où une page vient de trouver ce segment : la page doit quand même relire toutes les lignes
+    import threading
+
+    import disk_cache
+
+    disk = DiskCache(str(tmp_path))
+    disk.write(*lot("2026-03-10 10:00:00", 10, 0))
+    exists, poller = os.path.exists, []
+
+    def exists_puis_changement_de_jour(path):
+        found = exists(path)
+        if path.endswith("2026-03-10.tail.arrows") and not poller:
+            poller.append(threading.Thread(target=disk.write, args=lot("2026-03-11 10:00:00", 10, 10)))
+            poller[0].start()
+            poller[0].join(0.3)
+        return found
+
+    monkeypatch.setattr(disk_cache.os.path, "exists", exists_puis_changement_de_jour)
+    out = disk.read_range()
+    poller[0].join()
+    assert out["id"].tolist() == list(range(10))
+    assert disk.read_range()["id"].tolist() == list(range(20))
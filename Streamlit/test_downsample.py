@@ -0,0 +1,84 @@
+# Tests du sous-échantillonnage des graphes (LFRAH & IQBAL)
+
+import numpy as np
+import pandas as pd
+
+from downsample import bucket_ns, downsample, lttb_indices, minmax_indices
+
+S = 10**9
+
+
+def serie(n=10_000, trou=(4000, 4500)):
+    t = np.arange(n, dtype=np.int64) * S
+    y = 20 + np.sin(np.arange(n) / 200.0)
+    y[trou[0]:trou[1]] = np.nan
+    return t, y
+
+
+def test_lttb_bornes_et_taille():
+    t, y = serie(trou=(0, 0))
+    idx = lttb_indices(t, y, 500)
+    assert 400 < len(idx) <= 502
+    assert idx[0] == 0 and idx[-1] == len(t) - 1
+    assert (np.diff(idx) > 0).all()
+
+
+def test_lttb_trou_sans_fausse_chute():
+    t, y = serie()
+    idx = lttb_indices(t, y, 500)
+    v = y[idx]
+    # Aucun point inventé à 0 : les points gardés sont soit de vraies valeurs, soit le trou (NaN)
+    assert np.nanmin(v) > 18
+    assert np.isnan(v).any()
+
+
+def test_lttb_seau_partiel_garde_la_vraie_valeur():
+    # Seau à moitié vide : le NaN ne doit pas passer pour le point le plus "significatif"
+    n = 1000
+    t = np.arange(n, dtype=np.int64) * S
+    y = np.full(n, 20.0)
+    y[500:505] = np.nan
+    y[507] = 21.0
+    idx = lttb_indices(t, y, 100)
+    assert 507 in idx
+    assert not np.isnan(y[idx[(idx > 0) & (idx < n - 1)]]).any()
+
+
+def test_lttb_petite_serie_intacte():
+    t, y = serie(n=10, trou=(3, 5))
+    assert lttb_indices(t, y, 100).tolist() == list(range(10))
+
+
+def test_minmax_garde_extremes():
+    t, y = serie(trou=(0, 0))
+    y[1234] = 99.0
+    idx = minmax_indices(t, y, 100)
+    assert 1234 in idx and 0 in idx and len(t) - 1 in idx
+
+
+def test_downsample_garde_trous_et_fronts_alarme():
+    t, y = serie()
+    alarme = np.zeros(len(t))
+    alarme[7000:7001] = 1
+    df = pd.DataFrame({"date_local": pd.to_datetime(t, unit="ns", utc=True), "temperature_lt": y,
+                       "alarme": alarme})
+    for mode in ("lttb", "minmax"):
+        d = downsample(df, "date_local", "temperature_lt", mode=mode, width_px=200)
+        assert len(d) < len(df)
+        assert d["temperature_lt"].isna().any()
+        assert np.nanmin(d["temperature_lt"]) > 18
+        assert {6999, 7000, 7001} <= set(d.index)
+
+
+def test_lttb_memes_seaux_que_minmax():
+    # Cadence irrégulière : 1 mesure / s pendant 1000 s, puis 1 mesure / 10 s pendant 9000 s
+    t = np.r_[np.arange(1000), 1000 + np.arange(900) * 10].astype(np.int64) * S
+    y = np.sin(np.arange(len(t)) / 7.0)
+    step = bucket_ns(t[0], t[-1], 200)
+    seau = (t - t[0]) // step
+    idx = lttb_indices(t, y, 200)
+    # Un point par seau de temps non vide, comme minmax : la partie dense n'est pas sur-représentée
+    assert sorted(set(seau[idx[1:-1]])) == sorted(set(seau[1:-1]))
+    assert len(idx) == len(set(seau[1:-1])) + 2
+    assert set(seau[minmax_indices(t, y, 200)]) == set(seau)
+    assert (seau[idx] < 1000 * S // step + 1).sum() < len(idx) // 5
@@ -0,0 +1,74 @@
+# Tests de l'intégration marche / énergie du moteur (LFRAH & IQBAL)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from energy import MotorStats, integrate
+
+S = 10**9
+TZ = "Europe/Brussels"
+
+
+def cycles(debut, jours, periode_s=3600, pas_s=10):
+    # Moteur en marche la première moitié de chaque heure, arrêté la seconde : 24 démarrages par jour
+    t0 = pd.Timestamp(debut).tz_localize(TZ).value
+    n = jours * 86400 // pas_s
+    ts = t0 + np.arange(n, dtype=np.int64) * pas_s * S
+    phase = (np.arange(n) * pas_s) % periode_s
+    return ts, np.where(phase < periode_s // 2, 128.0, 0.0)
+
+
+def test_integrate_plusieurs_jours():
+    ts, speed = cycles("2026-03-10", 3)
+    days, _, _ = integrate(ts, speed, max_gap_ns=60 * S, tz=TZ)
+    # Premier démarrage du 10 : c'est la 1re mesure, pas de transition ; ceux de minuit comptent le lendemain
+    assert [days[d]["starts"] for d in sorted(days)] == [23, 24, 24]
+    assert [days[d]["stops"] for d in sorted(days)] == [24, 24, 24]
+    for d in days.values():
+        assert d["hist"][128] == pytest.approx(12 * 3600, abs=20)
+
+
+def test_demarrage_sur_la_derniere_mesure():
+    # Arrêt jusqu'à 23:59:50, démarrage sur la mesure de minuit (dernière du lot)
+    t0 = pd.Timestamp("2026-03-10 23:59:30").tz_localize(TZ).value
+    ts = t0 + np.arange(4, dtype=np.int64) * 10 * S
+    days, _, _ = integrate(ts, np.array([0.0, 0.0, 0.0, 200.0]), max_gap_ns=60 * S, tz=TZ)
+    assert days["2026-03-10"]["starts"] == 0
+    assert days["2026-03-11"]["starts"] == 1
+
+
+class FauxDisque:
+    def __init__(self, ts, speed):
+        self.df = pd.DataFrame({"ts": ts, "motor_speed": speed})
+
+    def day_start(self, day):
+        return pd.Timestamp(day).tz_localize(TZ).value
+
+    def days(self):
+        return sorted(pd.to_datetime(self.df["ts"], utc=True).dt.tz_convert(TZ).dt.strftime("%Y-%m-%d").unique())
+
+    def read_range(self, t0, t1):
+        ts = self.df["ts"].to_numpy()
+        return self.df[(ts >= t0) & (ts < t1)].reset_index(drop=True)
+
+
+def test_backfill_compte_les_transitions_de_minuit():
+    ts, speed = cycles("2026-03-10", 3)
+    stats = MotorStats(tz=TZ)
+    stats.backfill(FauxDisque(ts, speed))
+    q = stats.query("2026-03-10", "2026-03-13")
+    assert q["demarrages"].tolist() == [23, 24, 24]
+    assert q["marche_h"].round(2).tolist() == [12.0, 12.0, 12.0]
+
+
+def test_ajouts_incrementaux_identiques_au_lot_complet():
+    ts, speed = cycles("2026-03-10", 2)
+    stats = MotorStats(tz=TZ)
+    df = pd.DataFrame({"motor_speed": speed})
+    for k in range(0, len(ts), 997):
+        stats.add(ts[k:k + 997], df.iloc[k:k + 997])
+    days, _, _ = integrate(ts, speed, max_gap_ns=60 * S, tz=TZ)
+    for day, s in days.items():
+        assert stats.days[day]["starts"] == s["starts"]
+        np.testing.assert_allclose(stats.days[day]["hist"], s["hist"])
@@ -0,0 +1,124 @@
+# Tests du mode MQTT avec un faux client paho (sans broker) (LFRAH & IQBAL)
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from mqtt_live import MqttLive, parse_value
+
+
+class FauxClient:
+    # Même interface que paho.mqtt.client.Client pour ce qu'utilise MqttLive
+    def __init__(self):
+        self.subscriptions = []
+        self.auth = None
+        self.connect_args = None
+        self.looping = False
+
+    def username_pw_set(self, username, password):
+        self.auth = (username, password)
+
+    def connect_async(self, host, port, keepalive=60):
+        self.connect_args = (host, port, keepalive)
+
+    def loop_start(self):
+        self.looping = True
+
+    def subscribe(self, topic):
+        self.subscriptions.append(topic)
+
+    # Évènements normalement déclenchés par le thread réseau de paho
+    def connecte(self):
+        self.on_connect(self, None, {}, 0, None)
+
+    def coupe(self):
+        self.on_disconnect(self, None, {}, 7, None)
+
+    def recoit(self, topic, payload):
+        self.on_message(self, None, SimpleNamespace(topic=topic, payload=payload))
+
+
+@pytest.fixture
+def live():
+    client = FauxClient()
+    m = MqttLive("broker.local", 1884, topics=("hvac/salle/#", "hvac/lt/#"), username="u", password="p",
+                 client=client).start()
+    return m, client
+
+
+def test_demarrage(live):
+    m, client = live
+    assert client.connect_args == ("broker.local", 1884, 30)
+    assert client.looping and client.auth == ("u", "p")
+    assert not m.connected and m.latest() is None
+
+
+def test_messages_publies_dans_latest(live):
+    m, client = live
+    client.connecte()
+    assert m.connected and client.subscriptions == ["hvac/salle/#", "hvac/lt/#"]
+    client.recoit("hvac/lt", b'{"temperature_lt": 22.5, "humidite_lt": 48, "date": "2026-03-10 10:00:00"}')
+    client.recoit("hvac/lt/gaz", b"812")
+    snap = m.latest()
+    assert snap["temperature_lt"] == 22.5 and snap["gaz"] == 812
+    # Heure de réception : le message "gaz" n'avait pas de date
+    assert snap["date"] != "2026-03-10 10:00:00"
+    # Instantané figé : les messages suivants ne le modifient pas
+    client.recoit("hvac/lt/gaz", b"900")
+    assert snap["gaz"] == 812 and m.latest()["gaz"] == 900
+    with pytest.raises(TypeError):
+        snap["gaz"] = 0
+
+
+def test_reconnexion_reabonne(live):
+    m, client = live
+    client.connecte()
+    client.recoit("hvac/salle/mode", b"eco")
+    client.coupe()
+    assert not m.connected
+    # Les dernières valeurs restent servies jusqu'à stale_seconds
+    assert m.latest()["mode"] == "eco"
+    client.connecte()
+    assert m.connected
+    assert client.subscriptions == ["hvac/salle/#", "hvac/lt/#"] * 2
+    client.recoit("hvac/salle/mode", b"confort")
+    assert m.latest()["mode"] == "confort"
+
+
+def test_valeurs_perimees(live):
+    m, client = live
+    client.connecte()
+    client.recoit("hvac/lt/gaz", b"812")
+    m.updated_at = time.time() - m.stale_seconds - 1
+    assert m.latest() is None
+
+
+def test_valeurs_texte_typees_comme_en_http(live):
+    m, client = live
+    client.connecte()
+    client.recoit("hvac/lt", b'{"temperature_lt": "22.5 ", "gaz": "812", "alarme": "1", "mode": "eco"}')
+    client.recoit("hvac/lt/motor_speed", b'"128"')
+    client.recoit("hvac/lt/humidite_lt", b"n/a")
+    snap = m.latest()
+    assert snap["temperature_lt"] == 22.5 and isinstance(snap["temperature_lt"], float)
+    assert snap["gaz"] == 812 and isinstance(snap["gaz"], int)
+    assert snap["motor_speed"] == 128 and snap["alarme"] is True
+    assert snap["mode"] == "eco"
+    # Valeur illisible retirée, comme pour une réponse HTTP
+    assert "humidite_lt" not in snap
+
+
+def test_renommage_de_l_appareil():
+    client = FauxClient()
+    m = MqttLive("broker.local", client=client, rename={"temp": "temperature_lt"}).start()
+    client.connecte()
+    client.recoit("annexe/temp", b"19.5")
+    assert m.latest()["temperature_lt"] == 19.5
+
+
+def test_parse_value():
+    assert parse_value(b"22.5") == 22.5
+    assert parse_value(b" eco \n") == "eco"
+    assert parse_value(b'{"a": 1}') == {"a": 1}
+    assert parse_value(b"\xff") == "�"
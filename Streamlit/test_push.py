@@ -0,0 +1,30 @@
+# Tests du suivi des versions poussées par le flux SSE (LFRAH & IQBAL)
+
+from push import version_moved
+
+
+def veilleur(state, versions):
+    # Un tour par seconde du fragment veilleur : on note quand il relance les cartes + jauges
+    rendus = []
+    for v in versions:
+        if version_moved(state, "version_vue", v):
+            rendus.append(v)
+    return rendus
+
+
+def test_instantane_inchange_pas_de_rendu():
+    # La page complète vient d'afficher la version 3
+    state = {"version_vue": 3}
+    assert veilleur(state, [3, 3, 3, 3]) == []
+    assert state["version_vue"] == 3
+
+
+def test_un_rendu_par_nouvelle_version():
+    state = {"version_vue": 3}
+    assert veilleur(state, [3, 4, 4, 4, 6, 6]) == [4, 6]
+    assert veilleur(state, [6, 6]) == []
+
+
+def test_premiere_visite():
+    state = {}
+    assert veilleur(state, [0, 0]) == [0]
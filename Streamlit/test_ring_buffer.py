@@ -0,0 +1,75 @@
+# Tests du buffer circulaire (LFRAH & IQBAL)
+
+import numpy as np
+import pandas as pd
+
+from ring_buffer import RingBuffer
+
+S = 10**9
+
+
+def lot(ts, temp, mode="eco"):
+    return np.asarray(ts, dtype=np.int64) * S, pd.DataFrame({
+        "id": np.arange(len(ts)), "temperature_lt": temp, "mode": [mode] * len(ts)})
+
+
+def test_fenetre_et_debordement():
+    rb = RingBuffer(8)
+    for k in range(3):
+        ts, df = lot(range(k * 5, k * 5 + 5), np.arange(k * 5, k * 5 + 5, dtype=float))
+        rb.extend_ts(ts, df)
+    assert rb.size == 8
+    assert rb.bounds() == (7 * S, 14 * S)
+    f = rb.frame(t0=9 * S, t1=12 * S)
+    assert f["temperature_lt"].tolist() == [9.0, 10.0, 11.0]
+    assert f["mode"].astype(str).tolist() == ["eco"] * 3
+
+
+def test_lot_desordonne_trie():
+    rb = RingBuffer(8)
+    ts, df = lot([3, 1, 2], [3.0, 1.0, 2.0])
+    rb.extend_ts(ts, df)
+    assert rb.frame()["temperature_lt"].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_ligne_en_retard_ignoree():
+    rb = RingBuffer(16)
+    rb.extend_ts(*lot([10, 11, 12], [10.0, 11.0, 12.0]))
+    # 5 est plus ancien que la dernière ligne gardée : l'ordre du buffer doit rester croissant
+    assert rb.extend_ts(*lot([5, 13], [5.0, 13.0])) == 1
+    ts, _, _ = rb.window()
+    assert (np.diff(ts) >= 0).all()
+    assert rb.frame(t0=11 * S, t1=13 * S)["temperature_lt"].tolist() == [11.0, 12.0]
+
+
+def test_fenetre_independante_des_ecritures():
+    rb = RingBuffer(4)
+    rb.extend_ts(*lot([0, 1, 2, 3], [0.0, 1.0, 2.0, 3.0]))
+    f = rb.frame()
+    # Le poller écrase toutes les cases pendant que la page dessine encore f
+    rb.extend_ts(*lot([4, 5, 6, 7], [40.0, 50.0, 60.0, 70.0]))
+    assert f["temperature_lt"].tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert (f["date_local"].dt.second.tolist()) == [0, 1, 2, 3]
+
+
+def test_lignes_sans_date_ignorees():
+    rb = RingBuffer(4)
+    ts, df = lot([1, 2], [1.0, 2.0])
+    ts[0] = np.iinfo(np.int64).min
+    assert rb.extend_ts(ts, df) == 1
+    assert rb.frame()["temperature_lt"].tolist() == [2.0]
+
+
+def test_codage_des_modes():
+    rb = RingBuffer(16)
+    ts, df = lot(range(6), np.zeros(6))
+    df["mode"] = ["eco", None, "confort", np.nan, "eco", 1]
+    rb.extend_ts(ts, df)
+    ts, df = lot(range(6, 9), np.zeros(3))
+    df["mode"] = ["confort", "1", "hors-gel"]
+    rb.extend_ts(ts, df)
+    assert rb.labels["mode"] == ["eco", "confort", "1", "hors-gel"]
+    assert rb.codes["mode"][:9].tolist() == [0, -1, 1, -1, 0, 2, 1, 2, 3]
+    f = rb.frame()
+    assert f["mode"].isna().sum() == 2
+    assert f["mode"].dropna().astype(str).tolist() == ["eco", "confort", "eco", "1", "confort", "1", "hors-gel"]